@@ -1,8 +1,11 @@
 import csv
+import hashlib
 import os
 import sys
 from typing import List
 
+import numpy as np
+
 from flee.SimulationSettings import SimulationSettings
 
 if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
@@ -28,6 +31,28 @@ class InputGeography:
         self.major_routes = []
         self.conflicts = {}
         self.attributes = {}
+        # Location changes and conflict transitions by day, compiled when first needed.
+        self.location_change_schedule = None
+        self.conflict_schedule = None
+        # Input files read so far (see SaveCompiledGeography).
+        self.source_files = []
+
+
+    @check_args_type
+    def _AddSourceFile(self, csv_name: str) -> None:
+        """
+        Summary:
+            Records an input file, so that a compiled geography that includes it
+            becomes invalid when the file changes.
+
+        Args:
+            csv_name (str): csv file name
+
+        Returns:
+            None.
+        """
+        if csv_name not in self.source_files:
+            self.source_files.append(csv_name)
 
 
     @check_args_type
@@ -42,6 +67,8 @@ class InputGeography:
             None.
         """
         self.conflicts = {}
+        self.conflict_schedule = None
+        self._AddSourceFile(csv_name)
 
         row_count = 0
         headers = []
@@ -163,6 +190,8 @@ class InputGeography:
                     self.ReadConflictInputCSV(SimulationSettings.ConflictInputFile)
 
         self.locations = []
+        self.conflict_schedule = None
+        self._AddSourceFile(csv_name)
 
         c = {}  # column map
 
@@ -274,6 +303,7 @@ class InputGeography:
         
         if not os.path.isfile(csv_name):
             return
+        self._AddSourceFile(csv_name)
 
         with open(csv_name, newline="", encoding="utf-8") as csvfile:
             values = csv.reader(csvfile)
@@ -296,6 +326,7 @@ class InputGeography:
             None.
         """
         self.links = []
+        self._AddSourceFile(csv_name)
 
         with open(csv_name, newline="", encoding="utf-8") as csvfile:
             values = csv.reader(csvfile)
@@ -329,6 +360,7 @@ class InputGeography:
             None.
         """
         self.closures = []
+        self._AddSourceFile(csv_name)
 
         with open(csv_name, newline="", encoding="utf-8") as csvfile:
             values = csv.reader(csvfile)
@@ -355,6 +387,7 @@ class InputGeography:
             None.
         """
         self.location_changes = []
+        self.location_change_schedule = None
 
         if not os.path.isfile(csv_name):
             return 
@@ -372,6 +405,130 @@ class InputGeography:
         return
 
 
+    # Increase when the contents of the compiled geography change.
+    compiled_geography_version = 1
+
+    @check_args_type
+    def _CompiledGeographyKey(self, source_files: List[str]) -> str:
+        """
+        Summary:
+            Returns a hash of the names and contents of the input files.
+
+        Args:
+            source_files (List[str]): input file names
+
+        Returns:
+            str: hexadecimal hash, or an empty string if a file does not exist.
+        """
+        key = hashlib.sha1()
+        for name in source_files:
+            if not os.path.isfile(name):
+                return ""
+            with open(name, "rb") as f:
+                key.update(repr((os.path.abspath(name), hashlib.sha1(f.read()).hexdigest())).encode("utf-8"))
+        return key.hexdigest()
+
+
+    @check_args_type
+    def SaveCompiledGeography(self, file_name: str) -> None:
+        """
+        Summary:
+            Writes the input geography that has been read so far (locations, links,
+            major routes, closures and conflicts) to a binary .npz file, which
+            LoadCompiledGeography can read instead of the CSV files. Every table is
+            stored as one array of cells and an array of row lengths.
+            The file is tied to the contents of the input files and of the
+            simulation settings file, and becomes invalid when one of them changes.
+
+        Args:
+            file_name (str): name of the compiled geography file. Nothing is written if it is empty.
+
+        Returns:
+            None.
+        """
+        if len(file_name) == 0:
+            return
+
+        if len(self.attributes) > 0 or hasattr(self, "hurricane_data"):
+            print("Warning: the geography is not compiled, because attribute input files are used.", file=sys.stderr)
+            return
+
+        source_files = list(self.source_files)
+        if len(SimulationSettings.SettingsFile) > 0:
+            source_files.append(SimulationSettings.SettingsFile)
+
+        arrays = {
+            "version": np.array(InputGeography.compiled_geography_version),
+            "source_files": np.array(source_files, dtype=str),
+            "key": np.array(self._CompiledGeographyKey(source_files)),
+            "conflict_names": np.array(list(self.conflicts.keys()), dtype=str),
+            "conflict_lengths": np.array([len(v) for v in self.conflicts.values()], dtype=np.int64),
+            "conflict_values": np.array([x for v in self.conflicts.values() for x in v], dtype=float),
+        }
+        # Only set when the location and link files have extra columns.
+        for name in ["columns", "link_columns"]:
+            if hasattr(self, name):
+                arrays[name] = np.array(getattr(self, name), dtype=str)
+        for table in ["locations", "links", "major_routes", "closures"]:
+            rows = getattr(self, table, [])
+            arrays[table + "_cells"] = np.array([cell for row in rows for cell in row], dtype=str)
+            arrays[table + "_lengths"] = np.array([len(row) for row in rows], dtype=np.int64)
+
+        # Written under a temporary name first, as other runs may read the same file.
+        tmp_name = "{}.{}.tmp".format(file_name, os.getpid())
+        with open(tmp_name, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_name, file_name)
+
+
+    @check_args_type
+    def LoadCompiledGeography(self, file_name: str) -> bool:
+        """
+        Summary:
+            Reads the input geography from a file written by SaveCompiledGeography,
+            if it exists and none of the input files or the simulation settings
+            file changed since.
+
+        Args:
+            file_name (str): name of the compiled geography file.
+
+        Returns:
+            bool: True if the geography was read, False if it needs to be read from the CSV files.
+        """
+        if len(file_name) == 0 or not os.path.isfile(file_name):
+            return False
+
+        with np.load(file_name) as f:
+            if int(f["version"]) != InputGeography.compiled_geography_version:
+                return False
+            source_files = f["source_files"].tolist()
+            if SimulationSettings.SettingsFile not in source_files and len(SimulationSettings.SettingsFile) > 0:
+                return False
+            if str(f["key"]) != self._CompiledGeographyKey(source_files):
+                print("Compiled geography {} is out of date.".format(file_name), file=sys.stderr)
+                return False
+
+            self.source_files = [name for name in source_files if name != SimulationSettings.SettingsFile]
+            for name in ["columns", "link_columns"]:
+                if name in f.files:
+                    setattr(self, name, f[name].tolist())
+
+            values = f["conflict_values"].tolist()
+            offsets = np.concatenate(([0], np.cumsum(f["conflict_lengths"]))).tolist()
+            self.conflicts = {}
+            for i, name in enumerate(f["conflict_names"].tolist()):
+                self.conflicts[name] = values[offsets[i] : offsets[i + 1]]
+
+            for table in ["locations", "links", "major_routes", "closures"]:
+                cells = f[table + "_cells"].tolist()
+                offsets = np.concatenate(([0], np.cumsum(f[table + "_lengths"]))).tolist()
+                setattr(self, table, [cells[offsets[i] : offsets[i + 1]] for i in range(0, len(offsets) - 1)])
+
+        self.conflict_schedule = None
+        print("Read compiled geography from {}.".format(file_name), file=sys.stderr)
+        return True
+
+
     def ReadAgentsFromCSV(self, e, csv_name: str) -> None:
         """
         Summary:
@@ -404,13 +561,10 @@ class InputGeography:
                     for i in range (1, len(row)):
                         attr[headers[i-1]] = row[i]
 
-                    loc_found = False
-                    for i in range(0, len(e.locationNames)):
-                        if e.locationNames[i] == row[0]:
-                            e.addAgent(e.locations[i], attributes=attr)
-                            loc_found= True
-
-                    if not loc_found:
+                    loc_index = e.locationIndex.get(row[0], -1)
+                    if loc_index >= 0:
+                        e.addAgent(e.locations[loc_index], attributes=attr)
+                    else:
                         print("could not map location to CSV-loaded agent on line. (not count commented lines or empty lines)", sys.stderr)
                 i += 1
 
@@ -434,6 +588,13 @@ class InputGeography:
         lm = {}
         num_conflict_zones = 0
 
+        # Major routes by the name of their first location, in both directions.
+        major_routes = {}
+        for mr in self.major_routes:
+            major_routes.setdefault(mr[0], []).append([x for x in mr[1:] if x])
+            # operator below reverses the list, then skips the first value.
+            major_routes.setdefault(mr[-1], []).append([x for x in mr[-2::-1] if x])
+
         # Home country is assumed to be the country of the first location.
         home_country = self.locations[0][2]
         print("Home country set to: ", home_country, file=sys.stderr)
@@ -513,16 +674,7 @@ class InputGeography:
                 )
 
             # Add major link information
-            for mr in self.major_routes:
-                if mr[0] == name:
-                    major_route = [x for x in mr[1:] if x]
-                    #lm[name].major_routes.append(mr[1:])
-                    lm[name].major_routes.append(major_route)
-                if mr[-1] == name:
-                    major_route = [x for x in mr[-2::-1] if x]
-                    # operator below reverses the list, then skips the first value.
-                    #lm[name].major_routes.append(mr[-2::-1])
-                    lm[name].major_routes.append(major_route)
+            lm[name].major_routes += major_routes.get(name, [])
 
 
         for link in self.links:
@@ -641,6 +793,8 @@ class InputGeography:
             If there is no conflict input file, then the values from locations.csv are used.
             If there is one, then the data from it is used instead.
             Note: there is no support for *removing* conflict zones at this stage.
+            The changes are compiled into a schedule by day when first needed,
+            so every call only processes the events of the given day.
 
         Args:
             e (Ecosystem): ecosystem object
@@ -652,11 +806,10 @@ class InputGeography:
         """
 
         #Incorporate Location changes from location_changes.csv
-        #print(self.location_changes, file=sys.stderr)
-        for change in self.location_changes:
-            #print(f"loc change? {int(change[2])}, {time}", file=sys.stderr)
-            if int(change[2]) == time:
-                e.change_location_type(change[0],change[1])
+        if self.location_change_schedule is None:
+            self._ScheduleLocationChanges()
+        for name, location_type in self.location_change_schedule.get(time, []):
+            e.change_location_type(name, location_type)
 
 
         #Add New Flood Zones
@@ -666,58 +819,127 @@ class InputGeography:
             if SimulationSettings.move_rules["FloodForecaster"] is True:
                 #Store future flood levels in the forecast_flood_levels attribute. Default value is array of zeros.
                 self.UpdateLocationAttributes(e, "forecast_flood_levels", time) 
+            return
 
-        elif len(SimulationSettings.ConflictInputFile) == 0:
-            for loc in self.locations:
-                if "conflict" in loc[4].lower() and int(loc[5]) == time:
-                    conflict_intensity = 1.0
-                    if e.print_location_output:
-                        print(
-                            "Time = {}. Adding a new conflict zone [{}] with pop. {} and intensity {}".format(
-                                time, loc[0], int(loc[1]), conflict_intensity
-                            ),
-                            file=sys.stderr,
-                        )
-                    e.add_conflict_zone(name=loc[0], conflict_intensity=conflict_intensity)
-        else:
-            conflict_names = self.getConflictLocationNames()
-            # print(confl_names)
-
+        from_file = len(SimulationSettings.ConflictInputFile) > 0
+        if self.conflict_schedule is None or self.conflict_schedule[0] != from_file:
+            self._ScheduleConflicts(from_file)
 
-            for conflict_name in conflict_names:
-                if len(self.conflicts[conflict_name]) < (time - 1):
-                    print(f"Error: conflict value at time {time} requested, but the conflicts table for {conflict_name} only has values up to t = {len(conflicts[conflict_name])}.", file=sys.stderr)
+        if from_file:
+            if time >= self.conflict_schedule[1]:
+                print(f"Error: conflict value at time {time} requested, but the conflicts table only has values up to t = {self.conflict_schedule[1] - 1}.", file=sys.stderr)
 
-                if Debug and e.getRankN(e.time) is True:
+            if Debug and e.getRankN(e.time) is True:
+                for conflict_name in self.getConflictLocationNames():
                     print("L:", conflict_name, self.conflicts[conflict_name], time, file=sys.stderr)
-                if self.conflicts[conflict_name][time] > 0.000001:
-                    if time > 0:
-                        if self.conflicts[conflict_name][time - 1] < 0.000001:
-                            if e.getRankN(e.time) is True:
-                                print(
-                                    "Time = {}. Adding a new conflict zone [{}] with intensity {}".format(
-                                        time, conflict_name, self.conflicts[conflict_name][time]
-                                    ),
-                                    file=sys.stderr,
-                                )
-                            e.set_conflict_intensity(name=conflict_name, conflict_intensity=self.conflicts[conflict_name][time])
+
+        for method, name, conflict_intensity, message in self.conflict_schedule[2].get(time, []):
+            if from_file:
+                if e.getRankN(e.time) is True:
+                    print(message, file=sys.stderr)
+            elif e.print_location_output:
+                print(message, file=sys.stderr)
+
+            if method == "add_conflict_zone":
+                e.add_conflict_zone(name=name, conflict_intensity=conflict_intensity)
+            else:
+                e.set_conflict_intensity(name=name, conflict_intensity=conflict_intensity)
+
+
+    @check_args_type
+    def ResetSchedules(self) -> None:
+        """
+        Summary:
+            Discards the compiled conflict and location change schedules, so that
+            changes made to self.conflicts or self.location_changes take effect
+            (e.g. in a scenario branch of Ecosystem.fork_scenarios).
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        self.location_change_schedule = None
+        self.conflict_schedule = None
+
+
+    @check_args_type
+    def _ScheduleLocationChanges(self) -> None:
+        """
+        Summary:
+            Compiles the location changes into a dictionary of
+            (location name, new location type) events per day.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        self.location_change_schedule = {}
+        for change in getattr(self, "location_changes", []):
+            self.location_change_schedule.setdefault(int(change[2]), []).append((change[0], change[1]))
+
+
+    @check_args_type
+    def _ScheduleConflicts(self, from_file: bool) -> None:
+        """
+        Summary:
+            Compiles the conflict transitions into a dictionary of
+            (method, location name, conflict intensity, message) events per day,
+            so that AddNewConflictZones only processes the events of the current day.
+            With a conflict input file, a conflict zone is added where the conflict
+            intensity is positive on day 0, and the intensity is set on the days
+            it becomes positive or drops to zero. Otherwise conflict zones are
+            added on their conflict date in locations.csv.
+
+        Args:
+            from_file (bool): Whether the conflicts are read from the conflict input file.
+
+        Returns:
+            None.
+        """
+        schedule = {}
+        num_days = 0
+
+        if from_file:
+            num_days = min([len(values) for values in self.conflicts.values()], default=0)
+
+            for conflict_name in self.getConflictLocationNames():
+                values = self.conflicts[conflict_name]
+                if len(values) == 0:
+                    continue
+                v = np.array(values, dtype=float)
+
+                if v[0] > 0.000001:
+                    schedule.setdefault(0, []).append(
+                        ("add_conflict_zone", conflict_name, values[0],
+                         "Time = {}. Adding a new conflict zone [{}] with intensity {}".format(0, conflict_name, values[0]))
+                    )
+
+                starts = (v[1:] > 0.000001) & (v[:-1] < 0.000001)
+                ends = (v[1:] < 0.000001) & (v[:-1] >= 0.000001)
+                for time in np.flatnonzero(starts | ends) + 1:
+                    time = int(time)
+                    if starts[time - 1]:
+                        message = "Time = {}. Adding a new conflict zone [{}] with intensity {}".format(time, conflict_name, values[time])
                     else:
-                        if e.getRankN(e.time) is True:
-                            print(
-                                "Time = {}. Adding a new conflict zone [{}] with intensity {}".format(
-                                    time, conflict_name, self.conflicts[conflict_name][time]
-                                ),
-                                file=sys.stderr,
-                            )
-                        e.add_conflict_zone(name=conflict_name, conflict_intensity=self.conflicts[conflict_name][time])
-                if self.conflicts[conflict_name][time] < 0.000001 and time > 0:
-                    if self.conflicts[conflict_name][time - 1] >= 0.000001:
-                        if e.getRankN(e.time) is True:
-                            print(
-                                "Time = {}. Removing conflict zone [{}]".format(time, conflict_name),
-                                file=sys.stderr,
-                            )
-                        e.set_conflict_intensity(name=conflict_name, conflict_intensity=self.conflicts[conflict_name][time])
+                        message = "Time = {}. Removing conflict zone [{}]".format(time, conflict_name)
+                    schedule.setdefault(time, []).append(("set_conflict_intensity", conflict_name, values[time], message))
+
+        else:
+            for loc in self.locations:
+                if "conflict" in loc[4].lower():
+                    conflict_intensity = 1.0
+                    schedule.setdefault(int(loc[5]), []).append(
+                        ("add_conflict_zone", loc[0], conflict_intensity,
+                         "Time = {}. Adding a new conflict zone [{}] with pop. {} and intensity {}".format(
+                             int(loc[5]), loc[0], int(loc[1]), conflict_intensity
+                         ))
+                    )
+
+        self.conflict_schedule = (from_file, num_days, schedule)
 
     def ReadHurricaneInputCSV(self, filename):
         self.hurricane_data = {}
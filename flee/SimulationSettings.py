@@ -32,6 +32,7 @@ class SimulationSettings:
     spawn_rules = {} # ABM spawning rules
     move_rules = {} # ABM movement rules
     optimisations = {} # Settings to improve runtime performance
+    SettingsFile = "" # YAML file that the settings were read from
 
     sqrt_ten = 3.16227766017  # square root of ten (10^0.5).
 
@@ -93,6 +94,7 @@ class SimulationSettings:
         print("YAML file:", ymlfile, file=sys.stderr)
         with open(ymlfile) as f:
             dp = yaml.safe_load(f)
+        SimulationSettings.SettingsFile = ymlfile
 
         number_of_steps = float(fetchss(dp,"number_of_steps",-1))
         #Defined in run.py
@@ -288,6 +290,11 @@ class SimulationSettings:
         # Higher values mean less pruning.
         SimulationSettings.move_rules["PruningThreshold"] = float(fetchss(dpr,"pruning_threshold",1.0))
 
+        # Maximum number of routes that are considered from each location. Only the highest-weighted
+        # routes are kept, and branches that cannot improve on them are not searched.
+        # A value of 0 means that all routes within the awareness level are considered.
+        SimulationSettings.move_rules["MaxRoutesPerOrigin"] = int(fetchss(dpr,"max_routes_per_origin",0))
+
 
         # Flee 3.0 Prototyping conditionals (see design focument)
         # TODO: embed these in a more flexible/powerful framework of conditionals
@@ -346,6 +353,47 @@ class SimulationSettings:
         dpo = fetchss(dp, "optimisations", None)
         SimulationSettings.optimisations["PopulationScaleDownFactor"] = int(fetchss(dpo,"hasten",1))
 
+        # Storage engine for agents: "objects" (one Person object per agent), "arrays" (struct of NumPy arrays)
+        # or "cohorts" (stationary agents grouped by location and attributes).
+        SimulationSettings.optimisations["AgentEngine"] = str(fetchss(dpo,"agent_engine","objects")).lower()
+        if SimulationSettings.optimisations["AgentEngine"] not in ["objects", "arrays", "cohorts"]:
+            print("ERROR in simulationsetting.yml: agent_engine in optimisations should be set to objects, arrays or cohorts, not {}.".format(SimulationSettings.optimisations["AgentEngine"]), file=sys.stderr)
+            sys.exit()
+
+        # Reuse route distributions within a time step for agents with the same location and route-relevant attributes.
+        # Off by default, as capacity limits of destinations are then only evaluated once per location and time step.
+        SimulationSettings.optimisations["RouteCache"] = bool(fetchss(dpo,"route_cache",False))
+
+        # Keep location-generated routes (fixed_routes) between time steps, and only update their weights.
+        SimulationSettings.optimisations["CachedFixedRoutes"] = bool(fetchss(dpo,"cached_fixed_routes",True))
+
+        # Route weight calculation: "vectorized" (precomputed candidate routes) or "recursive" (calculateLinkWeight).
+        SimulationSettings.optimisations["RouteKernel"] = str(fetchss(dpo,"route_kernel","vectorized")).lower()
+        if SimulationSettings.optimisations["RouteKernel"] not in ["vectorized", "recursive"]:
+            print("ERROR in simulationsetting.yml: route_kernel in optimisations should be set to vectorized or recursive, not {}.".format(SimulationSettings.optimisations["RouteKernel"]), file=sys.stderr)
+            sys.exit()
+
+        # Directory for .npz copies of converted validation data CSV files ("" disables the cache).
+        SimulationSettings.optimisations["DataCache"] = str(fetchss(dpo,"data_cache",""))
+
+        # File for a compiled snapshot of the input geography ("" disables the snapshot).
+        SimulationSettings.optimisations["GeographyCache"] = str(fetchss(dpo,"geography_cache",""))
+
+        # Reduce all agent counts in pflee every step ("full"), or only the counts that changed ("delta").
+        SimulationSettings.optimisations["CountReduction"] = str(fetchss(dpo,"count_reduction","full")).lower()
+        if SimulationSettings.optimisations["CountReduction"] not in ["full", "delta"]:
+            print("ERROR in simulationsetting.yml: count_reduction in optimisations should be set to full or delta, not {}.".format(SimulationSettings.optimisations["CountReduction"]), file=sys.stderr)
+            sys.exit()
+
+        # Checkpoint file for resuming runs, and the number of days between checkpoints (0 disables writing them).
+        SimulationSettings.optimisations["CheckpointFile"] = str(fetchss(dpo,"checkpoint_file",""))
+        SimulationSettings.optimisations["CheckpointInterval"] = int(fetchss(dpo,"checkpoint_interval",0))
+
+        # Number of days between load balance checks in pflee (0 disables them), and the ratio of the
+        # largest to the mean per-rank agent time or agent count above which agents are migrated.
+        SimulationSettings.optimisations["LoadBalanceInterval"] = int(fetchss(dpo,"load_balance_interval",0))
+        SimulationSettings.optimisations["LoadBalanceThreshold"] = float(fetchss(dpo,"load_balance_threshold",1.2))
+
         if SimulationSettings.UseV1Rules is True:
             SimulationSettings.move_rules["MaxMoveSpeed"] = 200
             SimulationSettings.move_rules["StartOnFoot"] = False
@@ -0,0 +1,949 @@
+from __future__ import annotations, print_function
+
+import os
+from collections.abc import Mapping
+
+import numpy as np
+
+from flee.arraystore import ArrayStore
+
+if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
+    from beartype import beartype as check_args_type
+else:
+    def check_args_type(func):
+        return func
+
+
+# File for storing agents as a struct of arrays, instead of one Person object per agent.
+# Enabled through the agent_engine setting in the optimisations section of simsetting.yml.
+
+
+class AgentAttributes(Mapping):
+    """
+    Read-only dictionary view on the categorical attributes of one agent in an AgentStore.
+    """
+
+    __slots__ = ["_store", "_i"]
+
+    def __init__(self, store, i: int):
+        self._store = store
+        self._i = i
+
+    def __getitem__(self, name):
+        codes = self._store.attribute_codes.get(name, None)
+        if codes is None or codes[self._i] < 0:
+            raise KeyError(name)
+        return self._store.attribute_categories[name][codes[self._i]]
+
+    def __iter__(self):
+        for name, codes in self._store.attribute_codes.items():
+            if codes[self._i] >= 0:
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self.__iter__())
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class AgentStore(ArrayStore):
+    """
+    The AgentStore class. Holds all agent state in contiguous NumPy arrays,
+    and behaves like a list of Person objects towards code that needs per-agent access.
+    """
+
+    def __init__(self, view_class, ecosystem=None, capacity: int = 1024):
+        """
+        Summary:
+            Initializes an empty agent store.
+
+        Args:
+            view_class: Person subclass that is returned when indexing the store.
+                It is constructed as view_class(store, index).
+            ecosystem (optional): Ecosystem owning the store (needed by pflee views).
+            capacity (int, optional): initial number of agents to allocate space for.
+
+        Returns:
+            None.
+        """
+        self.view_class = view_class
+        self.ecosystem = ecosystem
+        super().__init__(capacity)
+
+        # Registry of all Location and Link objects that agents reside in.
+        # Agents store an index into this registry, or -1 if they have no location.
+        self.places = []
+        self._place_ids = {}
+
+        self.place = np.full(self.capacity, -1, dtype=np.int32)
+        self.home = np.full(self.capacity, -1, dtype=np.int32)
+        self.travelling = np.zeros(self.capacity, dtype=bool)
+        self.distance_travelled_on_link = np.zeros(self.capacity, dtype=np.float64)
+        self.distance_moved_this_timestep = np.zeros(self.capacity, dtype=np.float64)
+        self.recent_travel_distance = np.zeros(self.capacity, dtype=np.float64)
+        self.distance_travelled = np.zeros(self.capacity, dtype=np.float64)
+        self.places_travelled = np.ones(self.capacity, dtype=np.int32)
+        self.timesteps_since_departure = np.zeros(self.capacity, dtype=np.int32)
+
+        # Categorical attributes: one code column per attribute name (-1 = not set),
+        # with the original values stored once in a category list.
+        self.attribute_codes = {}
+        self.attribute_categories = {}
+        self._attribute_lookup = {}
+
+        # Sparse per-agent state: only agents with a planned route or a
+        # travel log have an entry.
+        self.routes = {}
+        self.locations_visited = {}
+
+    _array_names = [
+        "place",
+        "home",
+        "travelling",
+        "distance_travelled_on_link",
+        "distance_moved_this_timestep",
+        "recent_travel_distance",
+        "distance_travelled",
+        "places_travelled",
+        "timesteps_since_departure",
+    ]
+
+    _array_defaults = {"place": -1, "home": -1, "places_travelled": 1}
+
+
+    def __setstate__(self, state):
+        # The place registry is keyed by object id, which changes when the store
+        # is restored from a checkpoint (see flee.checkpoint).
+        self.__dict__.update(state)
+        self._place_ids = {id(obj): i for i, obj in enumerate(self.places)}
+
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.view_class(self, k) for k in range(*i.indices(self.size))]
+        if i < 0:
+            i += self.size
+        if i < 0 or i >= self.size:
+            raise IndexError("agent index out of range")
+        return self.view(int(i))
+
+
+    def __iter__(self):
+        i = 0
+        while i < self.size:
+            yield self.view_class(self, i)
+            i += 1
+
+
+    def view(self, i: int):
+        """
+        Summary:
+            Returns a view on agent i, without any bounds checking.
+
+        Args:
+            i (int): index of the agent in the store.
+
+        Returns:
+            Person: view on the agent.
+        """
+        return self.view_class(self, int(i))
+
+
+    @check_args_type
+    def _grow(self, min_capacity: int) -> None:
+        """
+        Summary:
+            Enlarges the agent arrays (see ArrayStore._grow), and the
+            attribute code columns along with them.
+
+        Args:
+            min_capacity (int): required number of agents.
+
+        Returns:
+            None.
+        """
+        super()._grow(min_capacity)
+
+        for name, old in self.attribute_codes.items():
+            new = np.full(self.capacity, -1, dtype=np.int32)
+            new[:self.size] = old[:self.size]
+            self.attribute_codes[name] = new
+
+
+    def place_index(self, obj) -> int:
+        """
+        Summary:
+            Returns the registry index of a Location or Link object,
+            registering it if it has not been seen before.
+
+        Args:
+            obj: Location or Link object, or None.
+
+        Returns:
+            int: index in self.places, or -1 for None.
+        """
+        if obj is None:
+            return -1
+        index = self._place_ids.get(id(obj), None)
+        if index is None:
+            index = len(self.places)
+            self.places.append(obj)
+            self._place_ids[id(obj)] = index
+        return index
+
+
+    def place_of(self, index: int):
+        """
+        Summary:
+            Returns the Location or Link object for a registry index.
+
+        Args:
+            index (int): index in self.places.
+
+        Returns:
+            Location, Link or None.
+        """
+        if index < 0:
+            return None
+        return self.places[index]
+
+
+    def place_values(self, func, dtype=np.float64, default=0.0):
+        """
+        Summary:
+            Evaluates func once for every registered place, and returns the
+            results as an array that can be indexed with self.place.
+
+        Args:
+            func: function taking a Location or Link object.
+            dtype (optional): dtype of the returned array.
+            default (optional): value returned for agents without a location (index -1).
+
+        Returns:
+            np.ndarray: array of length len(self.places) + 1, where the last
+            element holds the default value.
+        """
+        values = np.empty(len(self.places) + 1, dtype=dtype)
+        for k, p in enumerate(self.places):
+            values[k] = func(p)
+        values[-1] = default
+        return values
+
+
+    def attribute_values(self, name, func, indices, dtype=np.float64):
+        """
+        Summary:
+            Evaluates func once for every category of an attribute, and
+            returns the results for a selection of agents.
+
+        Args:
+            name: attribute name.
+            func: function taking an attribute value.
+            indices (np.ndarray): agent indices.
+            dtype (optional): dtype of the returned array.
+
+        Returns:
+            np.ndarray: func(attribute value) for every agent in indices.
+        """
+        codes = self.attribute_codes.get(name, None)
+        if codes is None:
+            raise KeyError(name)
+        codes = codes[indices]
+        if np.any(codes < 0):
+            raise KeyError(name)
+        values = np.array([func(v) for v in self.attribute_categories[name]], dtype=dtype)
+        return values[codes]
+
+
+    def _attribute_code(self, name, value) -> int:
+        """
+        Summary:
+            Returns the category code of an attribute value, adding the
+            attribute column and/or category if needed.
+
+        Args:
+            name: attribute name.
+            value: attribute value.
+
+        Returns:
+            int: category code.
+        """
+        lookup = self._attribute_lookup.get(name, None)
+        if lookup is None:
+            lookup = {}
+            self._attribute_lookup[name] = lookup
+            self.attribute_categories[name] = []
+            self.attribute_codes[name] = np.full(self.capacity, -1, dtype=np.int32)
+
+        try:
+            code = lookup.get(value, None)
+        except TypeError:
+            # Unhashable values are stored as separate categories.
+            code = None
+            lookup = None
+
+        if code is None:
+            code = len(self.attribute_categories[name])
+            self.attribute_categories[name].append(value)
+            if lookup is not None:
+                lookup[value] = code
+        return code
+
+
+    def add(self, location, attributes):
+        """
+        Summary:
+            Appends a new agent at the given location.
+
+        Args:
+            location (Location): initial location of the agent.
+            attributes (dict): dictionary of agent attributes.
+
+        Returns:
+            Person: view on the new agent.
+        """
+        if self.size == self.capacity:
+            self._grow(self.size + 1)
+
+        i = self.size
+        index = self.place_index(location)
+        self.place[i] = index
+        self.home[i] = index
+        self.travelling[i] = False
+        self.distance_travelled_on_link[i] = 0.0
+        self.distance_moved_this_timestep[i] = 0.0
+        self.recent_travel_distance[i] = 0.0
+        self.distance_travelled[i] = 0.0
+        self.places_travelled[i] = 1
+        self.timesteps_since_departure[i] = 0
+        for codes in self.attribute_codes.values():
+            codes[i] = -1
+        for name, value in attributes.items():
+            code = self._attribute_code(name, value)
+            self.attribute_codes[name][i] = code
+
+        self.size += 1
+
+        view = self.view_class(self, i)
+        location.IncrementNumAgents(view)
+        return view
+
+
+    def add_many(self, location, number: int, attributes=None) -> None:
+        """
+        Summary:
+            Appends a number of new agents at the given location in one operation.
+
+        Args:
+            location (Location): initial location of the agents.
+            number (int): number of agents.
+            attributes (List[dict], optional): dictionary of attributes for every agent.
+
+        Returns:
+            None.
+        """
+        if number < 1:
+            return
+        if self.size + number > self.capacity:
+            self._grow(self.size + number)
+
+        new = slice(self.size, self.size + number)
+        index = self.place_index(location)
+        self.place[new] = index
+        self.home[new] = index
+        self.travelling[new] = False
+        self.distance_travelled_on_link[new] = 0.0
+        self.distance_moved_this_timestep[new] = 0.0
+        self.recent_travel_distance[new] = 0.0
+        self.distance_travelled[new] = 0.0
+        self.places_travelled[new] = 1
+        self.timesteps_since_departure[new] = 0
+        for codes in self.attribute_codes.values():
+            codes[new] = -1
+        if attributes is not None:
+            for i, agent_attributes in enumerate(attributes, start=self.size):
+                for name, value in agent_attributes.items():
+                    code = self._attribute_code(name, value)
+                    self.attribute_codes[name][i] = code
+
+        self.size += number
+
+        location.IncrementNumAgents(None, number)
+
+
+    def alive(self) -> np.ndarray:
+        """
+        Summary:
+            Returns a boolean mask of the agents that still have a location.
+
+        Args:
+            None.
+
+        Returns:
+            np.ndarray: boolean mask of length self.size.
+        """
+        return self.place[:self.size] >= 0
+
+
+    def travelling_indices(self) -> np.ndarray:
+        """
+        Summary:
+            Returns the indices of all agents that currently reside on a link.
+
+        Args:
+            None.
+
+        Returns:
+            np.ndarray: agent indices.
+        """
+        return np.flatnonzero(self.travelling[:self.size] & (self.place[:self.size] >= 0))
+
+
+    def keep(self, mask) -> None:
+        """
+        Summary:
+            Removes all agents for which mask is False, compacting the arrays.
+            Agent counts in locations are not modified here.
+
+        Args:
+            mask (np.ndarray): boolean mask of length self.size.
+
+        Returns:
+            None.
+        """
+        kept = np.flatnonzero(mask)
+        new_size = len(kept)
+
+        for name in self._array_names:
+            arr = getattr(self, name)
+            arr[:new_size] = arr[kept]
+        for codes in self.attribute_codes.values():
+            codes[:new_size] = codes[kept]
+
+        new_index = np.full(self.size, -1, dtype=np.int64)
+        new_index[kept] = np.arange(new_size)
+        self.routes = {int(new_index[i]): r for i, r in self.routes.items() if new_index[i] >= 0}
+        self.locations_visited = {
+            int(new_index[i]): v for i, v in self.locations_visited.items() if new_index[i] >= 0
+        }
+
+        self.size = new_size
+
+
+    def remove_at_places(self, func):
+        """
+        Summary:
+            Removes all agents that reside in a place for which func returns True,
+            compacting the arrays. Agent counts in locations are not modified here.
+
+        Args:
+            func: function taking a Location or Link object.
+
+        Returns:
+            list: (place, number of agents removed) pairs.
+        """
+        selected = self.place_values(func, dtype=bool, default=False)
+        place = self.place[:self.size]
+        remove = selected[place]
+        removed = np.bincount(place[remove], minlength=len(self.places))
+        self.keep(~remove)
+        return [(self.places[k], int(removed[k])) for k in np.flatnonzero(removed)]
+
+
+    def export_agents(self, indices, place_number) -> dict:
+        """
+        Summary:
+            Returns the state of a selection of individual agents, with places
+            replaced by numbers that are the same in every store (e.g. on every
+            MPI rank), so that the agents can be recreated with import_agents.
+            The agents are not removed here.
+
+        Args:
+            indices (np.ndarray): agent indices.
+            place_number: function returning the number of a Location or Link object,
+                evaluated for the places of the exported agents only.
+
+        Returns:
+            dict: agent state arrays, attributes as (categories, codes) per attribute
+            name, and the planned routes and travel logs of the agents that have them.
+        """
+        # Only the places of the exported agents are numbered, as the registry also
+        # holds places that no longer exist elsewhere, such as links that were closed.
+        numbers = np.full(len(self.places) + 1, -1, dtype=np.int64)
+        for k in np.unique(np.concatenate((self.place[indices], self.home[indices]))):
+            if k >= 0:
+                numbers[k] = place_number(self.places[k])
+        position = {int(i): j for j, i in enumerate(indices)}
+
+        data = {name: getattr(self, name)[indices] for name in self._array_names}
+        data["place"] = numbers[data["place"]]
+        data["home"] = numbers[data["home"]]
+        data["attributes"] = {
+            name: (self.attribute_categories[name], codes[indices])
+            for name, codes in self.attribute_codes.items()
+        }
+        data["routes"] = {position[i]: r for i, r in self.routes.items() if i in position and r}
+        data["locations_visited"] = {
+            position[i]: [place_number(p) for p in v] for i, v in self.locations_visited.items() if i in position and v
+        }
+        return data
+
+
+    def import_agents(self, data: dict, places) -> None:
+        """
+        Summary:
+            Appends individual agents exported by export_agents.
+            Agent counts in locations are not modified here.
+
+        Args:
+            data (dict): agent state, as returned by export_agents.
+            places: Location and Link objects, indexed by place number.
+
+        Returns:
+            None.
+        """
+        number = len(data["place"])
+        if number < 1:
+            return
+        if self.size + number > self.capacity:
+            self._grow(self.size + number)
+
+        new = slice(self.size, self.size + number)
+        for name in self._array_names:
+            getattr(self, name)[new] = data[name]
+
+        # Places are registered once per place instead of once per agent.
+        numbers, inverse = np.unique(np.concatenate((data["place"], data["home"])), return_inverse=True)
+        local = np.array([self.place_index(places[k]) if k >= 0 else -1 for k in numbers], dtype=np.int32)
+        self.place[new] = local[inverse[:number]]
+        self.home[new] = local[inverse[number:]]
+
+        for codes in self.attribute_codes.values():
+            codes[new] = -1
+        for name, (categories, codes) in data["attributes"].items():
+            if len(categories) == 0:
+                continue
+            local_codes = np.array([self._attribute_code(name, value) for value in categories], dtype=np.int32)
+            self.attribute_codes[name][new] = np.where(codes >= 0, local_codes[codes], -1)
+
+        for j, r in data["routes"].items():
+            self.routes[self.size + j] = r
+        for j, v in data["locations_visited"].items():
+            self.locations_visited[self.size + j] = [places[k] for k in v]
+
+        self.size += number
+
+
+    def update_recent_travel(self, max_move_speed: float) -> None:
+        """
+        Summary:
+            Vectorized update of recent_travel_distance at the end of a time step,
+            resetting distance_moved_this_timestep.
+
+        Args:
+            max_move_speed (float): MaxMoveSpeed used to normalize the distance moved.
+
+        Returns:
+            None.
+        """
+        n = self.size
+        self.recent_travel_distance[:n] = (
+            self.recent_travel_distance[:n] + (self.distance_moved_this_timestep[:n] / max_move_speed)
+        ) / 2.0
+        self.distance_moved_this_timestep[:n] = 0.0
+
+
+    def increment_timesteps_since_departure(self) -> None:
+        """
+        Summary:
+            Adds one time step to the departure counters of all agents that have a location.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        self.timesteps_since_departure[:self.size][self.alive()] += 1
+
+
+    def deactivate_in_camps(self) -> None:
+        """
+        Summary:
+            Removes agents residing in camps from the simulation with the
+            deactivation_probability of their camp. Agents keep their slot in the store.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        n = self.size
+        if n == 0:
+            return
+        prob = self.place_values(
+            lambda p: float(p.attributes.get("deactivation_probability", 0.0)) if getattr(p, "camp", False) is True else 0.0
+        )
+        candidates = np.flatnonzero(~self.travelling[:n] & (prob[self.place[:n]] > 0.0))
+        if len(candidates) == 0:
+            return
+        outcome = np.random.random(len(candidates))
+        removed = candidates[outcome < prob[self.place[candidates]]]
+        self.place[removed] = -1
+
+
+class CohortStore(AgentStore):
+    """
+    The CohortStore class. An AgentStore in which stationary agents that share a
+    place and attribute class are kept as cohorts (place, class, count) instead of
+    individual agents. Agents are only materialised in the arrays while they move.
+    """
+
+    def __init__(self, view_class, ecosystem=None, capacity: int = 1024):
+        """
+        Summary:
+            Initializes an empty cohort store.
+
+        Args:
+            view_class: Person subclass that is returned when indexing the store.
+            ecosystem (optional): Ecosystem owning the store (needed by pflee views).
+            capacity (int, optional): initial number of agents to allocate space for.
+
+        Returns:
+            None.
+        """
+        super().__init__(view_class, ecosystem=ecosystem, capacity=capacity)
+
+        # Attribute classes: tuples of attribute codes (one per attribute column,
+        # trailing unset columns removed).
+        self.classes = []
+        self._class_ids = {}
+
+        # One cohort per (place, class, moved) combination. moved is True for agents
+        # that have travelled before, so that StartOnFoot only applies to first departures.
+        self.num_cohorts = 0
+        self.cohort_capacity = 64
+        self.cohort_place = np.full(self.cohort_capacity, -1, dtype=np.int32)
+        self.cohort_class = np.zeros(self.cohort_capacity, dtype=np.int32)
+        self.cohort_moved = np.zeros(self.cohort_capacity, dtype=bool)
+        self.cohort_count = np.zeros(self.cohort_capacity, dtype=np.int64)
+        self._cohort_ids = {}
+
+        self.cohort_total = 0
+
+
+    def __len__(self) -> int:
+        return self.size + self.cohort_total
+
+
+    # Indexing and iterating over the store (e.g. by write_agents) materialise
+    # every cohort first, which removes the benefit of cohorts until the next merge.
+    def __getitem__(self, i):
+        self.expand()
+        return super().__getitem__(i)
+
+
+    def __iter__(self):
+        self.expand()
+        return super().__iter__()
+
+
+    def _class_index(self, codes) -> int:
+        """
+        Summary:
+            Returns the index of an attribute class, registering it if needed.
+
+        Args:
+            codes: sequence of attribute codes, one per attribute column.
+
+        Returns:
+            int: index in self.classes.
+        """
+        codes = list(codes)
+        while len(codes) > 0 and codes[-1] < 0:
+            codes.pop()
+        codes = tuple(int(c) for c in codes)
+        index = self._class_ids.get(codes, None)
+        if index is None:
+            index = len(self.classes)
+            self.classes.append(codes)
+            self._class_ids[codes] = index
+        return index
+
+
+    def _cohort_index(self, place: int, cls: int, moved: bool) -> int:
+        """
+        Summary:
+            Returns the index of a cohort, creating an empty cohort if needed.
+
+        Args:
+            place (int): place index, or -1 for agents without a location.
+            cls (int): attribute class index.
+            moved (bool): whether the agents in the cohort have travelled before.
+
+        Returns:
+            int: cohort index.
+        """
+        key = (int(place), int(cls), bool(moved))
+        k = self._cohort_ids.get(key, None)
+        if k is not None:
+            return k
+
+        if self.num_cohorts == self.cohort_capacity:
+            self.cohort_capacity *= 2
+            for name in ["cohort_place", "cohort_class", "cohort_moved", "cohort_count"]:
+                old = getattr(self, name)
+                new = np.zeros(self.cohort_capacity, dtype=old.dtype)
+                new[:self.num_cohorts] = old[:self.num_cohorts]
+                setattr(self, name, new)
+
+        k = self.num_cohorts
+        self.cohort_place[k] = key[0]
+        self.cohort_class[k] = key[1]
+        self.cohort_moved[k] = key[2]
+        self.cohort_count[k] = 0
+        self._cohort_ids[key] = k
+        self.num_cohorts += 1
+        return k
+
+
+    def add(self, location, attributes):
+        """
+        Summary:
+            Adds a new agent at the given location to the matching cohort.
+
+        Args:
+            location (Location): initial location of the agent.
+            attributes (dict): dictionary of agent attributes.
+
+        Returns:
+            None.
+        """
+        agent_codes = {name: self._attribute_code(name, value) for name, value in attributes.items()}
+        codes = [agent_codes.get(name, -1) for name in self.attribute_codes]
+
+        k = self._cohort_index(self.place_index(location), self._class_index(codes), False)
+        self.cohort_count[k] += 1
+        self.cohort_total += 1
+
+        location.IncrementNumAgents(None)
+
+
+    def add_many(self, location, number: int, attributes=None) -> None:
+        """
+        Summary:
+            Adds a number of new agents at the given location to the matching cohorts.
+
+        Args:
+            location (Location): initial location of the agents.
+            number (int): number of agents.
+            attributes (List[dict], optional): dictionary of attributes for every agent.
+
+        Returns:
+            None.
+        """
+        if number < 1:
+            return
+        if attributes is None:
+            attributes = [{}]
+            counts = [number]
+        else:
+            counts = [1] * number
+
+        agent_codes = [{name: self._attribute_code(name, value) for name, value in a.items()} for a in attributes]
+
+        # Agents with the same attributes join the same cohort.
+        classes = {}
+        for codes, count in zip(agent_codes, counts):
+            key = tuple(codes.get(name, -1) for name in self.attribute_codes)
+            classes[key] = classes.get(key, 0) + count
+
+        place = self.place_index(location)
+        for codes, count in classes.items():
+            k = self._cohort_index(place, self._class_index(list(codes)), False)
+            self.cohort_count[k] += count
+        self.cohort_total += number
+
+        location.IncrementNumAgents(None, number)
+
+
+    def class_values(self, name, func, cohorts, dtype=np.float64):
+        """
+        Summary:
+            Evaluates func for the attribute value of a selection of cohorts.
+
+        Args:
+            name: attribute name.
+            func: function taking an attribute value.
+            cohorts (np.ndarray): cohort indices.
+            dtype (optional): dtype of the returned array.
+
+        Returns:
+            np.ndarray: func(attribute value) for every cohort in cohorts.
+        """
+        if name not in self.attribute_codes:
+            raise KeyError(name)
+        j = list(self.attribute_codes).index(name)
+        values = np.empty(len(cohorts), dtype=dtype)
+        for n, k in enumerate(cohorts):
+            codes = self.classes[self.cohort_class[k]]
+            if j >= len(codes) or codes[j] < 0:
+                raise KeyError(name)
+            values[n] = func(self.attribute_categories[name][codes[j]])
+        return values
+
+
+    def materialise(self, k: int, number: int) -> np.ndarray:
+        """
+        Summary:
+            Takes a number of agents out of a cohort and stores them as
+            individual agents at the end of the arrays. Agent counts in
+            locations are not modified, as the agents stay where they are.
+
+        Args:
+            k (int): cohort index.
+            number (int): number of agents to materialise.
+
+        Returns:
+            np.ndarray: indices of the new individual agents.
+        """
+        number = int(min(number, self.cohort_count[k]))
+        if self.size + number > self.capacity:
+            self._grow(self.size + number)
+
+        start = self.size
+        end = start + number
+        self.place[start:end] = self.cohort_place[k]
+        self.home[start:end] = self.cohort_place[k]
+        self.travelling[start:end] = False
+        self.distance_travelled_on_link[start:end] = 0.0
+        self.distance_moved_this_timestep[start:end] = 0.0
+        self.recent_travel_distance[start:end] = 0.0
+        self.distance_travelled[start:end] = 0.0
+        self.places_travelled[start:end] = 2 if self.cohort_moved[k] else 1
+        self.timesteps_since_departure[start:end] = 0
+
+        codes = self.classes[self.cohort_class[k]]
+        for j, column in enumerate(self.attribute_codes.values()):
+            column[start:end] = codes[j] if j < len(codes) else -1
+
+        self.size = end
+        self.cohort_count[k] -= number
+        self.cohort_total -= number
+        return np.arange(start, end)
+
+
+    def expand(self) -> None:
+        """
+        Summary:
+            Materialises all cohorts, so that every agent can be accessed individually.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        for k in np.flatnonzero(self.cohort_count[:self.num_cohorts] > 0):
+            self.materialise(k, self.cohort_count[k])
+
+
+    def merge(self) -> None:
+        """
+        Summary:
+            Moves all individual agents that are not travelling and have no
+            planned route back into cohorts. Per-agent history (home location,
+            distance travelled, recent travel distance and time since departure)
+            is not kept, so settings that use it are rejected with this engine
+            (see flee.Ecosystem._check_cohort_settings).
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        n = self.size
+        if n == 0:
+            return
+
+        has_route = np.zeros(n, dtype=bool)
+        for i, r in self.routes.items():
+            if r:
+                has_route[i] = True
+        merged = np.flatnonzero(~self.travelling[:n] & ~has_route)
+        if len(merged) == 0:
+            return
+
+        columns = [self.place[merged], (self.places_travelled[merged] > 1).astype(np.int32)]
+        columns += [codes[merged] for codes in self.attribute_codes.values()]
+        keys, counts = np.unique(np.column_stack(columns), axis=0, return_counts=True)
+        for key, count in zip(keys, counts):
+            k = self._cohort_index(key[0], self._class_index(key[2:]), key[1] > 0)
+            self.cohort_count[k] += count
+        self.cohort_total += len(merged)
+
+        keep = np.ones(n, dtype=bool)
+        keep[merged] = False
+        self.keep(keep)
+
+
+    def remove_at_places(self, func):
+        """
+        Summary:
+            Removes all agents and cohorts that reside in a place for which func
+            returns True. Agent counts in locations are not modified here.
+
+        Args:
+            func: function taking a Location or Link object.
+
+        Returns:
+            list: (place, number of agents removed) pairs.
+        """
+        removed = {}
+        for place, number in super().remove_at_places(func):
+            removed[self.place_index(place)] = number
+
+        selected = self.place_values(func, dtype=bool, default=False)
+        nc = self.num_cohorts
+        for k in np.flatnonzero(selected[self.cohort_place[:nc]] & (self.cohort_count[:nc] > 0)):
+            place = int(self.cohort_place[k])
+            removed[place] = removed.get(place, 0) + int(self.cohort_count[k])
+            self.cohort_total -= int(self.cohort_count[k])
+            self.cohort_count[k] = 0
+
+        return [(self.places[k], number) for k, number in removed.items()]
+
+
+    def deactivate_in_camps(self) -> None:
+        """
+        Summary:
+            Removes agents residing in camps from the simulation with the
+            deactivation_probability of their camp. Deactivated cohort members
+            are kept in cohorts without a place.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        super().deactivate_in_camps()
+
+        nc = self.num_cohorts
+        if nc == 0:
+            return
+        prob = self.place_values(
+            lambda p: float(p.attributes.get("deactivation_probability", 0.0)) if getattr(p, "camp", False) is True else 0.0
+        )
+        candidates = np.flatnonzero((prob[self.cohort_place[:nc]] > 0.0) & (self.cohort_count[:nc] > 0))
+        if len(candidates) == 0:
+            return
+        removed = np.random.binomial(self.cohort_count[candidates], np.minimum(prob[self.cohort_place[candidates]], 1.0))
+        for k, number in zip(candidates, removed):
+            if number > 0:
+                target = self._cohort_index(-1, self.cohort_class[k], self.cohort_moved[k])
+                self.cohort_count[k] -= number
+                self.cohort_count[target] += number
@@ -0,0 +1,71 @@
+from __future__ import annotations, print_function
+
+import os
+
+import numpy as np
+
+if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
+    from beartype import beartype as check_args_type
+else:
+    def check_args_type(func):
+        return func
+
+
+# File for the common base of the stores that keep one entry per agent, location or
+# link in NumPy arrays (see agentstore.AgentStore, locationstore.LocationStore and
+# locationstore.CountStore).
+
+
+class ArrayStore:
+    """
+    The ArrayStore class. Base class for stores that hold their entries in the
+    NumPy arrays named in _array_names, of which the first size entries are in use.
+    Entries beyond size are filled with the value in _array_defaults (or 0).
+    """
+
+    _array_names = []
+    _array_defaults = {}
+
+    def __init__(self, capacity: int):
+        """
+        Summary:
+            Initializes an empty store.
+
+        Args:
+            capacity (int): initial number of entries to allocate space for.
+
+        Returns:
+            None.
+        """
+        self.size = 0
+        self.capacity = max(1, capacity)
+
+
+    def __len__(self) -> int:
+        return self.size
+
+
+    @check_args_type
+    def _grow(self, min_capacity: int) -> None:
+        """
+        Summary:
+            Enlarges all arrays to hold at least min_capacity entries,
+            doubling the capacity to keep appends amortized O(1).
+
+        Args:
+            min_capacity (int): required number of entries.
+
+        Returns:
+            None.
+        """
+        new_capacity = self.capacity
+        while new_capacity < min_capacity:
+            new_capacity *= 2
+
+        for name in self._array_names:
+            old = getattr(self, name)
+            new = np.full(new_capacity, self._array_defaults.get(name, 0), dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+        self.capacity = new_capacity
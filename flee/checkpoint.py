@@ -0,0 +1,222 @@
+from __future__ import annotations, print_function
+
+import os
+import pickle
+import random
+import sys
+
+import numpy as np
+
+import flee.spawning as spawning
+
+if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
+    from beartype import beartype as check_args_type
+else:
+    def check_args_type(func):
+        return func
+
+
+# File for writing the complete state of an Ecosystem to disk and reading it back,
+# so that a simulation can be resumed after a crash or job time limit.
+# Used through Ecosystem.save_checkpoint() and Ecosystem.load_checkpoint(), and for the
+# in-memory snapshots of Ecosystem.fork_scenarios().
+#
+# A checkpoint file is a sequence of pickles:
+#   1. a header with the checkpoint version, MPI rank and number of ranks,
+#   2. the state of the Python and NumPy random number generators,
+#   3. the state of the spawning module,
+#   4. the state of the Ecosystem (without its MPI manager) and optional extra objects,
+#   5. the state of all locations and links, in chunks, followed by None.
+# Locations and links are written by index instead of recursively, as the
+# location graph of a large network is far deeper than the Python recursion limit.
+
+# Increase when the contents of a checkpoint change.
+checkpoint_version = 1
+
+
+class _CheckpointPickler(pickle.Pickler):
+    """
+    Pickler that writes the ecosystem, locations and links as references.
+    """
+
+    def __init__(self, f, e, node_types):
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.e = e
+        self.node_types = node_types
+        self.nodes = []
+        self.node_index = {}
+
+
+    def persistent_id(self, obj):
+        if obj is self.e:
+            return "ecosystem"
+        if isinstance(obj, self.node_types):
+            i = self.node_index.get(id(obj))
+            if i is None:
+                i = len(self.nodes)
+                self.node_index[id(obj)] = i
+                self.nodes.append(obj)
+            return (type(obj), i)
+        return None
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    """
+    Unpickler that resolves the references written by _CheckpointPickler.
+    """
+
+    def __init__(self, f, e):
+        super().__init__(f)
+        self.e = e
+        self.nodes = []
+
+
+    def persistent_load(self, pid):
+        if pid == "ecosystem":
+            return self.e
+        cls, i = pid
+        while len(self.nodes) <= i:
+            self.nodes.append(None)
+        if self.nodes[i] is None:
+            self.nodes[i] = cls.__new__(cls)
+        return self.nodes[i]
+
+
+@check_args_type
+def write_checkpoint_stream(f, e, node_types: tuple, exclude: list, rank: int = 0, size: int = 1, extra: dict = {}) -> None:
+    """
+    Summary:
+        Writes the state of an ecosystem, the random number generators and the
+        spawning module to an open binary file (or an in-memory buffer).
+
+    Args:
+        f: binary file object to write to.
+        e (Ecosystem): the ecosystem.
+        node_types (tuple): classes of the objects in the location graph (locations and links).
+        exclude (list): ecosystem attributes that are not written (e.g. the MPI manager).
+        rank (int, optional): MPI rank writing the checkpoint.
+        size (int, optional): number of MPI ranks.
+        extra (dict, optional): other objects to restore with the ecosystem (e.g. the DataTable).
+
+    Returns:
+        None.
+    """
+    state = {key: value for key, value in e.__dict__.items() if key not in exclude}
+
+    p = _CheckpointPickler(f, e, node_types)
+    p.dump({"version": checkpoint_version, "rank": rank, "size": size})
+    p.dump((random.getstate(), np.random.get_state()))
+    p.dump(spawning.get_checkpoint_state())
+    p.dump((state, extra))
+
+    # Writing a chunk can refer to locations and links that are not written yet.
+    i = 0
+    while i < len(p.nodes):
+        chunk = [node.__dict__ for node in p.nodes[i:]]
+        p.dump(chunk)
+        i += len(chunk)
+    p.dump(None)
+
+
+@check_args_type
+def write_checkpoint(file_name: str, e, node_types: tuple, exclude: list, rank: int = 0, size: int = 1, extra: dict = {}) -> None:
+    """
+    Summary:
+        Writes a checkpoint file (see write_checkpoint_stream).
+
+    Args:
+        file_name (str): name of the checkpoint file.
+        e (Ecosystem): the ecosystem.
+        node_types (tuple): classes of the objects in the location graph (locations and links).
+        exclude (list): ecosystem attributes that are not written (e.g. the MPI manager).
+        rank (int, optional): MPI rank writing the file.
+        size (int, optional): number of MPI ranks.
+        extra (dict, optional): other objects to restore with the ecosystem (e.g. the DataTable).
+
+    Returns:
+        None.
+    """
+    # Written under a temporary name first, so that a crash while writing keeps the previous checkpoint.
+    tmp_name = "{}.tmp".format(file_name)
+    with open(tmp_name, "wb") as f:
+        write_checkpoint_stream(f, e, node_types, exclude, rank=rank, size=size, extra=extra)
+
+    os.replace(tmp_name, file_name)
+
+
+@check_args_type
+def read_checkpoint_stream(f, e, rank: int = 0, size: int = 1, source: str = "checkpoint") -> dict:
+    """
+    Summary:
+        Restores the state of an ecosystem, the random number generators and the
+        spawning module from a checkpoint written by write_checkpoint_stream.
+
+    Args:
+        f: binary file object to read from.
+        e (Ecosystem): the ecosystem to restore, newly created with the same settings.
+        rank (int, optional): MPI rank reading the checkpoint.
+        size (int, optional): number of MPI ranks.
+        source (str, optional): description of the checkpoint for error messages.
+
+    Returns:
+        dict: the extra objects that were written with the checkpoint.
+    """
+    u = _CheckpointUnpickler(f, e)
+
+    header = u.load()
+    if header["version"] != checkpoint_version:
+        print(
+            "Error: {} has version {}, expected {}.".format(source, header["version"], checkpoint_version),
+            file=sys.stderr,
+        )
+        sys.exit()
+    if header["rank"] != rank or header["size"] != size:
+        print(
+            "Error: {} was written by rank {} of {}, but is read by rank {} of {}.".format(
+                source, header["rank"], header["size"], rank, size
+            ),
+            file=sys.stderr,
+        )
+        sys.exit()
+
+    python_rng, numpy_rng = u.load()
+    spawning_state = u.load()
+    state, extra = u.load()
+
+    i = 0
+    chunk = u.load()
+    while chunk is not None:
+        for node_state in chunk:
+            u.nodes[i].__dict__.update(node_state)
+            i += 1
+        chunk = u.load()
+
+    e.__dict__.update(state)
+    spawning.set_checkpoint_state(spawning_state)
+    random.setstate(python_rng)
+    np.random.set_state(numpy_rng)
+
+    return extra
+
+
+@check_args_type
+def read_checkpoint(file_name: str, e, rank: int = 0, size: int = 1) -> dict:
+    """
+    Summary:
+        Reads a checkpoint file (see read_checkpoint_stream).
+
+    Args:
+        file_name (str): name of the checkpoint file.
+        e (Ecosystem): the ecosystem to restore, newly created with the same settings.
+        rank (int, optional): MPI rank reading the file.
+        size (int, optional): number of MPI ranks.
+
+    Returns:
+        dict: the extra objects that were written with the checkpoint.
+    """
+    if not os.path.isfile(file_name):
+        print("Error: checkpoint file {} does not exist.".format(file_name), file=sys.stderr)
+        sys.exit()
+
+    with open(file_name, "rb") as f:
+        return read_checkpoint_stream(f, e, rank=rank, size=size, source="checkpoint file {}".format(file_name))
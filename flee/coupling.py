@@ -186,16 +186,16 @@ class CouplingInterface:
         print("Adding Ghosts", file=sys.stderr)
 
         for conflict_name in conflict_name_list:
-            for i, location_name in enumerate(self.e.locationNames):
-                if location_name == conflict_name:
-                    loc = self.e.locations[i]
-                    # print("L", loc.name, len(loc.links), file=sys.stderr)
-                    if len(loc.links) == 0:
-                        if loc.name not in self.location_names:
-                            print("Adding ghost location {}".format(loc.name), file=sys.stderr)
-                            self.addCoupledLocation(
-                                location=loc, name=loc.name, direction="out", interval=1
-                            )
+            i = self.e.locationIndex.get(conflict_name, -1)
+            if i >= 0:
+                loc = self.e.locations[i]
+                # print("L", loc.name, len(loc.links), file=sys.stderr)
+                if len(loc.links) == 0:
+                    if loc.name not in self.location_names:
+                        print("Adding ghost location {}".format(loc.name), file=sys.stderr)
+                        self.addCoupledLocation(
+                            location=loc, name=loc.name, direction="out", interval=1
+                        )
 
 
     def addMicroConflictLocations(self, ig) -> None:
@@ -213,16 +213,16 @@ class CouplingInterface:
         print("Adding micro conflict coupling", file=sys.stderr)
 
         for conflict_name in conflict_name_list:
-            for i, location_name in enumerate(self.e.locationNames):
-                if location_name == conflict_name:
-                    loc = self.e.locations[i]
-                    # print("L", loc.name, len(loc.links), file=sys.stderr)
-                    print(
-                        "Adding micro coupled conflict location {}".format(loc.name),
-                        file=sys.stderr,
-                    )
+            i = self.e.locationIndex.get(conflict_name, -1)
+            if i >= 0:
+                loc = self.e.locations[i]
+                # print("L", loc.name, len(loc.links), file=sys.stderr)
+                print(
+                    "Adding micro coupled conflict location {}".format(loc.name),
+                    file=sys.stderr,
+                )
 
-                    self.addCoupledLocation(location=loc, name=loc.name, direction="in", interval=1)
+                self.addCoupledLocation(location=loc, name=loc.name, direction="in", interval=1)
 
 
     @check_args_type
@@ -4,6 +4,7 @@ import numpy as np
 import random
 from beartype.typing import List, Optional, Tuple
 from flee.SimulationSettings import SimulationSettings
+from flee import moving
 
 if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
     from beartype import beartype as check_args_type
@@ -66,7 +67,7 @@ def _addLocationRoute(
     weight = weight**SimulationSettings.move_rules["WeightPower"]
 
     #print("Adding loc route:", origin_names[1:], link.endpoint.name, file=sys.stderr)
-    if weight > loc.routes.get(link.endpoint.name, [0,None])[0]:
+    if weight > source_loc.routes.get(link.endpoint.name, [0,None])[0]:
         source_loc.routes[link.endpoint.name] = [weight, origin_names[1:] + [link.endpoint.name], link.endpoint]
 
 
@@ -236,6 +237,207 @@ def insertAllMajorRoutesAtLocation(l, time: int):
 
 
 
+@check_args_type
+def _resolveMajorRoute(source_loc, route):
+    """
+    Summary:
+        Resolves a major route to links, like _addMajorRouteToLocation.
+
+    Args:
+        source_loc (Location): location the route starts from.
+        route (List[str]): names of the locations on the route.
+
+    Returns:
+        Optional[Tuple[Link, float, List[Location]]]: the last link, the distance before
+        the last link and the locations passed, or None if the route cannot be resolved.
+    """
+    prior_distance = 0.0
+    current_loc = source_loc
+    passed = [source_loc]
+    for routing_step in range(0, len(route)):
+        link = current_loc.getLink(route[routing_step])
+        if link is None:
+            return None
+        if routing_step == len(route)-1:
+            return link, prior_distance, passed
+        prior_distance += link.get_distance()
+        current_loc = link.endpoint
+        passed.append(current_loc)
+    return None
+
+
+class LocationRoutes:
+    """
+    The LocationRoutes class. Holds the location-generated routes of one location,
+    including the major routes, as found by calculateLocCrawlLinkWeight and
+    insertAllMajorRoutesAtLocation. All routes to the same endpoint share the
+    endpoint score, so which of them is kept only depends on their distance, and
+    the routes only need to be reweighted when location scores change.
+    """
+
+    def __init__(self, l):
+        self.origin = l
+        self.settings = LocationRoutes.getSettings()
+        self.touched = set([l])  # all locations visited while building the routes.
+        self.endpoints = []  # unique endpoint Location objects.
+        self.endpoint_links = []  # a link into each endpoint, to calculate its score.
+        endpoint_ids = {}
+
+        def endpoint_index(link):
+            k = endpoint_ids.get(id(link.endpoint), None)
+            if k is None:
+                k = len(self.endpoints)
+                endpoint_ids[id(link.endpoint)] = k
+                self.endpoints.append(link.endpoint)
+                self.endpoint_links.append(link)
+            return k
+
+        def add_route(best, link, distance, route, hub=None):
+            k = endpoint_index(link)
+            key = (hub, k)
+            factor = self.getDistanceFactor(distance)
+            if key not in best or factor > best[key][1]:
+                best[key] = [distance, factor, route]
+
+        # Regular routes, traversed as in calculateLocCrawlLinkWeight.
+        regular = {}
+
+        def crawl(link, prior_distance, origin_names, step):
+            self.touched.add(link.endpoint)
+            if link.endpoint.marker is False:
+                add_route(regular, link, prior_distance + link.get_distance(), origin_names[1:] + [link.endpoint.name])
+            if SimulationSettings.move_rules["AwarenessLevel"] > step:
+                for lel in link.endpoint.links:
+                    if lel.endpoint.name not in origin_names:
+                        crawl(lel, prior_distance + link.get_distance(), origin_names + [link.endpoint.name], step + 1)
+
+        for link in l.links:
+            crawl(link, 0.0, [l.name], 1)
+
+        # Major routes of the location itself, followed by those of every location
+        # that it has a route to (hubs), as in insertAllMajorRoutesAtLocation.
+        dest_names = set([l.name] + [self.endpoints[k].name for (_, k) in regular])
+        major = {}
+        self.unresolved = {}  # hub name -> routes that cannot be resolved.
+
+        def add_major_routes(hub, route_to_hub):
+            for mr in hub.major_routes:
+                if mr[-1] in dest_names:
+                    continue
+                route = route_to_hub + mr
+                resolved = _resolveMajorRoute(l, route)
+                if resolved is None:
+                    self.unresolved.setdefault(hub.name, []).append(route)
+                    continue
+                link, prior_distance, passed = resolved
+                self.touched.update(passed)
+                add_route(major, link, prior_distance + link.get_distance(), route[1:], hub=hub.name)
+
+        add_major_routes(l, [])
+        self.num_direct = len(regular) + len(major)  # number of routes that do not depend on a hub.
+
+        hubs = [(self.endpoints[k], r[2]) for (_, k), r in regular.items()]
+        hubs += [(self.endpoints[k], r[2]) for (_, k), r in major.items()]
+        for hub, route_to_hub in hubs:
+            add_major_routes(hub, route_to_hub)
+
+        entries = list(regular.items()) + list(major.items())
+        self.hubs = [hub for (hub, _), _ in entries]  # None for regular routes.
+        self.endpoint_index = np.array([k for (_, k), _ in entries], dtype=np.int64)
+        self.distance = np.array([r[0] for _, r in entries], dtype=np.float64)
+        self.routes = [r[2] for _, r in entries]
+
+    @staticmethod
+    def getSettings() -> tuple:
+        """
+        Summary:
+            Returns the settings that the kept routes depend on.
+
+        Args:
+            None.
+
+        Returns:
+            tuple: awareness level and distance weighting settings.
+        """
+        return (
+            SimulationSettings.move_rules["AwarenessLevel"],
+            SimulationSettings.move_rules["DistanceSoftening"],
+            SimulationSettings.move_rules["DistancePower"],
+            SimulationSettings.move_rules["WeightPower"],
+        )
+
+    def getDistanceFactor(self, distance: float) -> float:
+        """
+        Summary:
+            Returns the part of the route weight that depends on distance.
+
+        Args:
+            distance (float): total distance of the route.
+
+        Returns:
+            float: distance factor of the route weight.
+        """
+        return (1.0 / float(SimulationSettings.move_rules["DistanceSoftening"] + distance)**SimulationSettings.move_rules["DistancePower"])**SimulationSettings.move_rules["WeightPower"]
+
+    def getRoutes(self, time: int) -> dict:
+        """
+        Summary:
+            Calculates the routes dictionary of the location with the current endpoint scores.
+
+        Args:
+            time (int): current time step
+
+        Returns:
+            dict: endpoint name -> [weight, route, endpoint], as stored in Location.routes.
+        """
+        scores = np.array([float(getLocationCrawlEndPointScore(link=link, time=time)) for link in self.endpoint_links])
+        weights = ((float(SimulationSettings.move_rules["WeightSoftening"]) + scores[self.endpoint_index]) / (float(SimulationSettings.move_rules["DistanceSoftening"]) + self.distance)**SimulationSettings.move_rules["DistancePower"])**SimulationSettings.move_rules["WeightPower"]
+
+        routes = {}
+        entries = list(zip(self.hubs, self.endpoint_index.tolist(), weights.tolist(), self.routes))
+
+        # Regular routes and major routes of the location itself.
+        if self.origin.name in self.unresolved:
+            # Reports the error and exits, as without cached routes.
+            _addMajorRouteToLocation(self.origin, self.unresolved[self.origin.name][0], time)
+        for hub, k, weight, route in entries[:self.num_direct]:
+            if weight > routes.get(self.endpoints[k].name, [0,None])[0]:
+                routes[self.endpoints[k].name] = [weight, route, self.endpoints[k]]
+
+        # Major routes of the hubs that the location has a route to.
+        hubs = set(routes.keys())
+        for hub in self.unresolved:
+            if hub in hubs:
+                _addMajorRouteToLocation(self.origin, self.unresolved[hub][0], time)
+        for hub, k, weight, route in entries[self.num_direct:]:
+            if hub in hubs and weight > routes.get(self.endpoints[k].name, [0,None])[0]:
+                routes[self.endpoints[k].name] = [weight, route, self.endpoints[k]]
+
+        return routes
+
+
+@check_args_type
+def getLocationRoutes(l):
+  """
+  Summary:
+      Returns the cached location-generated routes of a location,
+      (re)building them if they were invalidated.
+
+  Args:
+      l (Location): origin location.
+
+  Returns:
+      LocationRoutes: cached routes of the location.
+  """
+  location_routes = l.location_routes
+  if location_routes is None or location_routes.settings != LocationRoutes.getSettings():
+      location_routes = LocationRoutes(l)
+      l.location_routes = location_routes
+      for loc in location_routes.touched:
+          loc.route_dependents.add(l)
+  return location_routes
+
+
 @check_args_type
 def generateLocationRoutes(l, time: int, debug: bool = False):
   """
@@ -259,16 +461,30 @@ def generateLocationRoutes(l, time: int, debug: bool = False):
     linklen = len(l.links)
     return [np.random.randint(0, linklen)]
 
-  for k, e in enumerate(l.links):
-    calculateLocCrawlLinkWeight(
-         l,
+  if SimulationSettings.move_rules["MaxRoutesPerOrigin"] > 0:
+    best = moving.calculateBestRoutes(
          l,
-         link=e,
-         prior_distance=0.0,
-         origin_names=[l.name],
-         step=1,
-         time=time,
+         endpoint_value=lambda link: (float(getLocationCrawlEndPointScore(link=link, time=time)), 1.0),
+         max_routes=SimulationSettings.move_rules["MaxRoutesPerOrigin"],
+         unique_endpoints=True,
+         count_markers=True,
     )
+    for weight, route, endpoint in best:
+      l.routes[endpoint.name] = [weight, route, endpoint]
+  elif SimulationSettings.optimisations.get("CachedFixedRoutes", True):
+    l.routes = getLocationRoutes(l).getRoutes(time)
+    return l.routes
+  else:
+    for k, e in enumerate(l.links):
+      calculateLocCrawlLinkWeight(
+           l,
+           l,
+           link=e,
+           prior_distance=0.0,
+           origin_names=[l.name],
+           step=1,
+           time=time,
+      )
 
   insertAllMajorRoutesAtLocation(l, time)
 
@@ -1,10 +1,14 @@
 import csv
+import hashlib
+import itertools
 import os
 import sys
 from datetime import datetime, timedelta
 from functools import wraps
+from typing import Optional
 
 import numpy as np
+from flee.SimulationSettings import SimulationSettings
 
 if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
     from beartype import beartype as check_args_type
@@ -127,37 +131,64 @@ def AddCSVTables(table1: np.ndarray, table2: np.ndarray) -> np.ndarray:
     Returns:
         np.ndarray: Description
     """
-    table = np.zeros([0, 2])
+    # Entries are collected in a list, and converted to a table once at the end.
+    table = []
 
+    days1 = table1[:, 0].tolist()
+    values1 = table1[:, 1].tolist()
     offset = 0
-    last_c2 = np.zeros(([1, 2]))
-    for c2 in table2:
+    last_c2 = 0.0
+    for day2, value2 in table2[:, :2].tolist():
 
         # If table 2 date value is higher, then keep adding entries from table
         # 1
-        while c2[0] > table1[offset][0]:
-            table = np.vstack([table, [table1[offset][0], last_c2[1] + table1[offset][1]]])
-            if offset < len(table1) - 1:
+        while day2 > days1[offset]:
+            table.append([days1[offset], last_c2 + values1[offset]])
+            if offset < len(days1) - 1:
                 offset += 1
             else:
                 break
 
         # If the two match, add a total.
-        if c2[0] == table1[offset][0]:
-            table = np.vstack([table, [c2[0], c2[1] + table1[offset][1]]])
-            if offset < len(table1) - 1:
+        if day2 == days1[offset]:
+            table.append([day2, value2 + values1[offset]])
+            if offset < len(days1) - 1:
                 offset += 1
-            last_c2 = c2
+            last_c2 = value2
             continue
 
         # If table 1 value is higher, add an aggregate entry, and go to the
         # next iteration without increasing the offset.
-        if c2[0] < table1[offset][0]:
-            table = np.vstack([table, [c2[0], c2[1] + table1[offset][1]]])
-            last_c2 = c2
+        if day2 < days1[offset]:
+            table.append([day2, value2 + values1[offset]])
+            last_c2 = value2
             continue
 
-    return table
+    return np.array(table, dtype=float).reshape(-1, 2)
+
+
+@check_args_type
+def _cache_file_name(csv_name: str, cache_directory: str, settings: list) -> str:
+    """
+    Returns the name of the .npz cache file of a CSV file. The name contains a hash of the
+    modification time and contents of the file, and of the settings used to convert it,
+    so that a changed file or different settings never use an old cache file.
+
+    Args:
+        csv_name (str): CSV file name
+        cache_directory (str): directory holding the cache files
+        settings (list): conversion settings
+
+    Returns:
+        str: cache file name
+    """
+    key = hashlib.sha1()
+    key.update(repr([os.path.abspath(csv_name), os.stat(csv_name).st_mtime_ns] + settings).encode("utf-8"))
+    with open(csv_name, "rb") as f:
+        key.update(hashlib.sha1(f.read()).digest())
+
+    name = os.path.splitext(os.path.basename(csv_name))[0]
+    return os.path.join(cache_directory, "{}-{}.npz".format(name, key.hexdigest()))
 
 
 @check_args_type
@@ -168,6 +199,7 @@ def ConvertCsvFileToNumPyTable(
     count_column: int = 1,
     start_date: str = "2012-02-29",
     population_scaledown_factor: int = 1,
+    cache_directory: str = "",
 ) -> np.ndarray:
     """
     Converts a CSV file to a table with date offsets from start_date.
@@ -177,37 +209,69 @@ def ConvertCsvFileToNumPyTable(
     Default settings:
     - subtract_dates is used on column 0.
     - Use # sign to comment out lines. (first line is NOT ignored by default)
+    - The file is read in one pass, and all dates are converted at once.
+    - If cache_directory is set, the table is stored there as a .npz file,
+      and read from it as long as the CSV file does not change.
     """
-    table = np.zeros([0, 2])
+    if len(cache_directory) > 0:
+        cache_name = _cache_file_name(
+            csv_name,
+            cache_directory,
+            [data_type, date_column, count_column, start_date, population_scaledown_factor],
+        )
+        if os.path.isfile(cache_name):
+            with np.load(cache_name) as cached:
+                return cached["table"]
+
+    dates = []
+    counts = []
 
     with open(csv_name, newline="", encoding="utf_8") as csvfile:
         values = csv.reader(csvfile)
 
         row = next(values)
 
-        if len(row) > 1:
-            if len(row[0]) > 0 and row[0] not in ["DateTime", "Date"]:
-                table = _processEntry(
-                    row=row,
-                    table=table,
-                    data_type=data_type,
-                    date_column=date_column,
-                    count_column=count_column,
-                    start_date=start_date,
-                    population_scaledown_factor=population_scaledown_factor,
-                )
+        # The first line is only skipped when it is a header.
+        if len(row) > 1 and (len(row[0]) == 0 or row[0] in ["DateTime", "Date"]):
+            row = []
+
+        for row in itertools.chain([row], values):
+            if len(row) < 2:
+                continue
+            if row[0][0] == "#":
+                continue
+            if row[1] == "":
+                continue
+            dates.append(row[date_column])
+            counts.append(row[count_column])
+
+    # Convert the dates to offsets in days relative to the start date.
+    days = None
+    if all(len(date) == 10 for date in dates):
+        try:
+            days = (np.array(dates, dtype="datetime64[D]") - np.datetime64(start_date, "D")).astype(np.int64)
+        except ValueError:
+            pass
+    if days is None:
+        # Dates that are not in the yyyy-mm-dd format (e.g. without leading zeros).
+        days = np.array([subtract_dates(date1=date, date2=start_date) for date in dates], dtype=np.int64)
 
-        for row in values:
-            table = _processEntry(
-                row=row,
-                table=table,
-                data_type=data_type,
-                date_column=date_column,
-                count_column=count_column,
-                start_date=start_date,
-                population_scaledown_factor=population_scaledown_factor,
-            )
+    if data_type == "int":
+        counts = np.array([int(count) for count in counts], dtype=np.int64) / population_scaledown_factor
+    else:
+        counts = np.array([float(count) for count in counts], dtype=float) / float(population_scaledown_factor)
 
+    table = np.zeros([len(days), 2])
+    table[:, 0] = days
+    table[:, 1] = counts
+
+    if len(cache_directory) > 0:
+        os.makedirs(cache_directory, exist_ok=True)
+        # Written under a temporary name first, as other runs may read the same cache.
+        tmp_name = "{}.{}.tmp".format(cache_name, os.getpid())
+        with open(tmp_name, "wb") as f:
+            np.savez(f, table=table)
+        os.replace(tmp_name, cache_name)
 
     return table
 
@@ -225,10 +289,14 @@ class DataTable:
         start_date: str = "2012-02-29",
         csvformat: str = "generic",
         population_scaledown_factor: int = 1,
-        start_empty: bool = False
+        start_empty: bool = False,
+        cache_directory: Optional[str] = None,
     ):
         """
         read in CSV data files containing refugee data.
+        cache_directory: directory for .npz copies of the converted CSV files (see
+        ConvertCsvFileToNumPyTable). Defaults to the data_cache optimisation setting,
+        where an empty string disables the cache.
         """
         self.total_refugee_column = 1
         self.days_column = 0
@@ -240,6 +308,9 @@ class DataTable:
         self.override_refugee_input_file = ""
         self.data_directory = data_directory
         self.population_scaledown_factor = population_scaledown_factor
+        if cache_directory is None:
+            cache_directory = SimulationSettings.optimisations.get("DataCache", "")
+        self.cache_directory = cache_directory
         self.day0pops = {}
         # if set to 1, then all files are corrected such that existing refugees
         # on Day 0 are left out of the simulation and the validation data.
@@ -263,6 +334,7 @@ class DataTable:
                         csv_name=os.path.join(data_directory, row[1]),
                         start_date=start_date,
                         population_scaledown_factor=population_scaledown_factor,
+                        cache_directory=cache_directory,
                     )
 
                     # The loop below is for rare cases where multiple CSV files need
@@ -275,6 +347,7 @@ class DataTable:
                                 csv_name=os.path.join(data_directory, added_csv),
                                 start_date=start_date,
                                 population_scaledown_factor=population_scaledown_factor,
+                                cache_directory=cache_directory,
                             ),
                         )
 
@@ -282,6 +355,72 @@ class DataTable:
 
 
         # print(self.header, self.data_table)
+        self._materialize()
+
+    @check_args_type
+    def _materialize(self) -> None:
+        """
+        Precomputes the interpolated and the raw value of every column for every day
+        from the first to the last day in the data, so that get_field, get_interpolated_data
+        and get_raw_data do not need to scan the tables. Before and after that period the
+        values stay constant, so lookups outside it use the day before or after it.
+        Needs to be called again whenever self.data_table or self.header change.
+        """
+        self.header_index = {}
+        for i in range(0, len(self.header)):
+            self.header_index.setdefault(self.header[i], i)
+        self.camp_columns = np.array(
+            [self.header_index[name] for name in self.header[1:]], dtype=np.int64
+        )
+
+        self.dense_columns = (self.days_column, self.total_refugee_column)
+        self.dense_valid = np.array([len(t) > 0 for t in self.data_table], dtype=bool)
+
+        days = [t[:, self.days_column] for t in self.data_table if len(t) > 0]
+        if len(days) == 0:
+            self.first_day = 0
+            self.num_days = 1
+        else:
+            # One extra day on either side, which holds the constant values outside the data.
+            self.first_day = int(np.floor(min(np.min(d) for d in days))) - 1
+            self.num_days = int(np.ceil(max(np.max(d) for d in days))) - self.first_day + 2
+
+        self.interpolated_table = np.zeros((len(self.data_table), self.num_days), dtype=np.int64)
+        self.raw_table = np.zeros((len(self.data_table), self.num_days), dtype=np.int64)
+
+        all_days = np.arange(self.first_day, self.first_day + self.num_days)
+        for column in range(0, len(self.data_table)):
+            if not self.dense_valid[column]:
+                continue
+            ref_days = self.data_table[column][:, self.days_column]
+            ref_vals = self.data_table[column][:, self.total_refugee_column]
+
+            # get_raw_data: value of the entry before the first entry that is later than the day.
+            # (running maxima make this equal to the first-match scan, also for unsorted dates)
+            later = np.searchsorted(np.maximum.accumulate(ref_days), all_days, side="right")
+            self.raw_table[column] = np.trunc(ref_vals[np.maximum(later - 1, 0)])
+
+            # get_interpolated_data: linear interpolation between the entry before and the
+            # first later entry (not counting the first entry), constant outside the data.
+            later = np.searchsorted(np.maximum.accumulate(ref_days[1:]), all_days, side="right") + 1
+            inside = (all_days > ref_days[0]) & (later < len(ref_days))
+            values = np.where(all_days <= ref_days[0], ref_vals[0], ref_vals[-1])
+            i = later[inside]
+            old_day = ref_days[i - 1]
+            old_val = ref_vals[i - 1]
+            fraction = (all_days[inside] - old_day) / (ref_days[i] - old_day)
+            values[inside] = old_val + fraction * (ref_vals[i] - old_val)
+            self.interpolated_table[column] = np.trunc(values)
+
+    @check_args_type
+    def _dense_day(self, day: int) -> int:
+        """
+        Returns the index of a day in the precomputed tables of _materialize,
+        or -1 if the tables were made for different day and count columns.
+        """
+        if (self.days_column, self.total_refugee_column) != self.dense_columns:
+            return -1
+        return min(max(day - self.first_day, 0), self.num_days - 1)
 
     @check_args_type
     def override_input(self, data_file_name: str) -> None:
@@ -301,8 +440,10 @@ class DataTable:
                 csv_name=data_file_name,
                 start_date=self.start_date,
                 population_scaledown_factor=self.population_scaledown_factor,
+                cache_directory=self.cache_directory,
             )
         )
+        self._materialize()
 
     @check_args_type
     def get_daily_difference(
@@ -378,7 +519,13 @@ class DataTable:
         else:
 
             new_refugees = 0
-            if SumFromCamps is True:
+            j = self._dense_day(day=day)
+            if SumFromCamps is True and j >= 0 and np.all(self.dense_valid[self.camp_columns]):
+                # Same as the loop below, as the day 0 offsets of get_field cancel out.
+                table = self.interpolated_table if FullInterpolation else self.raw_table
+                columns = self.camp_columns
+                new_refugees += int(np.sum(table[columns, j] - table[columns, self._dense_day(day=day - 1)]))
+            elif SumFromCamps is True:
                 for i in self.header[1:]:
                     new_refugees += self.get_field(
                         name=i, day=day, FullInterpolation=FullInterpolation
@@ -417,6 +564,10 @@ class DataTable:
         Returns:
             int: Description
         """
+        j = self._dense_day(day=day)
+        if j >= 0 and 0 <= column < len(self.dense_valid) and self.dense_valid[column]:
+            return int(self.interpolated_table[column, j])
+
         ref_table = self.data_table[column]
 
         old_val = ref_table[0, self.total_refugee_column]
@@ -461,6 +612,9 @@ class DataTable:
         Returns:
             int: Description
         """
+        j = self._dense_day(day=day)
+        if j >= 0 and 0 <= column < len(self.dense_valid) and self.dense_valid[column]:
+            return int(self.raw_table[column, j])
 
         ref_table = self.data_table[column]
 
@@ -486,9 +640,9 @@ class DataTable:
         Returns:
             int: Description
         """
-        for i in range(0, len(self.header)):
-            if self.header[i] == name:
-                return i
+        i = self.header_index.get(name, -1)
+        if i >= 0:
+            return i
 
         print(self.header, file=sys.stderr)
         sys.exit("Error: can't find the header %s in the header list" % (name))
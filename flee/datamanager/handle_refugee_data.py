@@ -87,6 +87,7 @@ class RefugeeTable(DataTable.DataTable):
                     ref_table[0:i, 1] *= first_level_2_value / last_level_1_value
                     # print(first_level_2_value, last_level_1_value, ref_table[0:i,1])
 
+        self._materialize()
         return float(first_level_2_value / last_level_1_value)
 
     @check_args_type
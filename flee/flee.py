@@ -1,10 +1,13 @@
 from __future__ import annotations, print_function
 
+import contextlib
 import copy
+import io
 import os
 import random
 import math
 import sys
+import traceback
 from typing import List, Optional, Tuple
 
 import numpy as np
@@ -13,6 +16,10 @@ from flee.SimulationSettings import SimulationSettings
 import flee.moving as moving
 import flee.spawning as spawning
 import flee.scoring as scoring
+import flee.checkpoint as checkpoint
+from flee.agentstore import AgentStore, AgentAttributes, CohortStore
+from flee.locationstore import LocationStore
+from flee.sampling import AliasTable
 
 if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
     from beartype import beartype as check_args_type
@@ -117,13 +124,13 @@ class Person:
         Returns:
             True if the destination camp is full, False otherwise.
         """
-        for i in range(0, len(e.locationNames)):
-            if e.locationNames[i] == self.route[-1]:
-                if e.locations[i].camp and moving.getCapMultiplier(e.locations[i],1) < 0.5:
-                    #print(e.time, e.locationNames[i], self.route[-1], file=sys.stderr)
-                    return True
-                else: 
-                    return False
+        i = e.locationIndex.get(self.route[-1], -1)
+        if i >= 0:
+            if e.locations[i].camp and moving.getCapMultiplier(e.locations[i],1) < 0.5:
+                #print(e.time, e.locationNames[i], self.route[-1], file=sys.stderr)
+                return True
+            else: 
+                return False
         print(f"Error: camp {self.route[-1]} not found in check_dest_is_full_camp", file=sys.stderr)
         sys.exit()
     
@@ -140,16 +147,20 @@ class Person:
             or `None` if the agent's route is empty 
             or the next link is invalid.
         """
-        for l in self.location.links:
-            # If the name of the destination on the current link is same as the agents current waypoint on the route:
-            if l.endpoint.name == self.route[0]:
-                # Check if the destination camp is full, flooded. If so, remove the route and return `None`.
-                if self.check_dest_is_full_camp(e):
-                    self.route = []
-                    return None
-                # Otherwise, remove the first link from the route and return the next link.
-                self.route = self.route[1:]
-                return l
+        # Find the link whose destination is the agents current waypoint on the route.
+        l = None
+        # At AwarenessLevel 0, selectRoute returns a link index instead of a location
+        # name. As in earlier versions, such a route does not match any link.
+        if self.route and isinstance(self.route[0], str):
+            l = self.location.getLink(self.route[0])
+        if l is not None:
+            # Check if the destination camp is full, flooded. If so, remove the route and return `None`.
+            if self.check_dest_is_full_camp(e):
+                self.route = []
+                return None
+            # Otherwise, remove the first link from the route and return the next link.
+            self.route = self.route[1:]
+            return l
 
         # Link has vanished, remove route.
         self.route = []
@@ -185,18 +196,35 @@ class Person:
 
             # If the outcome is less than the move chance, then the agent moves.
             if outcome < movechance:
-                # If the agent does not have an existing route, then plan a new route.
-                if len(self.route) == 0:
-                    # Determine which route to take
-                    self.route = moving.selectRoute(self, time=time)
+                self.follow_route(e, time=time)
 
-                # Attempt to follow route. Return None if fail.  
-                chosenDest = self.take_next_step(e)
 
-                # If there is a viable route to a different location, then move to the next location.
-                if chosenDest:
-                    # update location to link endpoint
-                    self.handle_travel(chosenDest, travelling=True)
+    @check_args_type
+    def follow_route(self, e, time: int) -> None:
+        """
+        Summary:
+            Moves the agent onto the next link of its route,
+            planning a new route first if it does not have one.
+
+        Args:
+            e: The ecosystem object.
+            time (int): The current simulation timestep.
+
+        Returns:
+            None.
+        """
+        # If the agent does not have an existing route, then plan a new route.
+        if len(self.route) == 0:
+            # Determine which route to take
+            self.route = moving.selectRoute(self, time=time, cache=e.route_cache)
+
+        # Attempt to follow route. Return None if fail.  
+        chosenDest = self.take_next_step(e)
+
+        # If there is a viable route to a different location, then move to the next location.
+        if chosenDest:
+            # update location to link endpoint
+            self.handle_travel(chosenDest, travelling=True)
 
 
     @check_args_type
@@ -285,6 +313,126 @@ class Person:
                         self.finish_travel(e, time=time)
 
 
+class PersonView(Person):
+    """
+    The PersonView class: a Person whose state lives in an AgentStore.
+    Used when the agent_engine optimisation is set to "arrays".
+    """
+
+    __slots__ = ["_store", "_i"]
+
+    def __init__(self, store, i: int):
+        """
+        Summary:
+            Creates a view on agent i in an AgentStore.
+            The agent itself is created with AgentStore.add().
+
+        Args:
+            store (AgentStore): The store holding the agent state.
+            i (int): The index of the agent in the store.
+
+        Returns:
+            None.
+        """
+        self._store = store
+        self._i = i
+
+    @property
+    def location(self):
+        return self._store.place_of(self._store.place[self._i])
+
+    @location.setter
+    def location(self, value):
+        self._store.place[self._i] = self._store.place_index(value)
+
+    @property
+    def home_location(self):
+        return self._store.place_of(self._store.home[self._i])
+
+    @home_location.setter
+    def home_location(self, value):
+        self._store.home[self._i] = self._store.place_index(value)
+
+    @property
+    def travelling(self):
+        return bool(self._store.travelling[self._i])
+
+    @travelling.setter
+    def travelling(self, value):
+        self._store.travelling[self._i] = value
+
+    @property
+    def distance_travelled_on_link(self):
+        return float(self._store.distance_travelled_on_link[self._i])
+
+    @distance_travelled_on_link.setter
+    def distance_travelled_on_link(self, value):
+        self._store.distance_travelled_on_link[self._i] = value
+
+    @property
+    def distance_moved_this_timestep(self):
+        return float(self._store.distance_moved_this_timestep[self._i])
+
+    @distance_moved_this_timestep.setter
+    def distance_moved_this_timestep(self, value):
+        self._store.distance_moved_this_timestep[self._i] = value
+
+    @property
+    def recent_travel_distance(self):
+        return float(self._store.recent_travel_distance[self._i])
+
+    @recent_travel_distance.setter
+    def recent_travel_distance(self, value):
+        self._store.recent_travel_distance[self._i] = value
+
+    @property
+    def distance_travelled(self):
+        return float(self._store.distance_travelled[self._i])
+
+    @distance_travelled.setter
+    def distance_travelled(self, value):
+        self._store.distance_travelled[self._i] = value
+
+    @property
+    def places_travelled(self):
+        return int(self._store.places_travelled[self._i])
+
+    @places_travelled.setter
+    def places_travelled(self, value):
+        self._store.places_travelled[self._i] = value
+
+    @property
+    def timesteps_since_departure(self):
+        return int(self._store.timesteps_since_departure[self._i])
+
+    @timesteps_since_departure.setter
+    def timesteps_since_departure(self, value):
+        self._store.timesteps_since_departure[self._i] = value
+
+    @property
+    def route(self):
+        return self._store.routes.get(self._i, [])
+
+    @route.setter
+    def route(self, value):
+        if value is None or len(value) > 0:
+            self._store.routes[self._i] = value
+        else:
+            self._store.routes.pop(self._i, None)
+
+    @property
+    def locations_visited(self):
+        return self._store.locations_visited.setdefault(self._i, [])
+
+    @locations_visited.setter
+    def locations_visited(self, value):
+        self._store.locations_visited[self._i] = value
+
+    @property
+    def attributes(self):
+        return AgentAttributes(self._store, self._i)
+
+
 class Location:
     """
     The Location class
@@ -324,12 +472,25 @@ class Location:
         Returns:
             None.
         """
+        # pop, conflict and time_of_conflict are written through to the LocationStore
+        # of the ecosystem, once the location has been added to one.
+        self.location_store = None
+        self.store_index = -1
+
         self.name = name
         self.region = region
         self.x = x
         self.y = y
         self.movechance = movechance
         self.links = []  # paths connecting to other towns
+        self.links_by_endpoint = {}  # endpoint name -> first link in self.links leading there.
+        # candidate routes within the awareness radius (see moving.getRouteCandidates),
+        # cached location-generated routes (see crawling.getLocationRoutes),
+        # and the locations whose candidate or cached routes pass through this location.
+        self.route_candidates = None
+        self.location_routes = None
+        self.route_dependents = set()
+        self.flood_forecast = None  # (time, forecast weight), see moving.getFloodForecast.
         self.routes = {}  # if Location-based routing is enabled, this will contain routes to other towns (may have multiple steps).
         self.major_routes = []  # paths connecting to other towns
         # paths connecting to other towns that are closed.
@@ -414,6 +575,40 @@ class Location:
         self.print()
 
 
+    @property
+    def pop(self):
+        return self._pop
+
+    @pop.setter
+    def pop(self, value):
+        self._pop = value
+        if self.location_store is not None:
+            self.location_store.pop[self.store_index] = value
+            self.location_store.changed = True
+
+    @property
+    def conflict(self):
+        return self._conflict
+
+    @conflict.setter
+    def conflict(self, value):
+        self._conflict = value
+        if self.location_store is not None:
+            self.location_store.conflict[self.store_index] = value
+            self.location_store.changed = True
+
+    @property
+    def time_of_conflict(self):
+        return self._time_of_conflict
+
+    @time_of_conflict.setter
+    def time_of_conflict(self, value):
+        self._time_of_conflict = value
+        if self.location_store is not None:
+            self.location_store.time_of_conflict[self.store_index] = value
+            self.location_store.changed = True
+
+
     @check_args_type
     def calculateDistance(self, other_location) -> float:
         """
@@ -457,6 +652,8 @@ class Location:
         Returns:
             None.
         """
+        if self.marker:
+            self.invalidateRouteCandidates()
         self.movechance = SimulationSettings.move_rules["CampMoveChance"]
         self.camp = True
         self.conflict = -1.0
@@ -497,6 +694,8 @@ class Location:
         Returns:
             None.
         """
+        if self.marker:
+            self.invalidateRouteCandidates()
         self.movechance = SimulationSettings.move_rules["DefaultMoveChance"]
         self.camp = False
         self.idpcamp = False
@@ -523,7 +722,7 @@ class Location:
 
 
     @check_args_type
-    def IncrementNumAgents(self, agent) -> None:
+    def IncrementNumAgents(self, agent, number: int = 1) -> None:
         """
         Summary: 
             Increments the number of agents in the location.
@@ -532,11 +731,85 @@ class Location:
             agent: The agent to add to the location. 
             Needed to specify which agent is being added to the location, 
             because there may be multiple agents in a location.
+            number (int, optional): The number of agents added. Defaults to 1.
 
         Returns:
             None.
         """
-        self.numAgents += 1
+        self.numAgents += number
+
+
+    @check_args_type
+    def addLink(self, link) -> None:
+        """
+        Summary:
+            Adds an outgoing link to the location.
+
+        Args:
+            link (Link): The link to add.
+
+        Returns:
+            None.
+        """
+        self.links.append(link)
+        self.links_by_endpoint.setdefault(link.endpoint.name, link)
+        self.invalidateRouteCandidates()
+
+
+    @check_args_type
+    def getLink(self, endpoint_name: str):
+        """
+        Summary:
+            Finds the (first) outgoing link leading to a given endpoint.
+
+        Args:
+            endpoint_name (str): The name of the endpoint location.
+
+        Returns:
+            Link: The link to the endpoint, or None if there is no such link.
+        """
+        return self.links_by_endpoint.get(endpoint_name, None)
+
+
+    @check_args_type
+    def updateLinkIndex(self) -> None:
+        """
+        Summary:
+            Rebuilds the endpoint name to link map,
+            after links have been removed, closed or reopened.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        self.links_by_endpoint = {}
+        for link in self.links:
+            self.links_by_endpoint.setdefault(link.endpoint.name, link)
+        self.invalidateRouteCandidates()
+
+
+    @check_args_type
+    def invalidateRouteCandidates(self) -> None:
+        """
+        Summary:
+            Discards the precomputed candidate routes and cached location-generated
+            routes of all locations whose routes include this location. Needs to be
+            called whenever the links or the marker status of the location change.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        for loc in self.route_dependents:
+            loc.route_candidates = None
+            loc.location_routes = None
+        self.route_dependents = set()
+        self.route_candidates = None
+        self.location_routes = None
 
 
     @check_args_type
@@ -625,6 +898,22 @@ class Location:
         return self.scores[index]
 
 
+    @staticmethod
+    def getScores(locations, index: int) -> np.ndarray:
+        """
+        Summary:
+            Gets the score at the specified index for a list of locations.
+
+        Args:
+            locations (List[Location]): The locations to get the scores of.
+            index (int): The index of the score to get.
+
+        Returns:
+            np.ndarray: The score of every location.
+        """
+        return np.array([loc.scores[index] for loc in locations], dtype=np.float64)
+
+
     @check_args_type
     def setScore(self, index: int, value: float) -> None:
         """
@@ -779,6 +1068,11 @@ class Ecosystem:
     The Ecosystem class
     """
 
+    # Attributes that are not stored in checkpoints and snapshots.
+    _checkpoint_exclude = []
+    # Whether fork_scenarios can run branches in forked processes.
+    _can_fork = True
+
     @check_args_type
     def __init__(self):
         """
@@ -793,19 +1087,181 @@ class Ecosystem:
         """
         self.locations = []
         self.locationNames = []
-        self.agents = []
+        self.locationIndex = {}  # location name -> index in self.locations.
+        self.agents = self._create_agent_store()
+        self.route_cache = self._create_route_cache()
         self.closures = []  # format [type, source, dest, start, end]
+        self.closure_schedule = None  # closures by day, see _schedule_closures.
         self.time = 0
         self.print_location_output = True  # print location output data
 
         # FLEE3 does not have a conflict zone list, and spawn weights cover all locations.
-        self.spawn_weights = np.array([])
+        self.location_store = LocationStore()
+        self.spawn_sampler = None  # alias table for the current spawn weights.
 
         if SimulationSettings.log_levels["camp"] > 0:
             self.num_arrivals = []  # one element per time step.
             self.travel_durations = []  # one element per time step.
 
 
+    @property
+    def spawn_weights(self) -> np.ndarray:
+        """
+        Summary:
+            Returns the spawn weight of every location, as calculated by
+            spawning.refresh_spawn_weights.
+
+        Args:
+            None.
+
+        Returns:
+            np.ndarray: spawn weights, in the order of self.locations.
+        """
+        return self.location_store.spawn_weights
+
+
+    @check_args_type
+    def _register_location(self, loc) -> None:
+        """
+        Summary:
+            Appends a new location to the ecosystem, its name index and the location store.
+            Location names must be unique, as locations are looked up by name.
+
+        Args:
+            loc (Location): The location to register.
+
+        Returns:
+            None.
+        """
+        if loc.name in self.locationIndex:
+            print("Error: a location named {} already exists.".format(loc.name), file=sys.stderr)
+            sys.exit()
+
+        self.locations.append(loc)
+        self.locationIndex[loc.name] = len(self.locationNames)
+        self.locationNames.append(loc.name)
+        loc.store_index = self.location_store.add(loc)
+        loc.location_store = self.location_store
+
+
+    @check_args_type
+    def _create_agent_store(self):
+        """
+        Summary:
+            Creates the container for the agents, depending on the
+            agent_engine optimisation setting.
+
+        Args:
+            None.
+
+        Returns:
+            list or AgentStore: a list of Person objects ("objects"),
+            a struct-of-arrays AgentStore ("arrays"), or a CohortStore ("cohorts").
+        """
+        engine = SimulationSettings.optimisations.get("AgentEngine", "objects")
+        if engine == "arrays":
+            return AgentStore(view_class=PersonView)
+        if engine == "cohorts":
+            self._check_cohort_settings()
+            return CohortStore(view_class=PersonView)
+        return []
+
+
+    @staticmethod
+    def _check_cohort_settings() -> None:
+        """
+        Summary:
+            Stops the simulation if the cohorts agent engine is combined with
+            settings that depend on the history of individual agents. Agents that
+            rejoin a cohort lose their home location, distance travelled, recent
+            travel distance and time since departure (see CohortStore.merge).
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        incompatible = []
+        if SimulationSettings.move_rules["AvoidShortStints"]:
+            incompatible.append("avoid_short_stints")
+        if SimulationSettings.log_levels["agent"] > 0:
+            incompatible.append("agent logging")
+        if SimulationSettings.log_levels["camp"] > 0:
+            incompatible.append("camp logging")
+
+        if len(incompatible) > 0:
+            print(
+                "ERROR: agent_engine cohorts cannot be combined with {}, as agents lose their individual "
+                "history when they rejoin a cohort. Use agent_engine arrays instead.".format(", ".join(incompatible)),
+                file=sys.stderr,
+            )
+            sys.exit()
+
+
+    @check_args_type
+    def _create_route_cache(self):
+        """
+        Summary:
+            Creates the per time step cache of route distributions,
+            depending on the route_cache optimisation setting.
+
+        Args:
+            None.
+
+        Returns:
+            RouteCache or None: the route cache, or None if it is disabled.
+        """
+        if SimulationSettings.optimisations.get("RouteCache", False):
+            return moving.RouteCache()
+        return None
+
+
+    @check_args_type
+    def _append_agent(self, location, attributes) -> None:
+        """
+        Summary:
+            Creates a new agent at a location and appends it to the agent container.
+
+        Args:
+            location (Location): The location to add the agent to.
+            attributes (dict): A dictionary of attributes for the agent.
+
+        Returns:
+            None.
+        """
+        if isinstance(self.agents, AgentStore):
+            self.agents.add(location, attributes)
+        else:
+            self.agents.append(Person(location=location, attributes=attributes))
+
+
+    @check_args_type
+    def _append_agents(self, location, number: int, attributes=None) -> None:
+        """
+        Summary:
+            Creates a number of new agents at a location and appends them
+            to the agent container in one operation.
+
+        Args:
+            location (Location): The location to add the agents to.
+            number (int): The number of agents to add.
+            attributes (optional): Attributes for every agent, or a function that returns
+                the attributes for a given number of agents. Defaults to no attributes.
+
+        Returns:
+            None.
+        """
+        if callable(attributes):
+            attributes = attributes(number)
+        if isinstance(self.agents, AgentStore):
+            self.agents.add_many(location, number, attributes)
+        else:
+            if attributes is None:
+                attributes = [{} for _ in range(0, number)]
+            self.agents.extend([Person(location=location, attributes=a) for a in attributes])
+
+
     @check_args_type
     def get_camp_names(self) -> List[str]:
         """
@@ -890,7 +1346,8 @@ class Ecosystem:
         Summary: 
             Enacts border closures, location closures, link closures,
             camp closures, and forced redirection removals according 
-            to the list of closures provided.
+            to the list of closures provided. Only the closures that start
+            or end at the given time are processed (see _schedule_closures).
 
         Args:
             time (int): The current time.
@@ -901,47 +1358,69 @@ class Ecosystem:
             None.
         """
         # print("Enact border closures: ", self.closures)
-        if len(self.closures) > 0:
-            for c in self.closures:
-                if time == c[3]:
-                    if c[0] == "country":
-                        if Debug:
-                            print(
-                                "Time = {}. Closing Border between "
-                                "[{}] and [{}]".format(time, c[1], c[2]),
-                                file=sys.stderr,
-                            )
-                        self.close_border(source_country=c[1], dest_country=c[2], twoway=twoway)
-                    elif c[0] == "location":
-                        self.close_location(location_name=c[1], twoway=twoway)
-                    elif c[0] == "link":
-                        self.close_link(startpoint=c[1], endpoint=c[2], twoway=twoway)
-                    elif c[0] == "camp":
-                        self.close_camp(c[1], IDP=False)
-                    elif c[0] == "idpcamp":
-                        self.close_camp(c[1], IDP=True)
-                    elif c[0] == "remove_forced_redirection":
-                        self.set_forced_redirection(c[1], c[2], False)
-
-                if time == c[4]:
-                    if c[0] == "country":
-                        if Debug:
-                            print(
-                                "Time = {}. Reopening Border between "
-                                "[{}] and [{}]".format(time, c[1], c[2]),
-                                file=sys.stderr,
-                            )
-                        self.reopen_border(source_country=c[1], dest_country=c[2], twoway=twoway)
-                    elif c[0] == "location":
-                        self.reopen_location(location_name=c[1], twoway=twoway)
-                    elif c[0] == "link":
-                        self.reopen_link(startpoint=c[1], endpoint=c[2], twoway=twoway)
-                    elif c[0] == "camp":
-                        self.open_camp(c[1], IDP=False)
-                    elif c[0] == "idpcamp":
-                        self.open_camp(c[1], IDP=True)
-                    elif c[0] == "remove_forced_redirection":
-                        self.set_forced_redirection(c[1], c[2], True)
+        if self.closure_schedule is None or self.closure_schedule[0] is not self.closures or self.closure_schedule[1] != len(self.closures):
+            self._schedule_closures()
+
+        for c, reopen in self.closure_schedule[2].get(time, []):
+            if not reopen:
+                if c[0] == "country":
+                    if Debug:
+                        print(
+                            "Time = {}. Closing Border between "
+                            "[{}] and [{}]".format(time, c[1], c[2]),
+                            file=sys.stderr,
+                        )
+                    self.close_border(source_country=c[1], dest_country=c[2], twoway=twoway)
+                elif c[0] == "location":
+                    self.close_location(location_name=c[1], twoway=twoway)
+                elif c[0] == "link":
+                    self.close_link(startpoint=c[1], endpoint=c[2], twoway=twoway)
+                elif c[0] == "camp":
+                    self.close_camp(c[1], IDP=False)
+                elif c[0] == "idpcamp":
+                    self.close_camp(c[1], IDP=True)
+                elif c[0] == "remove_forced_redirection":
+                    self.set_forced_redirection(c[1], c[2], False)
+            else:
+                if c[0] == "country":
+                    if Debug:
+                        print(
+                            "Time = {}. Reopening Border between "
+                            "[{}] and [{}]".format(time, c[1], c[2]),
+                            file=sys.stderr,
+                        )
+                    self.reopen_border(source_country=c[1], dest_country=c[2], twoway=twoway)
+                elif c[0] == "location":
+                    self.reopen_location(location_name=c[1], twoway=twoway)
+                elif c[0] == "link":
+                    self.reopen_link(startpoint=c[1], endpoint=c[2], twoway=twoway)
+                elif c[0] == "camp":
+                    self.open_camp(c[1], IDP=False)
+                elif c[0] == "idpcamp":
+                    self.open_camp(c[1], IDP=True)
+                elif c[0] == "remove_forced_redirection":
+                    self.set_forced_redirection(c[1], c[2], True)
+
+
+    @check_args_type
+    def _schedule_closures(self) -> None:
+        """
+        Summary:
+            Compiles self.closures into a dictionary of (closure, reopen) events
+            per day. It is compiled again when self.closures is replaced or
+            extended.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        schedule = {}
+        for c in self.closures:
+            schedule.setdefault(c[3], []).append((c, False))
+            schedule.setdefault(c[4], []).append((c, True))
+        self.closure_schedule = (self.closures, len(self.closures), schedule)
 
 
     @check_args_type
@@ -956,15 +1435,8 @@ class Ecosystem:
         Returns:
             int: The index of the location in the `locations` list, or -1 if the location is not found.
         """
-        x = -1
         # Convert name "startpoint" to index "x".
-        for i, loc in enumerate(self.locations):
-            if loc.name == name:
-                x = i
-
-        # for i in range(0, len(self.locations)):
-        #     if self.locations[i].name == name:
-        #         x = i
+        x = self.locationIndex.get(name, -1)
 
         if x < 0:
             print("#Warning: location not found in remove_link", file=sys.stderr)
@@ -1015,6 +1487,7 @@ class Ecosystem:
             removed = True
 
         self.locations[x].links = new_links
+        self.locations[x].updateLinkIndex()
         if not removed:
             print(
                 "Warning: cannot remove link from {}, "
@@ -1066,6 +1539,7 @@ class Ecosystem:
                 reopened = True
 
         self.locations[x].closed_links = new_closed_links
+        self.locations[x].updateLinkIndex()
         if not reopened:
             print(
                 "Warning: cannot reopen link from {},"
@@ -1180,67 +1654,67 @@ class Ecosystem:
         )
         changed_anything = False
 
-        for i in range(0, len(self.locationNames)):
-            if self.locationNames[i] == location_name:
-                changed_anything = True
-
-                link_set = self.locations[i].links
-                if mode == "reopen":
-                    link_set = self.locations[i].closed_links
+        i = self.locationIndex.get(location_name, -1)
+        if i >= 0:
+            changed_anything = True
+
+            link_set = self.locations[i].links
+            if mode == "reopen":
+                link_set = self.locations[i].closed_links
+
+            j = 0
+            while j < len(link_set):
+                if Debug:
+                    print(
+                        "starting to {} link "
+                        "[{}] [{}] in direction {}".format(
+                            mode, location_name, link_set[j].endpoint.name, direction
+                        ),
+                        file=sys.stderr,
+                    )
+                if mode == "close":
+
+                    if dir_mode % 2 == 0:
+                        self.close_link(
+                            startpoint=link_set[j].endpoint.name,
+                            endpoint=self.locationNames[i],
+                            twoway=False,
+                        )
 
-                j = 0
-                while j < len(link_set):
-                    if Debug:
-                        print(
-                            "starting to {} link "
-                            "[{}] [{}] in direction {}".format(
-                                mode, location_name, link_set[j].endpoint.name, direction
-                            ),
-                            file=sys.stderr,
+                    if dir_mode > 0:
+                        if self.close_link(
+                            startpoint=self.locationNames[i],
+                            endpoint=link_set[j].endpoint.name,
+                            twoway=False,
+                        ):
+                            # shrink the link list. # This operation
+                            # affects the overall loop, so no major
+                            # operations should take place after this.
+                            link_set = self.locations[i].links
+                    else:
+                        j += 1
+
+                elif mode == "reopen":
+
+                    if dir_mode % 2 == 0:
+                        self.reopen_link(
+                            startpoint=link_set[j].endpoint.name,
+                            endpoint=self.locationNames[i],
+                            twoway=False,
                         )
-                    if mode == "close":
 
-                        if dir_mode % 2 == 0:
-                            self.close_link(
-                                startpoint=link_set[j].endpoint.name,
-                                endpoint=self.locationNames[i],
-                                twoway=False,
-                            )
-
-                        if dir_mode > 0:
-                            if self.close_link(
-                                startpoint=self.locationNames[i],
-                                endpoint=link_set[j].endpoint.name,
-                                twoway=False,
-                            ):
-                                # shrink the link list. # This operation
-                                # affects the overall loop, so no major
-                                # operations should take place after this.
-                                link_set = self.locations[i].links
-                        else:
-                            j += 1
-
-                    elif mode == "reopen":
-
-                        if dir_mode % 2 == 0:
-                            self.reopen_link(
-                                startpoint=link_set[j].endpoint.name,
-                                endpoint=self.locationNames[i],
-                                twoway=False,
-                            )
-
-                        if dir_mode > 0:
-                            if self.reopen_link(
-                                startpoint=self.locationNames[i],
-                                endpoint=link_set[j].endpoint.name,
-                                twoway=False,
-                            ):
-                                # shrink the closed link list. # This operation
-                                # affects the overall loop, so no major
-                                # operations should take place after this.
-                                link_set = self.locations[i].closed_links
-                            else:
-                                j += 1
+                    if dir_mode > 0:
+                        if self.reopen_link(
+                            startpoint=self.locationNames[i],
+                            endpoint=link_set[j].endpoint.name,
+                            twoway=False,
+                        ):
+                            # shrink the closed link list. # This operation
+                            # affects the overall loop, so no major
+                            # operations should take place after this.
+                            link_set = self.locations[i].closed_links
+                        else:
+                            j += 1
 
         return changed_anything
 
@@ -1400,6 +1874,9 @@ class Ecosystem:
 
         l = self.locations[self._convert_location_name_to_index(location_name)]
 
+        # Marker locations are skipped in route candidates, so these may change.
+        l.invalidateRouteCandidates()
+
         l.town = False
         l.camp = False
         l.idpcamp = False
@@ -1550,20 +2027,20 @@ class Ecosystem:
         Returns:
             None.
         """
-        for i in range(0, len(self.locationNames)):
-            if self.locationNames[i] == name:
-                if change_movechance:
-                    self.locations[i].movechance = SimulationSettings.move_rules["ConflictMoveChance"]
-                    self.locations[i].conflict = conflict_intensity
-                    self.locations[i].town = False
+        i = self.locationIndex.get(name, -1)
+        if i >= 0:
+            if change_movechance:
+                self.locations[i].movechance = SimulationSettings.move_rules["ConflictMoveChance"]
+                self.locations[i].conflict = conflict_intensity
+                self.locations[i].town = False
 
-                self.locations[i].time_of_conflict = self.time                  
-                spawning.refresh_spawn_weights(self)
+            self.locations[i].time_of_conflict = self.time                  
+            spawning.refresh_spawn_weights(self)
 
-                if SimulationSettings.log_levels["init"] > 0:
-                    print("Added conflict zone: {}, pop. {}, intensity: {}".format(name, self.locations[i].pop, conflict_intensity), file=sys.stderr)
-                    print("New total spawn weight: ", sum(self.spawn_weights), file=sys.stderr)
-                return
+            if SimulationSettings.log_levels["init"] > 0:
+                print("Added conflict zone: {}, pop. {}, intensity: {}".format(name, self.locations[i].pop, conflict_intensity), file=sys.stderr)
+                print("New total spawn weight: ", sum(self.spawn_weights), file=sys.stderr)
+            return
 
         print("Diagnostic: self.locationNames: ", self.locationNames, file=sys.stderr)
         print(
@@ -1589,12 +2066,12 @@ class Ecosystem:
             None.
         """
         
-        for i in range(0, len(self.locationNames)):
-            if self.locationNames[i] == name:
-                if change_movechance:
-                    self.locations[i].movechance = SimulationSettings.move_rules["DefaultMoveChance"]
-                self.locations[i].conflict = -1.0
-                self.locations[i].town = True
+        i = self.locationIndex.get(name, -1)
+        if i >= 0:
+            if change_movechance:
+                self.locations[i].movechance = SimulationSettings.move_rules["DefaultMoveChance"]
+            self.locations[i].conflict = -1.0
+            self.locations[i].town = True
 
         spawning.refresh_spawn_weights(self)
 
@@ -1634,15 +2111,13 @@ class Ecosystem:
         Returns:
             list[Location]: A list of unique locations.
         """
-        spawn_weight_total = sum(self.spawn_weights)
+        # Spawn weights usually change once per time step, so the alias table
+        # is only rebuilt when they differ from those it was built with.
+        if self.spawn_sampler is None or not np.array_equal(self.spawn_sampler.weights, self.spawn_weights):
+            assert sum(self.spawn_weights) > 0
+            self.spawn_sampler = AliasTable(self.spawn_weights)
 
-        assert spawn_weight_total > 0
-
-        wgt = self.spawn_weights / spawn_weight_total
-
-        return np.random.choice(
-            self.locations, number, p=wgt
-        ).tolist()
+        return [self.locations[i] for i in self.spawn_sampler.draw_many(number)]
 
 
     @check_args_type
@@ -1664,24 +2139,251 @@ class Ecosystem:
             loc.routes = {}
             scoring.updateLocationScore(self.time, loc)
 
+        if self.route_cache is not None:
+            self.route_cache.clear()
+
+        self._update_flood_forecasts()
+
         # update agent locations
+        self._evolve_agents()
+
+        self._finish_agent_travel()
+
+        if SimulationSettings.log_levels["agent"] > 0:
+            write_agents(agents=self.agents, time=self.time)
+
+        if SimulationSettings.log_levels["link"] > 0:
+            write_links(locations=self.locations, time=self.time)
+
+        self._update_recent_travel()
+
+        # update link properties
+        if SimulationSettings.log_levels["camp"] > 0:
+            self._aggregate_arrivals()
+
+        # Deactivate agents in camps with a certain probability.
+        if SimulationSettings.spawn_rules["camps_are_sinks"] == True:
+            self._deactivate_agents_in_camps()
+
+        self.time += 1
+
+
+    @check_args_type
+    def _evolve_agents(self) -> None:
+        """
+        Summary:
+            Lets every agent with a location decide whether to move,
+            and start moving along its route if so.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        if isinstance(self.agents, CohortStore):
+            # Agents that stopped travelling rejoin their cohort, and agents
+            # still following a route are evolved individually.
+            self.agents.merge()
+            self._evolve_agent_store()
+            self._evolve_cohorts()
+            return
+
+        if isinstance(self.agents, AgentStore):
+            self._evolve_agent_store()
+            return
+
         for a in self.agents:
             if SimulationSettings.log_levels["agent"] > 1:
                 a.locations_visited = []
             if a.location is not None:
                 a.evolve(self, time=self.time)
 
+
+    @check_args_type
+    def _evolve_agent_store(self) -> None:
+        """
+        Summary:
+            Batched version of _evolve_agents for the "arrays" agent engine.
+            Move chances only depend on the location (and on the flood awareness
+            of the agent), so they are calculated once per location, and all move
+            outcomes are drawn with a single vectorized call. Only the agents
+            that move go through route selection.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        store = self.agents
+        n = store.size
+
+        if SimulationSettings.log_levels["agent"] > 1:
+            store.locations_visited = {}
+
+        place = store.place[:n]
+        candidates = np.flatnonzero((place >= 0) & ~store.travelling[:n])
+        if len(candidates) == 0:
+            return
+
+        movechances, forecast, has_forecast = self._place_move_chances()
+        candidate_places = place[candidates]
+        candidate_movechances = movechances[candidate_places]
+
+        if np.any(has_forecast):
+            selected = np.flatnonzero(has_forecast[candidate_places])
+            awareness = store.attribute_values(
+                "floodawareness",
+                lambda v: float(SimulationSettings.move_rules["FloodAwarenessWeights"][int(v)]),
+                candidates[selected],
+            )
+            candidate_movechances[selected] *= forecast[candidate_places[selected]] * awareness
+
+        outcome = np.random.random(len(candidates))
+
+        for i in candidates[outcome < candidate_movechances]:
+            store.view(i).follow_route(self, time=self.time)
+
+
+    @check_args_type
+    def _update_flood_forecasts(self) -> None:
+        """
+        Summary:
+            Calculates the flood forecast weight of every location for the current
+            time step, so that move chances and endpoint scores only need to multiply
+            it with the flood awareness weight of each agent.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        if SimulationSettings.move_rules["FloodRulesEnabled"] is True and SimulationSettings.move_rules["FloodForecaster"] is True:
+            for loc in self.locations:
+                loc.flood_forecast = (self.time, moving.calculateFloodForecast(loc, self.time))
+
+
+    @check_args_type
+    def _place_move_chances(self):
+        """
+        Summary:
+            Calculates the move chance of every place registered in the agent store.
+
+        Args:
+            None.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: move chances, flood forecast
+            factors, and whether a forecast applies, with one element per registered
+            place plus a last element for agents without a place.
+        """
+        location_chances = [
+            (0.0, None) if isinstance(p, Link) else moving.calculateLocationMoveChance(p, self.time)
+            for p in self.agents.places
+        ]
+        movechances = np.array([c[0] for c in location_chances] + [0.0])
+        forecast = np.array([1.0 if c[1] is None else c[1] for c in location_chances] + [1.0])
+        has_forecast = np.array([c[1] is not None for c in location_chances] + [False])
+        return movechances, forecast, has_forecast
+
+
+    @check_args_type
+    def _evolve_cohorts(self) -> None:
+        """
+        Summary:
+            Evolves the cohorts of the "cohorts" agent engine. The number of movers
+            in each cohort is drawn from a binomial distribution, and their routes
+            from a multinomial distribution over the route weights of the cohort.
+            Only the movers are materialised as individual agents.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        store = self.agents
+        nc = store.num_cohorts
+        active = np.flatnonzero((store.cohort_place[:nc] >= 0) & (store.cohort_count[:nc] > 0))
+        if len(active) == 0:
+            return
+
+        movechances, forecast, has_forecast = self._place_move_chances()
+        active_places = store.cohort_place[active]
+        active_movechances = movechances[active_places]
+
+        if np.any(has_forecast):
+            selected = np.flatnonzero(has_forecast[active_places])
+            awareness = store.class_values(
+                "floodawareness",
+                lambda v: float(SimulationSettings.move_rules["FloodAwarenessWeights"][int(v)]),
+                active[selected],
+            )
+            active_movechances[selected] *= forecast[active_places[selected]] * awareness
+
+        movers = np.random.binomial(store.cohort_count[active], np.clip(active_movechances, 0.0, 1.0))
+
+        for k, number in zip(active[movers > 0], movers[movers > 0]):
+            indices = store.materialise(k, number)
+
+            if SimulationSettings.move_rules["AwarenessLevel"] > 0:
+                if self.route_cache is not None:
+                    routes, weights, _ = self.route_cache.getDistribution(store.view(indices[0]), time=self.time)
+                else:
+                    weights, routes = moving.getRouteDistribution(store.view(indices[0]), time=self.time)
+                if len(routes) > 0:
+                    counts = np.random.multinomial(len(indices), moving.normalizeWeights(weights))
+                    for i, r in zip(indices, np.repeat(np.arange(len(routes)), counts)):
+                        store.routes[int(i)] = routes[r]
+
+            for i in indices:
+                store.view(i).follow_route(self, time=self.time)
+
+
+    @check_args_type
+    def _finish_agent_travel(self) -> None:
+        """
+        Summary:
+            Completes the travel of all agents on links for this time step,
+            and advances the timesteps_since_departure counters.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        if isinstance(self.agents, AgentStore):
+            # finish_travel() only affects agents that reside on a link.
+            for i in self.agents.travelling_indices():
+                self.agents.view(i).finish_travel(self, time=self.time)
+            self.agents.increment_timesteps_since_departure()
+            return
+
         for a in self.agents:
             if a.location is not None:
                 a.finish_travel(self, time=self.time)
                 a.timesteps_since_departure += 1
-        
 
-        if SimulationSettings.log_levels["agent"] > 0:
-            write_agents(agents=self.agents, time=self.time)
 
-        if SimulationSettings.log_levels["link"] > 0:
-            write_links(locations=self.locations, time=self.time)
+    @check_args_type
+    def _update_recent_travel(self) -> None:
+        """
+        Summary:
+            Updates the recent_travel_distance of all agents,
+            and resets the distance they moved this time step.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        if isinstance(self.agents, AgentStore):
+            self.agents.update_recent_travel(SimulationSettings.move_rules["MaxMoveSpeed"])
+            return
 
         for a in self.agents:
             a.recent_travel_distance = (
@@ -1690,21 +2392,31 @@ class Ecosystem:
             ) / 2.0
             a.distance_moved_this_timestep = 0
 
-        # update link properties
-        if SimulationSettings.log_levels["camp"] > 0:
-            self._aggregate_arrivals()
 
-        # Deactivate agents in camps with a certain probability.
-        if SimulationSettings.spawn_rules["camps_are_sinks"] == True:
-            for a in self.agents:
-                if a.travelling == False:
-                    if a.location is not None:
-                        if a.location.camp == True:
-                            outcome = random.random()
-                            if outcome < a.location.attributes.get("deactivation_probability", 0.0):
-                                a.location = None
+    @check_args_type
+    def _deactivate_agents_in_camps(self) -> None:
+        """
+        Summary:
+            Removes agents residing in camps from the simulation,
+            using the deactivation_probability attribute of each camp.
 
-        self.time += 1
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        if isinstance(self.agents, AgentStore):
+            self.agents.deactivate_in_camps()
+            return
+
+        for a in self.agents:
+            if a.travelling == False:
+                if a.location is not None:
+                    if a.location.camp == True:
+                        outcome = random.random()
+                        if outcome < a.location.attributes.get("deactivation_probability", 0.0):
+                            a.location = None
 
 
     @check_args_type
@@ -1759,9 +2471,7 @@ class Ecosystem:
         if SimulationSettings.log_levels["init"] > 0 and self.print_location_output:
             print("Location:", name, x, y, loc.movechance, capacity, ", pop. ", pop, foreign, ", attrib. ", attributes, file=sys.stderr)
 
-        self.locations.append(loc)
-        self.spawn_weights = np.append(self.spawn_weights, [0.0])
-        self.locationNames.append(loc.name)
+        self._register_location(loc)
 
         spawning.refresh_spawn_weights(self)
         return loc
@@ -1791,7 +2501,43 @@ class Ecosystem:
                 location.print()
             location.numAgentsSpawned += 1
 
-        self.agents.append(Person(location=location, attributes=attributes))
+        self._append_agent(location=location, attributes=attributes)
+
+
+    @check_args_type
+    def addAgents(self, location, number: int, attributes=None) -> None:
+        """
+        Summary: 
+            Adds a number of agents to the simulation at the specified location,
+            with the same effect as calling addAgent for each of them.
+
+        Args:
+            location (Location): The location to add the agents to.
+            number (int): The number of agents to add.
+            attributes (optional): A list with a dictionary of attributes for every agent,
+                or a function that returns such a list for a given number of agents.
+                Defaults to no attributes.
+
+        Returns:
+            None.
+        """
+        if number < 1:
+            return
+
+        if SimulationSettings.spawn_rules["TakeFromPopulation"]:
+            taken = 0
+            if location.pop > 0:
+                taken = min(number, int(math.ceil(location.pop)))
+            location.pop -= taken
+            if taken < number:
+                print(
+                    "WARNING: Number of agents in the simulation is larger than the"
+                    "population of the conflict zone ({} agents).".format(number - taken)
+                )
+                location.print()
+            location.numAgentsSpawned += number
+
+        self._append_agents(location=location, number=number, attributes=attributes)
 
 
     @check_args_type
@@ -1807,11 +2553,11 @@ class Ecosystem:
         Returns:
             None.
         """
-        self.agents.append(Person(location=location, attributes=attributes))
+        self._append_agent(location=location, attributes=attributes)
 
 
     @check_args_type
-    def insertAgents(self, location, number: int) -> None:
+    def insertAgents(self, location, number: int, attributes=None) -> None:
         """
         Summary: 
             Inserts a specified number of agents into the simulation
@@ -1820,12 +2566,16 @@ class Ecosystem:
         Args:
             location (Location): The location to insert the agents at.
             number (int): The number of agents to insert.
+            attributes (optional): A list with a dictionary of attributes for every agent,
+                or a function that returns such a list for a given number of agents.
+                Defaults to no attributes.
 
         Returns:
             None.
         """
-        for _ in range(0, number):
-            self.insertAgent(location=location)
+        if number < 1:
+            return
+        self._append_agents(location=location, number=number, attributes=attributes)
 
 
     @check_args_type
@@ -1841,6 +2591,15 @@ class Ecosystem:
         Returns:
             None.
         """
+        if isinstance(self.agents, AgentStore):
+            removed = self.agents.remove_at_places(lambda p: p.name in location_names)
+            for place, number in removed:
+                # agents are removed from the ecosystem and number of agents
+                # drops accordingly.
+                for _ in range(number):
+                    place.DecrementNumAgents()
+            return
+
         new_agents = []
         for i in range(0, len(self.agents)):
             if self.agents[i].location.name not in location_names:
@@ -1928,13 +2687,8 @@ class Ecosystem:
         Returns:
             None.
         """
-        endpoint1_index = -1
-        endpoint2_index = -1
-        for i in range(0, len(self.locationNames)):
-            if self.locationNames[i] == endpoint1:
-                endpoint1_index = i
-            if self.locationNames[i] == endpoint2:
-                endpoint2_index = i
+        endpoint1_index = self.locationIndex.get(endpoint1, -1)
+        endpoint2_index = self.locationIndex.get(endpoint2, -1)
 
         if endpoint1_index < 0:
             print("Diagnostic: Ecosystem.locationNames: ", self.locationNames, file=sys.stderr)
@@ -1949,7 +2703,7 @@ class Ecosystem:
                     endpoint2, endpoint1), file=sys.stderr)
             sys.exit()
 
-        self.locations[endpoint1_index].links.append(
+        self.locations[endpoint1_index].addLink(
             Link(
                 startpoint=self.locations[endpoint1_index],
                 endpoint=self.locations[endpoint2_index],
@@ -1958,7 +2712,7 @@ class Ecosystem:
                 attributes=attributes,
             )
         )
-        self.locations[endpoint2_index].links.append(
+        self.locations[endpoint2_index].addLink(
             Link(
                 startpoint=self.locations[endpoint2_index],
                 endpoint=self.locations[endpoint1_index],
@@ -2032,3 +2786,282 @@ class Ecosystem:
 
         """
         return True
+
+
+    @check_args_type
+    def checkpoint_file_name(self, file_name: str) -> str:
+        """
+        Summary:
+            Returns the name of the file that save_checkpoint writes. This is
+            file_name itself, as flee.py is sequential.
+
+        Args:
+            file_name (str): name of the checkpoint, as given to save_checkpoint.
+
+        Returns:
+            str: file name of the checkpoint.
+        """
+        return file_name
+
+
+    @check_args_type
+    def save_checkpoint(self, file_name: str, data_table=None) -> None:
+        """
+        Summary:
+            Writes the complete state of the simulation to a checkpoint file:
+            agents, locations, links, closures, the spawning state and the
+            state of the random number generators. A run that loads the checkpoint
+            with load_checkpoint continues exactly as this run would.
+
+        Args:
+            file_name (str): name of the checkpoint file.
+            data_table (DataTable, optional): data table to store with the checkpoint.
+
+        Returns:
+            None.
+        """
+        checkpoint.write_checkpoint(
+            self.checkpoint_file_name(file_name),
+            self,
+            node_types=(Location, Link),
+            exclude=self._checkpoint_exclude,
+            extra={"data_table": data_table, "shared": self._get_shared_state()},
+        )
+
+
+    @check_args_type
+    def load_checkpoint(self, file_name: str):
+        """
+        Summary:
+            Restores the state of the simulation from a checkpoint file written
+            by save_checkpoint. The ecosystem should be newly created, after
+            reading the same simulation settings as the run that wrote the checkpoint.
+
+        Args:
+            file_name (str): name of the checkpoint file.
+
+        Returns:
+            DataTable or None: the data table stored with the checkpoint, if any.
+        """
+        extra = checkpoint.read_checkpoint(self.checkpoint_file_name(file_name), self)
+        self._set_shared_state(extra["shared"])
+        return extra["data_table"]
+
+
+    @check_args_type
+    def _get_shared_state(self) -> dict:
+        """
+        Summary:
+            Returns the simulation state that is not kept in the ecosystem itself,
+            but shared by all ecosystems (e.g. class attributes), for checkpoints.
+
+        Args:
+            None.
+
+        Returns:
+            dict: shared state (empty, as flee.py keeps all state in the ecosystem).
+        """
+        return {}
+
+
+    @check_args_type
+    def _set_shared_state(self, state: dict) -> None:
+        """
+        Summary:
+            Restores the shared state returned by _get_shared_state.
+
+        Args:
+            state (dict): shared state.
+
+        Returns:
+            None.
+        """
+        pass
+
+
+    @check_args_type
+    def fork_scenarios(
+        self,
+        scenarios: dict,
+        run_branch,
+        output_directory: str,
+        context=None,
+        use_fork: bool = True,
+        max_processes: int = 0,
+    ) -> dict:
+        """
+        Summary:
+            Forks the simulation at the current time step into independent branches,
+            one per scenario, so that the common part of the run is only simulated once.
+            run_branch(e, scenario, branch_directory, context) is called for every
+            branch. It applies the changes of the scenario (e.g. a new list of
+            closures in e.closures, or changed conflicts or location changes in an
+            InputGeography passed in the context, followed by ig.ResetSchedules())
+            and simulates the remaining time steps.
+            The standard output of every branch is written to out.csv in
+            <output_directory>/<scenario name>.
+
+            If use_fork is set and the platform supports it, every branch runs in a
+            forked process (copy-on-write, up to max_processes at a time). Otherwise
+            the branches run one after another, each on a copy of the ecosystem and
+            context that is restored from an in-memory snapshot.
+            In both cases this ecosystem, the context and the random number generators
+            are unchanged afterwards, and the branches start from the same random state.
+
+        Args:
+            scenarios (dict): scenario name -> scenario settings, passed on to run_branch.
+            run_branch: function that runs the remainder of a branch.
+            output_directory (str): directory in which a directory is created for every branch.
+            context (optional): other objects needed by the branches (e.g. InputGeography and DataTable).
+            use_fork (bool, optional): run branches in forked processes where possible.
+            max_processes (int, optional): maximum number of concurrent branch processes (0 = number of CPUs).
+
+        Returns:
+            dict: scenario name -> True if the branch completed, False if it failed.
+        """
+        directories = {}
+        for name in scenarios:
+            directories[name] = os.path.join(output_directory, str(name))
+            os.makedirs(directories[name], exist_ok=True)
+
+        if use_fork and self._can_fork and hasattr(os, "fork"):
+            return self._fork_branch_processes(scenarios, run_branch, directories, context, max_processes)
+        return self._run_branch_snapshots(scenarios, run_branch, directories, context)
+
+
+    def _run_branch(self, e, run_branch, scenario, directory: str, context) -> None:
+        """
+        Summary:
+            Runs one branch of fork_scenarios, with its standard output written to out.csv.
+
+        Args:
+            e (Ecosystem): ecosystem of the branch.
+            run_branch: function that runs the remainder of the branch.
+            scenario: scenario settings.
+            directory (str): output directory of the branch.
+            context: other objects needed by the branch.
+
+        Returns:
+            None.
+        """
+        # Only the process that prints the output writes the output file.
+        file_name = os.path.join(directory, "out.csv") if e.getRankN(0) else os.devnull
+        with open(file_name, "w") as f:
+            with contextlib.redirect_stdout(f):
+                run_branch(e, scenario, directory, context)
+
+
+    def _fork_branch_processes(self, scenarios: dict, run_branch, directories: dict, context, max_processes: int) -> dict:
+        """
+        Summary:
+            Runs the branches of fork_scenarios in forked processes.
+
+        Args:
+            scenarios (dict): scenario name -> scenario settings.
+            run_branch: function that runs the remainder of a branch.
+            directories (dict): scenario name -> output directory.
+            context: other objects needed by the branches.
+            max_processes (int): maximum number of concurrent processes (0 = number of CPUs).
+
+        Returns:
+            dict: scenario name -> True if the branch completed, False if it failed.
+        """
+        if max_processes < 1:
+            max_processes = os.cpu_count() or 1
+
+        completed = {}
+        running = {}  # process id -> scenario name.
+
+        def wait_for_branch():
+            pid, status = os.waitpid(-1, 0)
+            if pid in running:
+                name = running.pop(pid)
+                completed[name] = os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+                if not completed[name]:
+                    print("Error: scenario {} failed.".format(name), file=sys.stderr)
+
+        # Unflushed output would otherwise be written by every process.
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # The random module reseeds itself in forked processes.
+        random_state = random.getstate()
+
+        for name, scenario in scenarios.items():
+            while len(running) >= max_processes:
+                wait_for_branch()
+
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    random.setstate(random_state)
+                    self._run_branch(self, run_branch, scenario, directories[name], context)
+                    status = 0
+                except BaseException:
+                    traceback.print_exc()
+                finally:
+                    sys.stderr.flush()
+                    os._exit(status)
+            running[pid] = name
+
+        while len(running) > 0:
+            wait_for_branch()
+
+        return {name: completed[name] for name in scenarios}
+
+
+    def _run_branch_snapshots(self, scenarios: dict, run_branch, directories: dict, context) -> dict:
+        """
+        Summary:
+            Runs the branches of fork_scenarios one after another, each on a copy
+            of the ecosystem and context restored from an in-memory snapshot.
+
+        Args:
+            scenarios (dict): scenario name -> scenario settings.
+            run_branch: function that runs the remainder of a branch.
+            directories (dict): scenario name -> output directory.
+            context: other objects needed by the branches.
+
+        Returns:
+            dict: scenario name -> True if the branch completed.
+        """
+        snapshot = io.BytesIO()
+        checkpoint.write_checkpoint_stream(
+            snapshot,
+            self,
+            node_types=(Location, Link),
+            exclude=self._checkpoint_exclude,
+            extra={"context": context, "shared": self._get_shared_state()},
+        )
+
+        completed = {}
+        for name, scenario in scenarios.items():
+            e, branch_context = self._restore_snapshot(snapshot)
+            self._run_branch(e, run_branch, scenario, directories[name], branch_context)
+            completed[name] = True
+
+        # Restores the random number generators and shared state for this ecosystem.
+        self._restore_snapshot(snapshot)
+        return completed
+
+
+    def _restore_snapshot(self, snapshot) -> tuple:
+        """
+        Summary:
+            Creates a copy of this ecosystem and the context from an in-memory snapshot.
+            The copy shares the attributes that are excluded from snapshots (e.g. the MPI manager).
+
+        Args:
+            snapshot (io.BytesIO): snapshot written by write_checkpoint_stream.
+
+        Returns:
+            tuple: the copy of the ecosystem and the copy of the context.
+        """
+        e = type(self).__new__(type(self))
+        for key in self._checkpoint_exclude:
+            setattr(e, key, getattr(self, key))
+
+        snapshot.seek(0)
+        extra = checkpoint.read_checkpoint_stream(snapshot, e, source="scenario snapshot")
+        self._set_shared_state(extra["shared"])
+        return e, extra["context"]
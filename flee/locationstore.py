@@ -0,0 +1,133 @@
+from __future__ import annotations, print_function
+
+import numpy as np
+
+from flee.arraystore import ArrayStore
+
+
+# File for keeping the numeric state of all locations in an ecosystem in contiguous arrays,
+# so that location-wide quantities (e.g. spawn weights) can be calculated in one go.
+
+
+class LocationStore(ArrayStore):
+    """
+    The LocationStore class. Holds the population, conflict intensity, time of conflict
+    and spawn weight of every location in an Ecosystem, indexed in the order of e.locations.
+    Location objects write their values through to the store (see flee.Location).
+    """
+
+    _array_names = ["pop", "conflict", "time_of_conflict", "spawn_weight"]
+
+    _array_defaults = {"conflict": -1.0, "time_of_conflict": -1.0}
+
+    def __init__(self, capacity: int = 64):
+        """
+        Summary:
+            Initializes an empty location store.
+
+        Args:
+            capacity (int, optional): initial number of locations to allocate space for.
+
+        Returns:
+            None.
+        """
+        super().__init__(capacity)
+
+        self.pop = np.zeros(self.capacity, dtype=np.float64)
+        self.conflict = np.full(self.capacity, -1.0, dtype=np.float64)
+        self.time_of_conflict = np.full(self.capacity, -1.0, dtype=np.float64)
+        self.spawn_weight = np.zeros(self.capacity, dtype=np.float64)
+
+        # Set whenever a location value changes, and cleared when the spawn weights are
+        # recalculated (see spawning.refresh_spawn_weights). spawn_key holds the settings
+        # the spawn weights were calculated with, and spawn_size the number of locations.
+        self.changed = True
+        self.spawn_key = None
+        self.spawn_size = 0
+
+
+    def add(self, location) -> int:
+        """
+        Summary:
+            Registers a location, copying its current values into the store.
+
+        Args:
+            location (Location): location to register.
+
+        Returns:
+            int: index of the location in the store.
+        """
+        if self.size == self.capacity:
+            self._grow(self.size + 1)
+
+        i = self.size
+        self.pop[i] = location.pop
+        self.conflict[i] = location.conflict
+        self.time_of_conflict[i] = location.time_of_conflict
+        self.spawn_weight[i] = 0.0
+        self.size += 1
+        return i
+
+
+    @property
+    def spawn_weights(self) -> np.ndarray:
+        """
+        Summary:
+            Returns the spawn weights of all registered locations (a view, not a copy).
+
+        Args:
+            None.
+
+        Returns:
+            np.ndarray: spawn weight per location.
+        """
+        return self.spawn_weight[:self.size]
+
+
+class CountStore(ArrayStore):
+    """
+    The CountStore class. Holds the number of agents in every location and link of a
+    pflee Ecosystem, with one slot per object, so that the counts of all ranks can be
+    reduced without packing them into a buffer first (see pflee.Ecosystem.updateNumAgents).
+    Slots are assigned in the same order on every rank, as all ranks create the same
+    locations and links.
+    """
+
+    # on_rank: agents on this rank. total: agents on all ranks, as used by the simulation.
+    # reduced: agents on all ranks after the last reduction.
+    # reduced_on_rank: agents on this rank at the last reduction (for delta reductions).
+    _array_names = ["on_rank", "total", "reduced", "reduced_on_rank"]
+
+    def __init__(self, capacity: int = 256):
+        """
+        Summary:
+            Initializes an empty count store.
+
+        Args:
+            capacity (int, optional): initial number of slots to allocate space for.
+
+        Returns:
+            None.
+        """
+        super().__init__(capacity)
+
+        for name in self._array_names:
+            setattr(self, name, np.zeros(self.capacity, dtype="i"))
+
+
+    def add(self) -> int:
+        """
+        Summary:
+            Adds a slot for a location or link, with all counts set to zero.
+
+        Args:
+            None.
+
+        Returns:
+            int: index of the slot.
+        """
+        if self.size == self.capacity:
+            self._grow(self.size + 1)
+
+        self.size += 1
+        return self.size - 1
@@ -53,6 +53,7 @@ class InputGeography(based_InputGeography_class):
             None.
         """
         self.links = []
+        self._AddSourceFile(csv_name)
 
         with open(csv_name, newline="", encoding="utf-8") as csvfile:
             values = csv.reader(csvfile)
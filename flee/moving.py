@@ -1,9 +1,13 @@
+import collections
+import heapq
+import itertools
 import os
 import sys
 import numpy as np
 import random
 from beartype.typing import List, Optional, Tuple
 from flee.SimulationSettings import SimulationSettings
+from flee.sampling import AliasTable
 
 if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
     from beartype import beartype as check_args_type
@@ -43,7 +47,7 @@ def getEndPointScore(agent, endpoint, time) -> float:
         if SimulationSettings.move_rules["BoysTakeRisk"]:
             if agent.attributes["gender"]=="male" and agent.attributes["age"]>14:
                 # Hypothesis that perceived safety does not affect routing decisions for teenage boys.
-                base = 1 
+                base = 1.0
 
 
     if SimulationSettings.move_rules["StayCloseToHome"]:
@@ -64,74 +68,23 @@ def getEndPointScore(agent, endpoint, time) -> float:
         #Flooding Forecaster Location Weight Implementation:
         if SimulationSettings.move_rules["FloodForecaster"] is True:
 
-            #Get the forecast timescale e.g. 5 day weather forecast
-            forecast_timescale = SimulationSettings.move_rules["FloodForecasterTimescale"]
-
-            #Get the forecast length e.g. only know the forecast until day 7
-            forecast_end_time = SimulationSettings.move_rules["FloodForecasterEndTime"] 
-
-            # If there is a forecast timescale and endtime are set
-            # If forecast_timescale is greater than 1 and the current time step is less than the forecast end time
-            if forecast_timescale is not None:
-              if forecast_end_time is not None:
-                if (forecast_timescale > 1.0) and (time <= forecast_end_time): 
-              
-                  #Set the base forecast value
-                  flood_forecast_base = 0.0 #no forecast, no flooding 
-
-                  #Get the agents awareness level of the flood forecast
-                  #Weighting of each awareness level defined in simsetting.yml
-                  #Fraction of population with each level of flood awareness defined in demographics_floodawareness.csv 
-                  #Awareness can be used as a proxy for ability to adapt to forecasted flooding.
-                  #For example, low awareness will down weight the importance of the forecast or reduce the impact the forecast has on the 
-                  # agents decision making process. 
-                  agent_awareness_weight = float(SimulationSettings.move_rules["FloodAwarenessWeights"][int(agent.attributes["floodawareness"])])
-
-                  #Forecast loop: iterate over the location flood level weights for the forecast timescale
-                  for x in range(1, forecast_timescale + 1): #iterates over the 5 day forecast, ignoring the current day
-
-                      #the day of the forcast we're considering 
-                      forecast_day = time + x 
-
-                      #If the simulation length is less than the end of the forecast, then the forecast will be shorter
-                      if forecast_day >= forecast_end_time:
-                          #set the forecast day to the end of the simulation
-                          forecast_day = forecast_end_time #same as time + x
-                    
-                      #get the forecast flood level for location on the day we're considering in the for loop
-                      forecast_flood_level = endpoint.attributes.get("forecast_flood_levels",0)[forecast_day]
-
-                      # if it's not zero, then we need to modify the base forecast value, otherwise leave the base as it will zero.
-                      if forecast_flood_level > 0.0: 
-                        #get the endpoint locations current flood level weight based on that flood level.
-                        forecast_flood_level_weight = float(SimulationSettings.move_rules["FloodLocWeights"][forecast_flood_level]) 
-                        
-                        #get the current flood forecaster weight e.g. how important the current day is in the forecast
-                        flood_forecaster_weight = float(SimulationSettings.move_rules["FloodForecasterWeights"][forecast_day])
-                      
-                        #modify the flood_forecast_base using the flood level on the current day and the imporatance of the current day in the forecast loop
-                        flood_forecast_base += forecast_flood_level_weight * flood_forecaster_weight
-
-                      #break the loop if we've reached the end of the forecast data 
-                      if forecast_day == forecast_end_time:
-                        break
-                    
-                  #the flood_forecast_base now represents the total weight of the flooding during the forecast for the endpoint location,
-                  # this needed to be divided by the total number of days in the forecast to get the average weight based on the severity and relative imporatance of the forecasted days
-                  flood_forecast_base *= float(flood_forecast_base/forecast_timescale)
-
-                  #down weight the overall importance of the flood forecast on the base depending on the agents awareness weighting
-                  #currently using a simple down weighting, but may want lower awareness agents to only respond to high flood levels 
-                  # or shorter forecast timescales.
-                  flood_forecast_base *= float(agent_awareness_weight) 
-
-                  # Make the flood_forecast_base effect the actual base score
-                  base *= flood_forecast_base  
-                    
-              else:
-                  print("WARNING: flood_forecaster_endtime is not set in simsetting.yml", file=sys.stderr)
-            else:
-                print("WARNING: flood_forecaster_timescale is not set in simsetting.yml", file=sys.stderr)
+            #Get the forecast flood weight of the endpoint, which is calculated once per location and time step.
+            flood_forecast_base = getFloodForecast(endpoint, time)
+
+            if flood_forecast_base is not None:
+                #the flood_forecast_base now represents the total weight of the flooding during the forecast for the endpoint location,
+                # this needed to be divided by the total number of days in the forecast to get the average weight based on the severity and relative imporatance of the forecasted days
+                flood_forecast_base *= float(flood_forecast_base/SimulationSettings.move_rules["FloodForecasterTimescale"])
+
+                #down weight the overall importance of the flood forecast on the base depending on the agents awareness weighting
+                #Weighting of each awareness level defined in simsetting.yml
+                #Fraction of population with each level of flood awareness defined in demographics_floodawareness.csv 
+                #currently using a simple down weighting, but may want lower awareness agents to only respond to high flood levels 
+                # or shorter forecast timescales.
+                flood_forecast_base *= getFloodAwarenessWeight(agent)
+
+                # Make the flood_forecast_base effect the actual base score
+                base *= flood_forecast_base
 
 
     if endpoint.camp is True:
@@ -275,6 +228,333 @@ def calculateLinkWeight(
     print("step {}, total weight returned {}, routes {}".format(step, weights, routes), file=sys.stderr)
   return weights, routes
 
+def getReachableEndPoints(origin, awareness_level: int, count_markers: bool = False) -> list:
+  """
+  Summary:
+      Returns all non-marker locations that calculateLinkWeight can reach from
+      an origin. Locations are visited once, so this may include a few
+      locations that are only reachable through loops.
+
+  Args:
+      origin (Location): origin location.
+      awareness_level (int): awareness level of the agents.
+      count_markers (bool, optional): markers count as a step. Defaults to False.
+
+  Returns:
+      List[Link]: one link leading into each reachable endpoint.
+  """
+  # Markers do not count as a step, so unvisited neighbours of markers are
+  # visited before those of regular locations.
+  steps = {id(origin): 0}
+  found = {}
+  queue = collections.deque([(0, link) for link in origin.links])
+  while len(queue) > 0:
+      step, link = queue.popleft()
+      loc = link.endpoint
+      if loc.marker is False:
+          found.setdefault(id(loc), link)
+      if loc.marker is False or count_markers:
+          step += 1
+      if id(loc) in steps and steps[id(loc)] <= step:
+          continue
+      steps[id(loc)] = step
+      if awareness_level > step:
+          for lel in loc.links:
+              if loc.marker and not count_markers:
+                  queue.appendleft((step, lel))
+              else:
+                  queue.append((step, lel))
+  return list(found.values())
+
+
+@check_args_type
+def calculateBestRoutes(origin, endpoint_value, max_routes: int, unique_endpoints: bool = False, count_markers: bool = False) -> list:
+  """
+  Summary:
+      Finds the max_routes highest-weighted routes from an origin, using the
+      same traversal and weight formula as calculateLinkWeight. Branches whose
+      routes cannot outweigh the routes found so far are not searched, using
+      the highest endpoint score and the distance travelled as a bound.
+
+  Args:
+      origin (Location): origin location.
+      endpoint_value (function): returns (score, multiplier) for the endpoint of a link.
+        The multiplier must lie between 0.0 and 1.0.
+      max_routes (int): maximum number of routes to return.
+      unique_endpoints (bool, optional): only keep the best route to each endpoint.
+        Defaults to False.
+      count_markers (bool, optional): markers count as a step, as in the location-generated
+        routes of calculateLocCrawlLinkWeight. Defaults to False.
+
+  Returns:
+      List[Tuple[float, List[str], Location]]: weight, route (without the origin) and
+      endpoint of the best routes, in the order in which calculateLinkWeight finds them.
+  """
+  awareness_level = SimulationSettings.move_rules["AwarenessLevel"]
+  weight_softening = float(SimulationSettings.move_rules["WeightSoftening"])
+  distance_softening = float(SimulationSettings.move_rules["DistanceSoftening"])
+  distance_power = SimulationSettings.move_rules["DistancePower"]
+  weight_power = SimulationSettings.move_rules["WeightPower"]
+
+  values = {}
+
+  def value(link):
+      v = values.get(id(link.endpoint), None)
+      if v is None:
+          v = endpoint_value(link)
+          values[id(link.endpoint)] = v
+      return v
+
+  # The bound is only valid if weights decrease monotonically with distance.
+  max_score = None
+  if distance_power >= 0.0 and weight_power > 0.0:
+      max_score = max([value(link)[0] for link in getReachableEndPoints(origin, awareness_level, count_markers)], default=0.0)
+
+  found = {}  # (weight, -order) -> (route, endpoint), for the routes in best.
+  best = []  # min-heap of (weight, -order) of the best routes.
+  best_endpoint = {}  # endpoint name -> (weight, -order), if unique_endpoints is True.
+  order = itertools.count()
+
+  def add(weight, route, endpoint):
+      key = (weight, -next(order))
+      if unique_endpoints:
+          prior = best_endpoint.get(endpoint.name, None)
+          if prior is not None:
+              if weight <= prior[0]:
+                  return
+              best.remove(prior)
+              heapq.heapify(best)
+              del found[prior]
+          best_endpoint[endpoint.name] = key
+      found[key] = (route, endpoint)
+      heapq.heappush(best, key)
+      if len(best) > max_routes:
+          dropped = heapq.heappop(best)
+          if unique_endpoints:
+              del best_endpoint[found[dropped][1].name]
+          del found[dropped]
+
+  def visit(link, prior_distance, origin_names, step):
+      distance = prior_distance + link.get_distance()
+      if max_score is not None and len(best) >= max_routes:
+          if ((weight_softening + max_score) / (distance_softening + distance)**distance_power)**weight_power <= best[0][0]:
+              return
+
+      if link.endpoint.marker is False:
+          score, multiplier = value(link)
+          weight = ((weight_softening + score) / (distance_softening + distance)**distance_power) * multiplier
+          add(weight**weight_power, origin_names[1:] + [link.endpoint.name], link.endpoint)
+      elif count_markers is False:
+          step -= 1
+
+      if awareness_level > step:
+          for lel in link.endpoint.links:
+              if lel.endpoint.name not in origin_names:
+                  visit(lel, distance, origin_names + [link.endpoint.name], step + 1)
+
+  for link in origin.links:
+      visit(link, 0.0, [origin.name], 1)
+
+  return [(key[0],) + found[key] for key in sorted(best, key=lambda k: -k[1])]
+
+
+class RouteCandidates:
+  """
+  The RouteCandidates class. Holds the candidate routes of one origin location
+  within the awareness radius, as found by calculateLinkWeight, in the same order.
+  Route weights only depend on the endpoint and distance of each candidate,
+  so they can be calculated with array arithmetic.
+  """
+
+  def __init__(self, origin, awareness_level: int):
+      self.origin = origin
+      self.awareness_level = awareness_level
+      self.endpoints = []  # unique endpoint Location objects.
+      self.touched = set()  # all locations visited while building the candidates.
+      self.routes = []  # route per candidate (without the origin).
+      endpoint_index = []
+      link_distance = []
+      prior_distance = []
+      endpoint_ids = {}
+
+      def add_link(link, prior, origin_names, step):
+          self.touched.add(link.endpoint)
+          if link.endpoint.marker is False:
+              k = endpoint_ids.get(id(link.endpoint), None)
+              if k is None:
+                  k = len(self.endpoints)
+                  endpoint_ids[id(link.endpoint)] = k
+                  self.endpoints.append(link.endpoint)
+              endpoint_index.append(k)
+              link_distance.append(link.get_distance())
+              prior_distance.append(prior)
+              self.routes.append(origin_names[1:] + [link.endpoint.name])
+          else:
+              step -= 1
+
+          if awareness_level > step:
+              for lel in link.endpoint.links:
+                  if lel.endpoint.name not in origin_names:
+                      add_link(lel, prior + link.get_distance(), origin_names + [link.endpoint.name], step + 1)
+
+      self.touched.add(origin)
+      for link in origin.links:
+          add_link(link, 0.0, [origin.name], 1)
+
+      self.endpoint_index = np.array(endpoint_index, dtype=np.int64)
+      self.link_distance = np.array(link_distance, dtype=np.float64)
+      self.prior_distance = np.array(prior_distance, dtype=np.float64)
+      self.endpoint_distances = None
+
+  def getEndPointDistances(self) -> np.ndarray:
+      """
+      Summary:
+          Returns the distance as the crow flies from the origin to every endpoint.
+
+      Args:
+          None.
+
+      Returns:
+          np.ndarray: distance per endpoint in self.endpoints.
+      """
+      if self.endpoint_distances is None:
+          self.endpoint_distances = np.array([e.calculateDistance(self.origin) for e in self.endpoints])
+      return self.endpoint_distances
+
+
+@check_args_type
+def getRouteCandidates(location):
+  """
+  Summary:
+      Returns the precomputed candidate routes of a location,
+      (re)building them if they were invalidated.
+
+  Args:
+      location (Location): origin location.
+
+  Returns:
+      RouteCandidates: candidate routes of the location.
+  """
+  awareness_level = SimulationSettings.move_rules["AwarenessLevel"]
+  candidates = location.route_candidates
+  if candidates is None or candidates.awareness_level != awareness_level:
+      candidates = RouteCandidates(location, awareness_level)
+      location.route_candidates = candidates
+      for loc in candidates.touched:
+          loc.route_dependents.add(location)
+  return candidates
+
+
+@check_args_type
+def getEndPointScores(agent, candidates, time: int) -> np.ndarray:
+  """
+  Summary:
+      Vectorized version of getEndPointScore, for all endpoints of a set of
+      route candidates. Rules that need per-location data that is not
+      available as arrays (ethnicity matching) fall back to
+      getEndPointScore for each endpoint.
+
+  Args:
+      agent (Person): agent making the decision
+      candidates (RouteCandidates): candidate routes of the agent's location.
+      time (int): current time step
+
+  Returns:
+      np.ndarray: score per endpoint in candidates.endpoints.
+  """
+  endpoints = candidates.endpoints
+  if len(endpoints) == 0:
+      return np.zeros(0)
+
+  if (
+      SimulationSettings.move_rules["MatchCampEthnicity"]
+      or SimulationSettings.move_rules["MatchConflictEthnicity"]
+      or SimulationSettings.move_rules["MatchTownEthnicity"]
+  ):
+      return np.array([float(getEndPointScore(agent=agent, endpoint=e, time=time)) for e in endpoints])
+
+  base = type(endpoints[0]).getScores(endpoints, 1)
+
+  if SimulationSettings.move_rules["ChildrenAvoidHazards"]:
+      if agent.attributes["age"]<19:
+          base = base*base
+      if SimulationSettings.move_rules["BoysTakeRisk"]:
+          if agent.attributes["gender"]=="male" and agent.attributes["age"]>14:
+              base = np.ones(len(endpoints))
+
+  if SimulationSettings.move_rules["StayCloseToHome"]:
+      power_factor = SimulationSettings.move_rules["HomeDistancePower"]
+      base = base * (1.0/(np.maximum(1.0, candidates.getEndPointDistances())**power_factor))
+
+  if SimulationSettings.move_rules["FloodRulesEnabled"] is True:
+      flood_levels = [e.attributes.get("flood_level",0) for e in endpoints]
+      base = base * np.array([float(SimulationSettings.move_rules["FloodLocWeights"][f]) if f > 0 else 1.0 for f in flood_levels])
+
+      if SimulationSettings.move_rules["FloodForecaster"] is True:
+          forecasts = [getFloodForecast(e, time) for e in endpoints]
+          if any(f is not None for f in forecasts):
+              timescale = SimulationSettings.move_rules["FloodForecasterTimescale"]
+              awareness = getFloodAwarenessWeight(agent)
+              base = base * np.array([1.0 if f is None else f * float(f/timescale) * awareness for f in forecasts])
+
+  if SimulationSettings.move_rules["UsePopForLocWeight"]:
+      camp = np.array([e.camp is True for e in endpoints])
+      pop = np.array([float(min(1.0,e.pop)) for e in endpoints])
+      base = np.where(camp, base, base * pop**float(SimulationSettings.move_rules["PopPowerForLocWeight"]))
+
+  return base
+
+
+@check_args_type
+def getCapMultipliers(locations) -> np.ndarray:
+  """
+  Summary:
+      Vectorized version of getCapMultiplier for a list of locations.
+
+  Args:
+      locations (List[Location]): locations to check
+
+  Returns:
+      np.ndarray: value between 0.0 and 1.0 per location (see getCapMultiplier).
+  """
+  nearly_full_occ = SimulationSettings.move_rules["CapacityBuffer"]
+  cap_scale = SimulationSettings.move_rules["CapacityScaling"]
+
+  cap = np.array([e.capacity for e in locations], dtype=np.float64) * float(cap_scale)
+  num_agents = np.array([e.numAgents for e in locations], dtype=np.float64)
+
+  weights = np.ones(len(locations))
+  partial = (cap >= 1) & (num_agents > nearly_full_occ * cap)
+  weights[partial] = 1.0 - ((num_agents[partial] - (nearly_full_occ * cap[partial])) / (cap[partial] * (1.0 - nearly_full_occ)))
+  weights[partial & (num_agents >= 1.0 * cap)] = 0.0
+  return weights
+
+
+@check_args_type
+def calculateCandidateWeights(agent, candidates, time: int) -> np.ndarray:
+  """
+  Summary:
+      Calculates the weights of all candidate routes of an agent's location
+      in one vectorized expression. Equivalent to calculateLinkWeight for every candidate.
+
+  Args:
+      agent (Person): agent making the decision
+      candidates (RouteCandidates): candidate routes of the agent's location.
+      time (int): current time step
+
+  Returns:
+      np.ndarray: weight per candidate route.
+  """
+  scores = getEndPointScores(agent, candidates, time)
+  cap = getCapMultipliers(candidates.endpoints)
+  scores = scores[candidates.endpoint_index]
+  cap = cap[candidates.endpoint_index]
+
+  distance = float(SimulationSettings.move_rules["DistanceSoftening"]) + candidates.link_distance + candidates.prior_distance
+  weights = ((float(SimulationSettings.move_rules["WeightSoftening"]) + scores) / distance**SimulationSettings.move_rules["DistancePower"]) * cap
+  return weights**SimulationSettings.move_rules["WeightPower"]
+
+
 # Add origin steps, next to origin names to check like for like correctly?
 # Or make origin_names data structure encapsulated in recursion.
 
@@ -291,9 +571,9 @@ def normalizeWeights(weights: List[float]) -> List[float]:
     list: Normalized list of weights
   """
 
-  if np.sum(weights) > 0.0:
-    weights = [x/float(sum(weights)) for x in weights]
-    #weights = weights.tolist()
+  total = float(sum(weights))
+  if total > 0.0:
+    weights = [x/total for x in weights]
   else:  # if all have zero weight, then we do equal weighting
     weights = [(x+1)/float(len(weights)) for x in weights]
     
@@ -324,31 +604,129 @@ def chooseFromWeights(weights, routes):
 
 
 @check_args_type
-def calculateMoveChance(a, ForceTownMove: bool, time) -> float:
+def getFloodAwarenessWeight(a) -> float:
     """
     Summary:
-        Calculates the probability that an agent will move this step.
+        Returns the weight with which an agent takes the flood forecast into account.
+        Weighting of each awareness level is defined in simsetting.yml, and the
+        fraction of the population with each level of flood awareness in demographics_floodawareness.csv.
 
     Args:
-        a: Agent to calculate move chance for.
-        ForceTownMove: Whether to force agents to move through regular town. If True, agents will always move.
+        a: Agent
+
+    Returns:
+        float: flood awareness weight of the agent.
+    """
+    return float(SimulationSettings.move_rules["FloodAwarenessWeights"][int(a.attributes["floodawareness"])])
+
+
+@check_args_type
+def calculateFloodForecast(location, time: int) -> Optional[float]:
+    """
+    Summary:
+        Calculates the flood forecast weight of a location: the flood location weights
+        of the forecasted flood levels, weighted by the importance of each forecast day.
+
+    Args:
+        location (Location): Location to calculate the forecast for.
         time (int): Current time step.
 
     Returns:
-        movechance (int): Probability that agent will move this step. 
+        Optional[float]: The forecast weight, or None if the flood forecaster does not
+        apply at this time.
     """
+    #Get the forecast timescale e.g. 5 day weather forecast
+    forecast_timescale = SimulationSettings.move_rules["FloodForecasterTimescale"]
 
-    if a.location.town and ForceTownMove: # called through evolveMore
-        return 1.0
-    else: # called first time in loop
-        movechance = a.location.movechance
-        # Population-based scaling
-        movechance *= (float(max(a.location.pop, a.location.capacity)) / SimulationSettings.move_rules["MovechancePopBase"])**SimulationSettings.move_rules["MovechancePopScaleFactor"]
+    #Get the forecast length e.g. only know the forecast until day 7
+    forecast_end_time = SimulationSettings.move_rules["FloodForecasterEndTime"] 
+
+    if forecast_timescale is None:
+        print("WARNING: flood_forecaster_timescale is not set in simsetting.yml", file=sys.stderr)
+        return None
+    if forecast_end_time is None:
+        print("WARNING: flood_forecaster_endtime is not set in simsetting.yml", file=sys.stderr)
+        return None
+
+    # If forecast_timescale is greater than 1 and the current time step is less than the forecast end time
+    if (forecast_timescale <= 1.0) or (time > forecast_end_time):
+        return None
+
+    #Set the base forecast value
+    flood_forecast_base = 0.0 #no forecast, no flooding 
+
+    #Forecast loop: iterate over the location flood level weights for the forecast timescale
+    for x in range(1, forecast_timescale + 1): #iterates over the 5 day forecast, ignoring the current day
+
+        #the day of the forcast we're considering 
+        #If the simulation length is less than the end of the forecast, then the forecast will be shorter
+        forecast_day = min(time + x, forecast_end_time)
+
+        #get the forecast flood level for location on the day we're considering in the for loop
+        forecast_flood_level = int(location.attributes.get("forecast_flood_levels",0)[forecast_day])
+
+        # if it's not zero, then we need to modify the base forecast value, otherwise leave the base as it will zero.
+        if forecast_flood_level > 0.0: 
+            #get the endpoint locations current flood level weight based on that flood level.
+            forecast_flood_level_weight = float(SimulationSettings.move_rules["FloodLocWeights"][forecast_flood_level]) 
+
+            #get the current flood forecaster weight e.g. how important the current day is in the forecast
+            flood_forecaster_weight = float(SimulationSettings.move_rules["FloodForecasterWeights"][forecast_day])
+
+            #modify the flood_forecast_base using the flood level on the current day and the imporatance of the current day in the forecast loop
+            flood_forecast_base += forecast_flood_level_weight * flood_forecaster_weight
+
+        #break the loop if we've reached the end of the forecast data 
+        if forecast_day == forecast_end_time:
+            break
+
+    return flood_forecast_base
+
+
+@check_args_type
+def getFloodForecast(location, time: int) -> Optional[float]:
+    """
+    Summary:
+        Returns the flood forecast weight of a location, using the value that
+        Ecosystem.evolve calculated for the current time step if available.
+
+    Args:
+        location (Location): Location to get the forecast for.
+        time (int): Current time step.
+
+    Returns:
+        Optional[float]: The forecast weight (see calculateFloodForecast).
+    """
+    if location.flood_forecast is not None and location.flood_forecast[0] == time:
+        return location.flood_forecast[1]
+    return calculateFloodForecast(location, time)
+
+
+@check_args_type
+def calculateLocationMoveChance(location, time: int) -> Tuple[float, Optional[float]]:
+    """
+    Summary:
+        Calculates the part of the move chance that is shared by all agents in a location.
+
+    Args:
+        location (Location): Location to calculate move chance for.
+        time (int): Current time step.
+
+    Returns:
+        Tuple[float, Optional[float]]: The location move chance, and the flood forecast
+        factor that still needs to be multiplied with the flood awareness weight of
+        each agent (None if the flood forecaster is not active).
+    """
+    movechance = location.movechance
+    # Population-based scaling
+    movechance *= (float(max(location.pop, location.capacity)) / SimulationSettings.move_rules["MovechancePopBase"])**SimulationSettings.move_rules["MovechancePopScaleFactor"]
+
+    flood_forecast_movechance = None
 
     # DFlee Flood Location Movechance implementation:
     if SimulationSettings.move_rules["FloodRulesEnabled"] is True:
         #Get the current flood level of the agents location, if flood level not set in flood_level.csv then default to zero
-        flood_level = a.location.attributes.get("flood_level",0)
+        flood_level = location.attributes.get("flood_level",0)
         
         if flood_level > 0.0:
             #set the base equal to the flood location weight
@@ -358,79 +736,43 @@ def calculateMoveChance(a, ForceTownMove: bool, time) -> float:
 
         #Flooding Forecaster Location Weight Implementation:
         if SimulationSettings.move_rules["FloodForecaster"] is True:
+            flood_forecast_base = getFloodForecast(location, time)
 
-          #Get the forecast timescale e.g. 5 day weather forecast
-          forecast_timescale = SimulationSettings.move_rules["FloodForecasterTimescale"]
+            if flood_forecast_base is not None:
+                #the flood_forecast_base now represents the total weight of the flooding during the forecast for the endpoint location,
+                # this needed to be divided by the total number of days in the forecast to get the average weight based on the severity and relative imporatance of the forecasted days
+                flood_forecast_movechance = float(flood_forecast_base/SimulationSettings.move_rules["FloodForecasterTimescale"])
 
-          #Get the forecast length e.g. only know the forecast until day 7
-          forecast_end_time = SimulationSettings.move_rules["FloodForecasterEndTime"] 
+    return movechance, flood_forecast_movechance
 
-          # If there is a forecast timescale and endtime are set
-          # If forecast_timescale is greater than 1 and the current time step is less than the forecast end time
-          if forecast_timescale is not None:
-            if forecast_end_time is not None:
-              if (forecast_timescale > 1.0) and (time <= forecast_end_time): 
-                
-                #Set the base forecast value
-                flood_forecast_base = 0.0 #no forecast, no flooding 
 
-                #Set the default movechance value
-                flood_forecast_movechance = 0.0 #no forecast, no flooding
+@check_args_type
+def calculateMoveChance(a, ForceTownMove: bool, time) -> float:
+    """
+    Summary:
+        Calculates the probability that an agent will move this step.
 
-                #Get the agents awareness level of the flood forecast
-                #Weighting of each awareness level defined in simsetting.yml
-                #Fraction of population with each level of flood awareness defined in demographics_floodawareness.csv 
-                #Awareness can be used as a proxy for ability to adapt to forecasted flooding.
-                #For example, low awareness will down weight the importance of the forecast or reduce the impact the forecast has on the 
-                # agents decision making process. 
-                agent_awareness_weight = float(SimulationSettings.move_rules["FloodAwarenessWeights"][int(a.attributes["floodawareness"])])
-         
-
-                #Forecast loop: iterate over the location flood level weights for the forecast timescale
-                for x in range(1, forecast_timescale + 1): #iterates over the 5 day forecast, ignoring the current day
-
-                    #the day of the forcast we're considering 
-                    forecast_day = time + x 
-
-                    #If the simulation length is less than the end of the forecast, then the forecast will be shorter
-                    if forecast_day >= forecast_end_time:
-                        #set the forecast day to the end of the simulation
-                        forecast_day = forecast_end_time #same as time + x
-                  
-                    #get the forecast flood level for location on the day we're considering in the for loop
-                    forecast_flood_level = int(a.location.attributes.get("forecast_flood_levels",0)[forecast_day])
-
-                    # if it's not zero, then we need to modify the base forecast value, otherwise leave the base as it will zero.
-                    if forecast_flood_level > 0.0: 
-                      #get the endpoint locations current flood level weight based on that flood level.
-                      forecast_flood_level_weight = float(SimulationSettings.move_rules["FloodLocWeights"][forecast_flood_level]) 
-                      
-                      #get the current flood forecaster weight e.g. how important the current day is in the forecast
-                      flood_forecaster_weight = float(SimulationSettings.move_rules["FloodForecasterWeights"][forecast_day])
-                    
-                      #modify the flood_forecast_base using the flood level on the current day and the imporatance of the current day in the forecast loop
-                      flood_forecast_base += forecast_flood_level_weight * flood_forecaster_weight
-
-                    #break the loop if we've reached the end of the forecast data 
-                    if forecast_day == forecast_end_time:
-                      break
+    Args:
+        a: Agent to calculate move chance for.
+        ForceTownMove: Whether to force agents to move through regular town. If True, agents will always move.
+        time (int): Current time step.
 
-                #the flood_forecast_base now represents the total weight of the flooding during the forecast for the endpoint location,
-                # this needed to be divided by the total number of days in the forecast to get the average weight based on the severity and relative imporatance of the forecasted days
-                flood_forecast_movechance = float(flood_forecast_base/forecast_timescale)
+    Returns:
+        movechance (int): Probability that agent will move this step. 
+    """
 
-                #down weight the overall importance of the flood forecast on the base depending on the agents awareness weighting
-                #currently using a simple down weighting, but may want lower awareness agents to only respond to high flood levels 
-                # or shorter forecast timescales.
-                flood_forecast_movechance *= float(agent_awareness_weight) 
+    if a.location.town and ForceTownMove: # called through evolveMore
+        return 1.0
 
-                # Make the flood_forecast_base effect the actual base score
-                movechance *= flood_forecast_movechance  
-                  
-            else:
-                print("WARNING: flood_forecaster_endtime is not set in simsetting.yml", file=sys.stderr)
-          else:
-              print("WARNING: flood_forecaster_timescale is not set in simsetting.yml", file=sys.stderr)
+    # called first time in loop
+    movechance, flood_forecast_movechance = calculateLocationMoveChance(a.location, time)
+
+    if flood_forecast_movechance is not None:
+        #down weight the overall importance of the flood forecast on the base depending on the agents awareness weighting
+        #currently using a simple down weighting, but may want lower awareness agents to only respond to high flood levels 
+        # or shorter forecast timescales.
+        #Awareness can be used as a proxy for ability to adapt to forecasted flooding.
+        movechance *= flood_forecast_movechance * getFloodAwarenessWeight(a)
 
     return movechance
 
@@ -467,31 +809,52 @@ def pruneRoutes(weights, routes):
 
 
 @check_args_type
-def selectRoute(a, time: int, debug: bool = False, return_all_routes: bool = False):
+def getRouteDistribution(a, time: int, debug: bool = False, return_all_routes: bool = False):
   """
   Summary:
-      Selects a route for an agent to move to.
+      Calculates the (unnormalized) weights of all routes an agent may take
+      from its current location.
 
   Args:
     a: Agent
     time (int): Current time
     debug (bool, optional): Whether to print debug information. Defaults to False.
+    return_all_routes (bool, optional): Return the routes before the origin is
+      removed and pruning is applied. Only used without FixedRoutes. Defaults to False.
 
   Returns:
-      int: Index of the chosen route
+      Tuple[List[float],List[List[str]]]: A tuple containing the weights and routes.
   """
   weights = []
   routes = []
 
-  if SimulationSettings.move_rules["AwarenessLevel"] == 0:
-      linklen = len(a.location.links)
-      return [np.random.randint(0, linklen)]
-
   if SimulationSettings.move_rules["FixedRoutes"] is True:
       for l in a.location.routes.keys():
           weights = weights + [a.location.routes[l][0] * getEndPointScore(a, a.location.routes[l][2], time)]
           routes = routes + [a.location.routes[l][1]]
       #print("FixedRoute Weights", a.location.name, weights, routes, file=sys.stderr)
+  elif debug is False and return_all_routes is False and SimulationSettings.move_rules["MaxRoutesPerOrigin"] > 0:
+      best = calculateBestRoutes(
+          a.location,
+          endpoint_value=lambda link: (float(getEndPointScore(agent=a, endpoint=link.endpoint, time=time)), getCapMultiplier(link.endpoint, numOnLink=int(link.numAgents))),
+          max_routes=SimulationSettings.move_rules["MaxRoutesPerOrigin"],
+      )
+      weights = [b[0] for b in best]
+      routes = [b[1] for b in best]
+      if len(weights) > 0:
+          weights, routes = pruneRoutes(weights, routes)
+  elif debug is False and return_all_routes is False and SimulationSettings.optimisations.get("RouteKernel", "vectorized") == "vectorized":
+      candidates = getRouteCandidates(a.location)
+      weights = calculateCandidateWeights(a, candidates, time)
+      routes = list(candidates.routes)
+
+      threshold = SimulationSettings.move_rules["PruningThreshold"]
+      if threshold >= 1.001 and len(weights) > 0:
+          kept = np.flatnonzero(weights >= weights.max() / threshold)
+          weights = weights[kept]
+          routes = [routes[i] for i in kept]
+
+      weights = weights.tolist()
   else:
       for k, e in enumerate(a.location.links):
           wgt, rts = calculateLinkWeight(
@@ -518,7 +881,125 @@ def selectRoute(a, time: int, debug: bool = False, return_all_routes: bool = Fal
 
       weights, routes = pruneRoutes(weights, routes)
 
-  route = chooseFromWeights(weights=weights, routes=routes)
+  return weights, routes
+
+
+@check_args_type
+def getRouteSignature(a) -> tuple:
+  """
+  Summary:
+      Returns the agent attributes that affect route weights under the current
+      move rules. Agents at the same location with the same signature have
+      the same route weights.
+
+  Args:
+    a: Agent
+
+  Returns:
+      tuple: attribute signature of the agent.
+  """
+  signature = ()
+
+  if SimulationSettings.move_rules["ChildrenAvoidHazards"]:
+      signature += (a.attributes["age"] < 19,)
+      if SimulationSettings.move_rules["BoysTakeRisk"]:
+          signature += (a.attributes["gender"] == "male" and a.attributes["age"] > 14,)
+
+  if SimulationSettings.move_rules["FloodRulesEnabled"] is True and SimulationSettings.move_rules["FloodForecaster"] is True:
+      signature += (a.attributes["floodawareness"],)
+
+  if (
+      SimulationSettings.move_rules["MatchCampEthnicity"]
+      or SimulationSettings.move_rules["MatchConflictEthnicity"]
+      or SimulationSettings.move_rules["MatchTownEthnicity"]
+  ):
+      signature += (a.attributes["ethnicity"],)
+
+  return signature
+
+
+class RouteCache:
+  """
+  The RouteCache class. Stores normalized route distributions per
+  (location, attribute signature) for the duration of one time step.
+  """
+
+  def __init__(self):
+      self.entries = {}
+      self.hits = 0
+      self.misses = 0
+
+  def clear(self) -> None:
+      """
+      Summary:
+          Removes all cached distributions. Called at the start of every time step.
+
+      Args:
+          None.
+
+      Returns:
+          None.
+      """
+      self.entries = {}
+
+  def getDistribution(self, a, time: int):
+      """
+      Summary:
+          Returns the route distribution for an agent, calculating it on a cache miss.
+
+      Args:
+        a: Agent
+        time (int): Current time
+
+      Returns:
+          Tuple[List[List[str]], List[float], AliasTable]: routes,
+          normalized weights and an alias table to draw route indices from.
+      """
+      key = (a.location, getRouteSignature(a))
+      entry = self.entries.get(key, None)
+      if entry is not None:
+          self.hits += 1
+          return entry
+
+      self.misses += 1
+      weights, routes = getRouteDistribution(a, time=time)
+      if len(weights) > 0:
+          weights = normalizeWeights(weights=weights)
+      entry = (routes, weights, AliasTable(weights))
+      self.entries[key] = entry
+      return entry
+
+
+@check_args_type
+def selectRoute(a, time: int, debug: bool = False, return_all_routes: bool = False, cache=None):
+  """
+  Summary:
+      Selects a route for an agent to move to.
+
+  Args:
+    a: Agent
+    time (int): Current time
+    debug (bool, optional): Whether to print debug information. Defaults to False.
+    cache (RouteCache, optional): Cache of route distributions for the current time step.
+
+  Returns:
+      int: Index of the chosen route
+  """
+  if SimulationSettings.move_rules["AwarenessLevel"] == 0:
+      linklen = len(a.location.links)
+      return [np.random.randint(0, linklen)]
+
+  if return_all_routes is True and SimulationSettings.move_rules["FixedRoutes"] is not True:
+      return getRouteDistribution(a, time=time, debug=debug, return_all_routes=True)
+
+  if cache is not None and debug is False:
+      routes, weights, table = cache.getDistribution(a, time=time)
+      route = None
+      if len(routes) > 0:
+          route = routes[table.draw()]
+  else:
+      weights, routes = getRouteDistribution(a, time=time, debug=debug)
+      route = chooseFromWeights(weights=weights, routes=routes)
 
   if route == None:
       print("WARNING: Empty route (None type) generated in selectRoute.", file=sys.stderr)
@@ -530,4 +1011,3 @@ def selectRoute(a, time: int, debug: bool = False, return_all_routes: bool = Fal
   #print("route chosen:", route)
 
   return route
-
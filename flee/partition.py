@@ -0,0 +1,260 @@
+from __future__ import annotations, print_function
+
+import heapq
+import os
+from collections import deque
+
+import numpy as np
+
+if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
+    from beartype import beartype as check_args_type
+else:
+    def check_args_type(func):
+        return func
+
+
+# File for dividing the location graph over MPI ranks, used by the loc-owned
+# parallel mode of pflee (see pflee.Ecosystem.partition_locations).
+#
+# Parts are grown one at a time from a location at the edge of the remaining graph,
+# adding the neighbouring location with the most links into the part, until the part
+# holds its share of the weight. The parts are then refined by moving boundary
+# locations to the part that most of their neighbours belong to, as long as this
+# reduces the number of cut links and keeps the parts balanced.
+
+# Largest weight of a part after refinement, relative to the mean weight of all parts.
+max_part_imbalance = 1.05
+
+# Maximum number of refinement passes over all locations.
+refinement_passes = 8
+
+
+@check_args_type
+def location_graph(locations: list):
+    """
+    Summary:
+        Builds the undirected graph of a list of locations, with an edge between
+        two locations when there is an open or closed link between them.
+
+    Args:
+        locations (list): Location objects.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: offsets and neighbours of the graph in CSR format,
+        with the neighbours of location i in neighbours[offsets[i]:offsets[i+1]].
+    """
+    index = {id(loc): i for i, loc in enumerate(locations)}
+
+    pairs = []
+    for i, loc in enumerate(locations):
+        for link in loc.links + loc.closed_links:
+            j = index.get(id(link.endpoint), None)
+            if j is not None and j != i:
+                pairs.append((i, j))
+                pairs.append((j, i))
+
+    if len(pairs) == 0:
+        return np.zeros(len(locations) + 1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    pairs = np.unique(np.array(pairs, dtype=np.int64), axis=0)
+    offsets = np.zeros(len(locations) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(pairs[:, 0], minlength=len(locations)))
+    return offsets, pairs[:, 1].copy()
+
+
+def _peripheral_location(offsets, neighbours, owner, start: int) -> int:
+    """
+    Summary:
+        Returns the unassigned location that is last reached by a breadth-first
+        search from start, which lies at the edge of the unassigned graph.
+
+    Args:
+        offsets (np.ndarray): CSR offsets of the graph.
+        neighbours (np.ndarray): CSR neighbours of the graph.
+        owner (np.ndarray): part of every location, or -1 if it is unassigned.
+        start (int): unassigned location to search from.
+
+    Returns:
+        int: index of the location.
+    """
+    seen = {start}
+    queue = deque([start])
+    last = start
+    while queue:
+        last = queue.popleft()
+        for j in neighbours[offsets[last]:offsets[last + 1]]:
+            j = int(j)
+            if owner[j] < 0 and j not in seen:
+                seen.add(j)
+                queue.append(j)
+    return last
+
+
+def _grow_parts(offsets, neighbours, weights, parts: int) -> np.ndarray:
+    """
+    Summary:
+        Assigns every location to a part, growing the parts one at a time.
+
+    Args:
+        offsets (np.ndarray): CSR offsets of the graph.
+        neighbours (np.ndarray): CSR neighbours of the graph.
+        weights (np.ndarray): weight of every location.
+        parts (int): number of parts.
+
+    Returns:
+        np.ndarray: part of every location.
+    """
+    n = len(weights)
+    owner = np.full(n, -1, dtype=np.int32)
+    remaining = float(np.sum(weights))
+    next_unassigned = 0
+
+    for p in range(parts - 1):
+        target = remaining / (parts - p)
+        part_weight = 0.0
+        links_into_part = {}
+        heap = []
+        counter = 0
+
+        while True:
+            v = None
+            while heap:
+                links, _, u = heapq.heappop(heap)
+                if owner[u] < 0 and -links == links_into_part[u]:
+                    v = u
+                    break
+            if v is None:
+                # Start at (or continue from) the edge of an unassigned region.
+                while next_unassigned < n and owner[next_unassigned] >= 0:
+                    next_unassigned += 1
+                if next_unassigned == n:
+                    break
+                v = _peripheral_location(offsets, neighbours, owner, next_unassigned)
+
+            # Stop when adding the location overshoots the target more than leaving it out.
+            if part_weight > 0.0 and part_weight + weights[v] - target > target - part_weight:
+                break
+
+            owner[v] = p
+            part_weight += weights[v]
+            for u in neighbours[offsets[v]:offsets[v + 1]]:
+                u = int(u)
+                if owner[u] < 0:
+                    links_into_part[u] = links_into_part.get(u, 0) + 1
+                    counter += 1
+                    heapq.heappush(heap, (-links_into_part[u], counter, u))
+
+            if part_weight >= target:
+                break
+
+        remaining -= part_weight
+
+    owner[owner < 0] = parts - 1
+    return owner
+
+
+def _refine_parts(offsets, neighbours, weights, owner, parts: int) -> None:
+    """
+    Summary:
+        Moves locations at the boundary of their part to a neighbouring part when
+        this cuts fewer links, or the same number of links with a better balance.
+
+    Args:
+        offsets (np.ndarray): CSR offsets of the graph.
+        neighbours (np.ndarray): CSR neighbours of the graph.
+        weights (np.ndarray): weight of every location.
+        owner (np.ndarray): part of every location, updated in place.
+        parts (int): number of parts.
+
+    Returns:
+        None.
+    """
+    part_weights = np.bincount(owner, weights=weights, minlength=parts).astype(np.float64)
+    max_weight = max_part_imbalance * float(np.sum(weights)) / parts
+
+    for _ in range(refinement_passes):
+        moved = 0
+        for v in range(len(owner)):
+            a = int(owner[v])
+            links = {}
+            for u in neighbours[offsets[v]:offsets[v + 1]]:
+                b = int(owner[u])
+                links[b] = links.get(b, 0) + 1
+
+            # Prefer the largest reduction of cut links, then the lightest part.
+            best = None
+            best_key = None
+            for b, number in links.items():
+                if b == a:
+                    continue
+                gain = number - links.get(a, 0)
+                new_weight = part_weights[b] + weights[v]
+                if gain > 0 and new_weight <= max(max_weight, part_weights[a]):
+                    key = (gain, -part_weights[b])
+                elif gain == 0 and new_weight < part_weights[a]:
+                    key = (0, -part_weights[b])
+                else:
+                    continue
+                if best_key is None or key > best_key:
+                    best = b
+                    best_key = key
+
+            if best is not None:
+                owner[v] = best
+                part_weights[a] -= weights[v]
+                part_weights[best] += weights[v]
+                moved += 1
+
+        if moved == 0:
+            break
+
+
+@check_args_type
+def partition_locations(locations: list, parts: int, weights=None) -> np.ndarray:
+    """
+    Summary:
+        Divides a list of locations into parts of about equal weight, with few
+        links between locations in different parts. The result only depends on
+        the locations, their links and the weights.
+
+    Args:
+        locations (list): Location objects.
+        parts (int): number of parts.
+        weights (np.ndarray, optional): weight of every location. Defaults to 1 for every location.
+
+    Returns:
+        np.ndarray: part of every location.
+    """
+    if weights is None:
+        weights = np.ones(len(locations), dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+
+    if parts <= 1 or len(locations) == 0:
+        return np.zeros(len(locations), dtype=np.int32)
+
+    offsets, neighbours = location_graph(locations)
+    owner = _grow_parts(offsets, neighbours, weights, parts)
+    _refine_parts(offsets, neighbours, weights, owner, parts)
+    return owner
+
+
+@check_args_type
+def count_cut_links(locations: list, owner: np.ndarray) -> int:
+    """
+    Summary:
+        Counts the open links between locations in different parts.
+
+    Args:
+        locations (list): Location objects.
+        owner (np.ndarray): part of every location.
+
+    Returns:
+        int: number of cut links.
+    """
+    index = {id(loc): i for i, loc in enumerate(locations)}
+    cut = 0
+    for i, loc in enumerate(locations):
+        for link in loc.links:
+            if owner[index[id(link.endpoint)]] != owner[i]:
+                cut += 1
+    return cut
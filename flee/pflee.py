@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+import heapq
 import os
+import pickle
 import sys
+from collections import deque
 from functools import wraps
+from time import perf_counter
 from typing import List, Optional
 
 import numpy as np
-from flee import flee,scoring,spawning,crawling
+from flee import flee,scoring,spawning,crawling,checkpoint,partition
 from flee.Diagnostics import write_agents_par,write_links_par
+from flee.agentstore import AgentStore, CohortStore
+from flee.locationstore import CountStore, LocationStore
 from flee.SimulationSettings import SimulationSettings
 from mpi4py import MPI
 
@@ -23,6 +29,11 @@ else:
         return wrapper
 
 
+# Estimated cost of an agent in a location with a move chance of 0, relative to an
+# agent that moves every step (see Ecosystem._agent_costs).
+stationary_agent_cost = 0.1
+
+
 class MPIManager:
     """
     The MPIManager class
@@ -56,6 +67,18 @@ class MPIManager:
 
         return total
 
+    # pylint: disable=missing-function-docstring
+    @check_args_type
+    def StartCommWorldTotal(self, np_array):
+        # Non-blocking CalcCommWorldTotal: total is only complete after request.Wait().
+        assert np_array.size > 0
+
+        total = np.zeros(np_array.size, dtype="i")
+
+        request = self.comm.Iallreduce([np_array, MPI.INT], [total, MPI.INT], op=MPI.SUM)
+
+        return request, total
+
 
 class Person(flee.Person):
     """
@@ -140,6 +163,18 @@ class Person(flee.Person):
         return float(self.e.scores[(link.endpoint.id * 2) + 1])
 
 
+class PersonView(flee.PersonView):
+    """
+    The PersonView class: a parallel Person whose state lives in an AgentStore.
+    """
+
+    __slots__ = []
+
+    @property
+    def e(self):
+        return self._store.ecosystem
+
+
 class Location(flee.Location):
     """
     The Location class
@@ -183,6 +218,9 @@ class Location(flee.Location):
             None.
         """
         self.e = e
+        # numAgents and numAgentsOnRank are kept in the CountStore of the ecosystem.
+        self.count_store = e.count_store
+        self.count_slot = e.count_store.add()
 
         self.id = cur_id
         self.numAgentsSpawnedOnRank = 0
@@ -205,6 +243,56 @@ class Location(flee.Location):
         # Emptying this array, as it is not used in the parallel version.
         self.scores = []
 
+    @property
+    def numAgents(self):
+        return self.count_store.total[self.count_slot]
+
+    @numAgents.setter
+    def numAgents(self, value):
+        self.count_store.total[self.count_slot] = value
+
+    @property
+    def numAgentsOnRank(self):
+        return self.count_store.on_rank[self.count_slot]
+
+    @numAgentsOnRank.setter
+    def numAgentsOnRank(self, value):
+        self.count_store.on_rank[self.count_slot] = value
+
+
+    @check_args_type
+    def addLink(self, link) -> None:
+        """
+        Summary:
+            Adds an outgoing link to the location (see flee.Location.addLink).
+
+        Args:
+            link (Link): The link to add.
+
+        Returns:
+            None.
+        """
+        super().addLink(link)
+        self.e.count_layout = None
+        self.e.halo = None
+
+
+    @check_args_type
+    def updateLinkIndex(self) -> None:
+        """
+        Summary:
+            Rebuilds the endpoint name to link map (see flee.Location.updateLinkIndex).
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        super().updateLinkIndex()
+        self.e.count_layout = None
+        self.e.halo = None
+
 
     @check_args_type
     def DecrementNumAgents(self) -> None:
@@ -222,18 +310,19 @@ class Location(flee.Location):
 
 
     @check_args_type
-    def IncrementNumAgents(self, agent) -> None:
+    def IncrementNumAgents(self, agent, number: int = 1) -> None:
         """
         Summary: 
-            Increments the number of agents at the location by 1.
+            Increments the number of agents at the location on this rank.
 
         Args: 
-            None.
+            agent: The agent to add to the location.
+            number (int, optional): The number of agents added. Defaults to 1.
 
         Returns: 
             None.
         """
-        self.numAgentsOnRank += 1
+        self.numAgentsOnRank += number
 
 
     @check_args_type
@@ -268,6 +357,26 @@ class Location(flee.Location):
         return Ecosystem.scores[self.id * self.e.scores_per_location + index]
 
 
+    @staticmethod
+    def getScores(locations, index: int) -> np.ndarray:
+        """
+        Summary:
+            Gets the scores for the given index for a list of locations,
+            directly from the shared score array.
+
+        Args:
+            locations (List[Location]): The locations to get the scores of.
+            index (int): The index of the score to get.
+
+        Returns:
+            np.ndarray: The score of every location.
+        """
+        if len(locations) == 0:
+            return np.zeros(0)
+        ids = np.array([loc.id for loc in locations], dtype=np.int64)
+        return np.asarray(Ecosystem.scores, dtype=np.float64)[ids * locations[0].e.scores_per_location + index]
+
+
     @check_args_type
     def setScore(self, index: int, value: float) -> None:
         """
@@ -320,8 +429,37 @@ class Link(flee.Link):
         Returns:
             None.
         """
+        # numAgents and numAgentsOnRank are kept in the CountStore of the ecosystem.
+        self.count_store = startpoint.e.count_store
+        self.count_slot = self.count_store.add()
+
         super().__init__(startpoint, endpoint, distance, forced_redirection, attributes)
 
+    @property
+    def numAgents(self):
+        return self.count_store.total[self.count_slot]
+
+    @numAgents.setter
+    def numAgents(self, value):
+        self.count_store.total[self.count_slot] = value
+
+    @property
+    def numAgentsOnRank(self):
+        return self.count_store.on_rank[self.count_slot]
+
+    @numAgentsOnRank.setter
+    def numAgentsOnRank(self, value):
+        self.count_store.on_rank[self.count_slot] = value
+
+    def __copy__(self):
+        # Closed links are copies (see flee.Ecosystem._remove_link_1way), which
+        # count their agents separately from the original link.
+        link = type(self).__new__(type(self))
+        link.__dict__.update(self.__dict__)
+        link.count_slot = self.count_store.add()
+        link.numAgents = self.numAgents
+        link.numAgentsOnRank = self.numAgentsOnRank
+        return link
 
 
     @check_args_type
@@ -380,7 +518,14 @@ class Ecosystem(flee.Ecosystem):
     # single array holding all the location-related scores.
     # made static, assuming Parallel Flee simulations only have a single ecosystem.
     # (sequential Flee simulations have it non-static still).
-    scores = np.array([1.0, 1.0])
+    # scores is a view on _scores_buffer, which has room for more locations.
+    _scores_buffer = np.ones(128)
+    scores = _scores_buffer[:2]
+
+    # The MPI manager stays with the running process (see flee.checkpoint).
+    _checkpoint_exclude = ["mpi"]
+    # Forking processes that use MPI is not safe, so fork_scenarios runs branches from snapshots.
+    _can_fork = False
 
     @check_args_type
     def __init__(self):
@@ -396,9 +541,12 @@ class Ecosystem(flee.Ecosystem):
         """
         self.locations = []
         self.locationNames = []
-        self.agents = []
+        self.locationIndex = {}  # location name -> index in self.locations.
+        self.agents = self._create_agent_store()
+        self.route_cache = self._create_route_cache()
         self.total_agents = 0
         self.closures = []  # format [type, source, dest, start, end]
+        self.closure_schedule = None  # closures by day, see _schedule_closures.
         self.time = 0
         self.print_location_output = False
         self.mpi = MPIManager()
@@ -410,13 +558,29 @@ class Ecosystem(flee.Ecosystem):
         self.scores_per_location = 2
 
         # Bring conflict zone management into FLEE.
-        self.spawn_weights = np.array([])
+        self.location_store = LocationStore()
+        self.spawn_sampler = None
+
+        # Agent counts of all locations and links, and the slots that make up the
+        # total number of agents (see updateNumAgents).
+        self.count_store = CountStore()
+        self.count_layout = None
+
+        # Time spent on the agents of this rank since the last load balance check
+        # (see balance_agents).
+        self.agent_step_time = 0.0
 
-        # classic for replicated locations or loc-par for distributed
-        # locations.
+        # classic for replicated locations, loc-par for distributed location
+        # scores, or loc-owned for locations and their agents divided over the ranks.
         self.parallel_mode = "loc-par"
+
+        # Rank that owns every location in loc-owned mode (see partition_locations),
+        # and the scores and counts exchanged with other ranks (see _build_halo).
+        self.location_owner = None
+        self.halo = None
         # high_latency for fewer MPI calls with more prep, or low_latency for
-        # more MPI calls with less prep.
+        # more MPI calls with less prep, or overlap for high_latency with
+        # non-blocking MPI calls that run alongside local work in evolve().
         self.latency_mode = "high_latency"
 
         if SimulationSettings.log_levels["camp"] > 0:
@@ -424,6 +588,147 @@ class Ecosystem(flee.Ecosystem):
             self.travel_durations = []  # one element per time step.
 
 
+    @staticmethod
+    def _extend_scores(number: int) -> None:
+        """
+        Summary:
+            Appends a number of scores (set to 1.0) to Ecosystem.scores. The scores
+            are kept in a buffer that doubles in size when full, so that adding
+            locations does not copy all scores every time.
+
+        Args:
+            number (int): The number of scores to append.
+
+        Returns:
+            None.
+        """
+        size = len(Ecosystem.scores)
+        buffer = Ecosystem._scores_buffer
+        if size + number > len(buffer) or Ecosystem.scores.base is not buffer:
+            buffer = np.ones(max(2 * len(buffer), size + number))
+            buffer[:size] = Ecosystem.scores
+            Ecosystem._scores_buffer = buffer
+
+        buffer[size : size + number] = 1.0
+        Ecosystem.scores = buffer[: size + number]
+
+
+    @check_args_type
+    def _create_agent_store(self):
+        """
+        Summary:
+            Creates the container for the agents on this rank, depending on the
+            agent_engine optimisation setting.
+
+        Args:
+            None.
+
+        Returns:
+            list or AgentStore: a list of Person objects, an AgentStore or a CohortStore.
+        """
+        engine = SimulationSettings.optimisations.get("AgentEngine", "objects")
+        if engine == "arrays":
+            return AgentStore(view_class=PersonView, ecosystem=self)
+        if engine == "cohorts":
+            self._check_cohort_settings()
+            return CohortStore(view_class=PersonView, ecosystem=self)
+        return []
+
+
+    @check_args_type
+    def _append_agent(self, location, attributes) -> None:
+        """
+        Summary:
+            Creates a new agent on this rank and appends it to the agent container.
+
+        Args:
+            location (Location): The location to add the agent to.
+            attributes (dict): A dictionary of attributes for the agent.
+
+        Returns:
+            None.
+        """
+        if isinstance(self.agents, AgentStore):
+            self.agents.add(location, attributes)
+        else:
+            self.agents.append(Person(self, location=location, attributes=attributes))
+
+
+    @check_args_type
+    def _append_agents(self, location, number: int, attributes=None) -> None:
+        """
+        Summary:
+            Creates a number of new agents on this rank and appends them
+            to the agent container in one operation.
+
+        Args:
+            location (Location): The location to add the agents to.
+            number (int): The number of agents to add.
+            attributes (List[dict], optional): Attributes for every agent. Defaults to no attributes.
+
+        Returns:
+            None.
+        """
+        if isinstance(self.agents, AgentStore):
+            self.agents.add_many(location, number, attributes)
+        else:
+            if attributes is None:
+                attributes = [{} for _ in range(0, number)]
+            self.agents.extend([Person(self, location=location, attributes=a) for a in attributes])
+
+
+    @check_args_type
+    def _append_agents_on_rank(self, location, number: int, attributes=None) -> int:
+        """
+        Summary:
+            Numbers a batch of new agents, and appends the agents that belong
+            to this rank (in the same way as addAgent and insertAgent).
+
+        Args:
+            location (Location): The location to add the agents to.
+            number (int): The number of agents in the batch (on all ranks).
+            attributes (optional): Attributes for every agent in the batch, or a
+                function that returns the attributes for a given number of agents.
+
+        Returns:
+            int: The number of agents appended on this rank.
+        """
+        first = self.total_agents + 1
+        self.total_agents += number
+
+        if self.parallel_mode == "loc-owned":
+            # All agents of the batch reside on the rank that owns the location.
+            local = range(0, number if self._owns(location) else 0)
+        else:
+            # Agent j of the batch is agent number first + j, which resides on rank (first + j) % size.
+            local = range((self.mpi.rank - first) % self.mpi.size, number, self.mpi.size)
+        if callable(attributes):
+            attributes = attributes(len(local))
+        elif attributes is not None:
+            attributes = [attributes[j] for j in local]
+        self._append_agents(location=location, number=len(local), attributes=attributes)
+        return len(local)
+
+
+    @check_args_type
+    def _is_local_agent(self, location) -> bool:
+        """
+        Summary:
+            Returns whether the agent that was last numbered (self.total_agents)
+            resides on this rank: on the rank that owns its location in loc-owned
+            mode, and round-robin otherwise.
+
+        Args:
+            location (Location): The location of the new agent.
+
+        Returns:
+            bool: Whether the agent resides on this rank.
+        """
+        if self.parallel_mode == "loc-owned":
+            return self._owns(location)
+        return self.total_agents % self.mpi.size == self.mpi.rank
+
+
     @check_args_type
     def getRankN(self, t: int) -> bool:
         """
@@ -480,13 +785,8 @@ class Ecosystem(flee.Ecosystem):
         forced_redirection: bool = False,
         attributes: dict = {},
     ) -> None:
-        endpoint1_index = -1
-        endpoint2_index = -1
-        for i in range(0, len(self.locationNames)):
-            if self.locationNames[i] == endpoint1:
-                endpoint1_index = i
-            if self.locationNames[i] == endpoint2:
-                endpoint2_index = i
+        endpoint1_index = self.locationIndex.get(endpoint1, -1)
+        endpoint2_index = self.locationIndex.get(endpoint2, -1)
 
         if endpoint1_index < 0:
             print("Diagnostic: Ecosystem.locationNames: ", self.locationNames, file=sys.stderr)
@@ -501,7 +801,7 @@ class Ecosystem(flee.Ecosystem):
                     endpoint2, endpoint1), file=sys.stderr)
             sys.exit()
 
-        self.locations[endpoint1_index].links.append(
+        self.locations[endpoint1_index].addLink(
             Link(
                 startpoint=self.locations[endpoint1_index],
                 endpoint=self.locations[endpoint2_index],
@@ -510,7 +810,7 @@ class Ecosystem(flee.Ecosystem):
                 attributes=attributes,
             )
         )
-        self.locations[endpoint2_index].links.append(
+        self.locations[endpoint2_index].addLink(
             Link(
                 startpoint=self.locations[endpoint2_index],
                 endpoint=self.locations[endpoint1_index],
@@ -536,7 +836,9 @@ class Ecosystem(flee.Ecosystem):
 
         total = 0
 
-        if mode == "low_latency":
+        if self.parallel_mode == "loc-owned":
+            self._update_owned_counts(CountClosed=CountClosed)
+        elif mode == "low_latency":
             for loc in self.locations:
                 loc.numAgents = self.mpi.CalcCommWorldTotalSingle(loc.numAgentsOnRank)
                 total += loc.numAgents
@@ -552,203 +854,1201 @@ class Ecosystem(flee.Ecosystem):
                         #       file=sys.stderr)
                         total += link.numAgents
             self.total_agents = total
-        elif mode == "high_latency":
-            buf_len = 0
+        elif mode in ["high_latency", "overlap"]:
+            self._finish_count_reduction(self._start_count_reduction(), CountClosed=CountClosed)
 
-            buf_len += len(self.locations)
-            for loc in self.locations:
-                buf_len += len(loc.links)
-                if CountClosed:
-                    buf_len += len(loc.closed_links)
-
-            numAgent_buffer = np.empty(buf_len, dtype="i")
+        if self.mpi.rank == 0 and log is True:
+            print(
+                "NumAgents updated. Total agents in simulation:", self.total_agents, file=sys.stderr
+            )
 
-            index = 0
-            for loc in self.locations:
-                numAgent_buffer[index] = loc.numAgentsOnRank
-                index += 1
-                for link in loc.links:
-                    numAgent_buffer[index] = link.numAgentsOnRank
-                    index += 1
-                if CountClosed:
-                    for link in loc.closed_links:
-                        numAgent_buffer[index] = link.numAgentsOnRank
-                        index += 1
+    @check_args_type
+    def _start_count_reduction(self):
+        """
+        Summary:
+            Starts summing up the agent counts of all ranks into the reduced
+            counts of the count store. Counts are kept in the slots of the count
+            store as agents move, so they can be reduced without packing and
+            unpacking them. In overlap mode the full reduction is non-blocking,
+            and the reduced counts may only be used after _finish_count_reduction.
 
-            new_buffer = self.mpi.CalcCommWorldTotal(numAgent_buffer)
+        Args:
+            None.
 
-            index = 0
-            for loc in self.locations:
-                loc.numAgents = new_buffer[index]
-                index += 1
-                for link in loc.links:
-                    link.numAgents = new_buffer[index]
-                    index += 1
-                if CountClosed:
-                    for link in loc.closed_links:
-                        link.numAgents = new_buffer[index]
-                        index += 1
+        Returns:
+            MPI.Request or None: the pending reduction, or None if it is complete.
+        """
+        store = self.count_store
+        n = store.size
 
-            self.total_agents = np.sum(new_buffer)
+        if SimulationSettings.optimisations["CountReduction"] == "delta":
+            self._reduce_count_deltas()
+            return None
 
-        if self.mpi.rank == 0 and log is True:
-            print(
-                "NumAgents updated. Total agents in simulation:", self.total_agents, file=sys.stderr
+        if self.latency_mode == "overlap":
+            return self.mpi.comm.Iallreduce(
+                [store.on_rank[:n], MPI.INT], [store.reduced[:n], MPI.INT], op=MPI.SUM
             )
 
-    """
-    Add & insert agent functions.
-    TODO: make addAgent function smarter, to prevent large load imbalances
-    over time due to removals by clearLocationFromAgents?
-    """
+        self.mpi.comm.Allreduce([store.on_rank[:n], MPI.INT], [store.reduced[:n], MPI.INT], op=MPI.SUM)
+        return None
+
 
     @check_args_type
-    def addAgent(self, location, attributes) -> None:
+    def _finish_count_reduction(self, request, CountClosed: bool = False) -> None:
         """
-        Summary: 
-            Adds an agent to the ecosystem at the specified location.
+        Summary:
+            Completes a reduction started by _start_count_reduction, and sets the
+            agent counts of all locations and links and the total number of agents.
 
         Args:
-            location (Location): The location to add the agent to.
-            attributes (dict): A dictionary of attributes for the agent.
+            request (MPI.Request or None): the pending reduction.
+            CountClosed (bool, optional): Whether to count agents on closed links. Defaults to False.
 
         Returns:
             None.
         """
-        if SimulationSettings.spawn_rules["TakeFromPopulation"]:
-            if location.pop > 1: 
-                location.pop -= 1
-                location.numAgentsSpawnedOnRank += 1
-                location.numAgentsSpawned += 1
-            else:
-                print(
-                    "ERROR: Number of agents in the simulation is larger than the combined "
-                    "population of the conflict zones. Please amend locations.csv." 
-                )
-                location.print()
-                assert location.pop > 1
-        self.total_agents += 1
-        if self.total_agents % self.mpi.size == self.mpi.rank:
-            self.agents.append(Person(self, location=location, attributes=attributes))
+        if request is not None:
+            request.Wait()
+
+        store = self.count_store
+        n = store.size
+        store.total[:n] = store.reduced[:n]
+
+        self.total_agents = np.sum(store.total[self._count_layout_slots(CountClosed)])
 
 
     @check_args_type
-    def insertAgent(self, location, attributes={}) -> None:
+    def _count_layout_slots(self, CountClosed: bool) -> np.ndarray:
         """
-        Summary: 
-            Inserts an agent into the ecosystem at the specified location.
-            Note: insert Agent does NOT take from Population.
+        Summary:
+            Returns the count store slots of all locations and their links, which
+            make up the total number of agents. The slots are cached until
+            locations or links are added, removed, closed or reopened.
 
         Args:
-            location (Location): The location to insert the agent into.
+            CountClosed (bool): Whether to include closed links.
 
         Returns:
-            None.
+            np.ndarray: slot indices.
         """
-        self.total_agents += 1
-        if self.total_agents % self.mpi.size == self.mpi.rank:
-            self.agents.append(Person(self, location=location, attributes=attributes))
+        if self.count_layout is None:
+            open_slots = []
+            closed_slots = []
+            for loc in self.locations:
+                open_slots.append(loc.count_slot)
+                for link in loc.links:
+                    open_slots.append(link.count_slot)
+                for link in loc.closed_links:
+                    closed_slots.append(link.count_slot)
+            open_slots = np.array(open_slots, dtype=np.int64)
+            self.count_layout = (open_slots, np.concatenate((open_slots, np.array(closed_slots, dtype=np.int64))))
+
+        return self.count_layout[1] if CountClosed else self.count_layout[0]
 
 
     @check_args_type
-    def insertAgents(self, location, number: int) -> None:
+    def _reduce_count_deltas(self) -> None:
         """
-        Summary: 
-            Inserts a number of agents into the ecosystem at the specified
-            location.
-            Note: insert Agent does NOT take from Population.
+        Summary:
+            Updates the reduced agent counts with only the counts that changed on
+            any rank since the last reduction. Every rank shares the slots and
+            changes of its own counts, and all ranks add up all changes.
 
         Args:
-            location (Location): The location to insert the agents into.
-            number (int): The number of agents to insert.
+            None.
 
         Returns:
             None.
         """
-        for _ in range(0, number):
-            self.insertAgent(location=location)
+        store = self.count_store
+        n = store.size
 
+        changed = np.flatnonzero(store.on_rank[:n] != store.reduced_on_rank[:n]).astype("i")
+        deltas = (store.on_rank[changed] - store.reduced_on_rank[changed]).astype("i")
+        store.reduced_on_rank[changed] = store.on_rank[changed]
 
-    @check_args_type
-    def clearLocationsFromAgents(self, location_names: List[str]) -> None:
-        """
-        Summary: 
-            Remove all agents from a list of locations by name.
-            Useful for couplings to other simulation codes.
+        sizes = np.array(self.mpi.comm.allgather(len(changed)), dtype="i")
+        offsets = np.zeros(len(sizes), dtype="i")
+        offsets[1:] = np.cumsum(sizes)[:-1]
 
-            TODO : REWRITE!!
+        all_changed = np.empty(int(np.sum(sizes)), dtype="i")
+        all_deltas = np.empty(int(np.sum(sizes)), dtype="i")
+        self.mpi.comm.Allgatherv([changed, MPI.INT], [all_changed, (sizes, offsets), MPI.INT])
+        self.mpi.comm.Allgatherv([deltas, MPI.INT], [all_deltas, (sizes, offsets), MPI.INT])
 
-        Args:
-            location_names (List[str]): A list of location names to remove agents from.
+        np.add.at(store.reduced, all_changed, all_deltas)
 
-        Returns: 
-            None. 
+
+    @staticmethod
+    def _agent_cost(place) -> float:
         """
+        Summary:
+            Estimates the cost of processing an agent in a place for one time step.
+            Agents on links always travel on, agents in locations cost more the more
+            likely they are to move, and agents without a location cost nothing.
 
-        new_agents = []
-        for agent in self.agents:
-            if agent.location.name not in location_names:
-                new_agents += [agent]
-            else:
-                # print("Agent removed: ", agent.location.name)
-                # agent is removed from ecosystem and number of agents in
-                # location drops by one.
-                agent.location.numAgentsOnRank -= 1
+        Args:
+            place (Location, Link or None): the place of the agent.
 
-        self.agents = new_agents
-        print("clearLocationsFromAgents()", file=sys.stderr)
-        # when numAgentsOnRank has changed, we need to updateNumAgents (1x
-        # MPI_Allreduce)
-        self.updateNumAgents(log=False)
+        Returns:
+            float: estimated cost, between 0 and 1.
+        """
+        if place is None:
+            return 0.0
+        if isinstance(place, flee.Link):
+            return 1.0
+        return stationary_agent_cost + (1.0 - stationary_agent_cost) * min(float(place.movechance), 1.0)
 
 
     @check_args_type
-    def numAgents(self) -> int:
+    def _agent_costs(self):
         """
-        Summary: 
-            Returns the number of agents in the ecosystem.
+        Summary:
+            Estimates the cost of every agent on this rank (see _agent_cost).
 
         Args:
             None.
 
         Returns:
-            int: The number of agents in the ecosystem.
+            Tuple[np.ndarray, np.ndarray]: the cost of every individual agent, and the
+            cost of one member of every cohort (empty unless agents are kept in cohorts).
         """
-        return int(self.total_agents)
+        if isinstance(self.agents, AgentStore):
+            store = self.agents
+            place_costs = store.place_values(self._agent_cost)
+            costs = place_costs[store.place[:store.size]]
+            if isinstance(store, CohortStore):
+                return costs, place_costs[store.cohort_place[:store.num_cohorts]]
+            return costs, np.zeros(0)
 
+        return np.array([self._agent_cost(a.location) for a in self.agents], dtype=np.float64), np.zeros(0)
 
-    @check_args_type
-    def numAgentsOnRank(self) -> int:
+
+    @staticmethod
+    def _balance_plan(costs: np.ndarray) -> np.ndarray:
         """
         Summary:
-            Returns the number of agents on the current process.
+            Plans how much agent cost every rank sends to every other rank, so that
+            all ranks end up with the mean cost. Ranks above the mean send to ranks
+            below it, in rank order. Every rank computes the same plan.
 
         Args:
-            None.
+            costs (np.ndarray): estimated agent cost of every rank.
 
         Returns:
-            int: The number of agents on the current process.
+            np.ndarray: cost sent from every rank (rows) to every rank (columns).
         """
-        return len(self.agents)
+        size = len(costs)
+        plan = np.zeros((size, size))
+        excess = costs - np.mean(costs)
+        senders = [r for r in range(size) if excess[r] > 0]
+        receivers = [r for r in range(size) if excess[r] < 0]
+
+        i = 0
+        j = 0
+        while i < len(senders) and j < len(receivers):
+            s = senders[i]
+            r = receivers[j]
+            amount = min(excess[s], -excess[r])
+            plan[s, r] = amount
+            excess[s] -= amount
+            excess[r] += amount
+            if excess[s] <= 0:
+                i += 1
+            if excess[r] >= 0:
+                j += 1
+        return plan
 
 
     @check_args_type
-    def synchronize_locations(self, start_loc_local: int, end_loc_local: int, Debug: bool = False) -> None:
+    def balance_agents(self, force: bool = False) -> bool:
         """
-        Summary: 
-            Gathers the scores from all the updated locations,
-            and propagates them across the processes.
+        Summary:
+            Migrates agents between ranks when the agent time or the number of
+            agents of the busiest rank exceeds the mean of all ranks by more than
+            the load_balance_threshold, or when force is True. Agents are moved
+            from ranks with more than the mean estimated agent cost to ranks with
+            less (see _agent_cost). In loc-owned mode the locations are divided
+            over the ranks again instead (see _partition_by_cost). The agent counts
+            of locations and links do not change.
 
         Args:
-            start_loc_local (int): The index of the first location to synchronize.
-            end_loc_local (int): The index of the last location to synchronize.
-            Debug (bool, optional): Turns on debugging output. Defaults to False.
+            force (bool, optional): Balance regardless of the measured imbalance. Defaults to False.
 
         Returns:
-            None.
+            bool: Whether agents were migrated.
         """
-
-        base = int((len(Ecosystem.scores) / self.scores_per_location) / self.mpi.size)
+        costs, cohort_costs = self._agent_costs()
+        num_alive = np.count_nonzero(costs)
+        cohort_cost = 0.0
+        if len(cohort_costs) > 0:
+            cohort_counts = self.agents.cohort_count[: len(cohort_costs)]
+            num_alive += int(np.sum(cohort_counts[cohort_costs > 0]))
+            cohort_cost = float(np.sum(cohort_costs * cohort_counts))
+
+        local = np.array([self.agent_step_time, num_alive, np.sum(costs) + cohort_cost], dtype=np.float64)
+        stats = np.zeros((self.mpi.size, 3), dtype=np.float64)
+        self.mpi.comm.Allgather(local, stats)
+        self.agent_step_time = 0.0
+
+        imbalance = 1.0
+        for column in [stats[:, 0], stats[:, 1]]:
+            if np.mean(column) > 0:
+                imbalance = max(imbalance, np.max(column) / np.mean(column))
+
+        if not force and imbalance <= SimulationSettings.optimisations["LoadBalanceThreshold"]:
+            return False
+
+        if self.parallel_mode == "loc-owned":
+            # Agents stay with the owners of their locations, so the locations are divided again.
+            moved = self._partition_by_cost()
+            self.updateNumAgents(log=False)
+            self._collect_location_counts()
+        else:
+            plan = self._balance_plan(stats[:, 2])
+            moved = self._migrate_agents(plan[self.mpi.rank], costs, cohort_costs, float(local[2]))
+
+        moved = self.mpi.CalcCommWorldTotalSingle(moved)
+        if self.mpi.rank == 0:
+            print(
+                "Load balancing: imbalance {:.2f}, migrated {} agents.".format(imbalance, moved), file=sys.stderr
+            )
+        return True
+
+
+    @check_args_type
+    def _place_numbers(self):
+        """
+        Summary:
+            Numbers all locations and links (including closed links) in the same
+            order on every rank, so that agents can refer to their places across ranks.
+
+        Args:
+            None.
+
+        Returns:
+            Tuple[list, dict]: the locations and links, and their numbers by object id.
+        """
+        places = list(self.locations)
+        for loc in self.locations:
+            places += loc.links
+            places += loc.closed_links
+        return places, {id(p): k for k, p in enumerate(places)}
+
+
+    @check_args_type
+    def _agents_in_numbered_places(self, indices: np.ndarray, numbers: dict) -> np.ndarray:
+        """
+        Summary:
+            Returns which of a selection of agents are in a place numbered by
+            _place_numbers, or have no place.
+
+        Args:
+            indices (np.ndarray): agent indices.
+            numbers (dict): place numbers by object id.
+
+        Returns:
+            np.ndarray: boolean mask over indices.
+        """
+        if isinstance(self.agents, AgentStore):
+            store = self.agents
+            numbered = store.place_values(lambda p: id(p) in numbers, dtype=bool, default=True)
+            return numbered[store.place[indices]]
+
+        return np.array(
+            [self.agents[i].location is None or id(self.agents[i].location) in numbers for i in indices], dtype=bool
+        )
+
+
+    @check_args_type
+    def _migrate_agents(self, amounts: np.ndarray, costs: np.ndarray, cohort_costs: np.ndarray, local_cost: float) -> int:
+        """
+        Summary:
+            Selects agents with the planned cost for every other rank, and
+            exchanges them with the other ranks (see _exchange_agents).
+
+        Args:
+            amounts (np.ndarray): cost to send to every rank.
+            costs (np.ndarray): cost of every individual agent on this rank.
+            cohort_costs (np.ndarray): cost of one member of every cohort.
+            local_cost (float): total cost of all agents on this rank.
+
+        Returns:
+            int: The number of agents sent by this rank.
+        """
+        if np.sum(amounts) > 0 and len(cohort_costs) > 0:
+            # Cohort members only exist as counts, so a share of every cohort is
+            # made individual first, keeping the mix of agents on both sides.
+            fraction = min(1.0, np.sum(amounts) / local_cost)
+            for k in np.flatnonzero(cohort_costs > 0):
+                self.agents.materialise(k, int(self.agents.cohort_count[k] * fraction))
+            costs, _ = self._agent_costs()
+
+        # The most recently added agents are sent first.
+        order = np.flatnonzero(costs > 0)[::-1]
+        bounds = np.searchsorted(np.cumsum(costs[order]), np.cumsum(amounts), side="right")
+
+        selected = []
+        start = 0
+        for r in range(self.mpi.size):
+            selected.append(np.sort(order[start : bounds[r]]))
+            start = bounds[r]
+
+        return self._exchange_agents(selected)
+
+
+    @check_args_type
+    def _exchange_agents(self, selected: list) -> int:
+        """
+        Summary:
+            Sends individual agents to other ranks, and adds the agents received
+            from other ranks. Agent state is serialized per destination and
+            exchanged with a single Alltoallv. Per-rank agent counts of locations
+            and links are updated, so the total counts do not change.
+
+        Args:
+            selected (list): sorted indices of the agents to send to every rank.
+
+        Returns:
+            int: The number of agents sent by this rank.
+        """
+        numbering = None
+
+        payloads = []
+        sent = []
+        for r in range(self.mpi.size):
+            if r == self.mpi.rank or len(selected[r]) == 0:
+                payloads.append(b"")
+                continue
+            if numbering is None:
+                numbering = self._place_numbers()
+            numbers = numbering[1]
+
+            def place_number(p):
+                return numbers[id(p)]
+
+            # Agents still on a link that has been closed stay until finish_travel
+            # returns them to its startpoint, as other ranks cannot refer to the
+            # original link (see flee.Ecosystem._remove_link_1way).
+            selected[r] = selected[r][self._agents_in_numbered_places(selected[r], numbers)]
+            if len(selected[r]) == 0:
+                payloads.append(b"")
+                continue
+
+            if isinstance(self.agents, AgentStore):
+                data = self.agents.export_agents(selected[r], place_number)
+            else:
+                data = self._export_persons(selected[r], place_number)
+            payloads.append(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+            sent.append(selected[r])
+
+        sent = np.concatenate(sent) if len(sent) > 0 else np.zeros(0, dtype=np.int64)
+        if len(sent) > 0:
+            if isinstance(self.agents, AgentStore):
+                store = self.agents
+                keep = np.ones(store.size, dtype=bool)
+                keep[sent] = False
+                removed = np.bincount(store.place[sent], minlength=len(store.places))
+                for k in np.flatnonzero(removed):
+                    store.places[k].numAgentsOnRank -= int(removed[k])
+                store.keep(keep)
+            else:
+                keep = np.ones(len(self.agents), dtype=bool)
+                keep[sent] = False
+                for i in sent:
+                    self.agents[i].location.numAgentsOnRank -= 1
+                self.agents = [a for a, kept in zip(self.agents, keep) if kept]
+
+        sendcounts = np.array([len(p) for p in payloads], dtype="i")
+        recvcounts = np.zeros(self.mpi.size, dtype="i")
+        self.mpi.comm.Alltoall(sendcounts, recvcounts)
+
+        sdispls = np.zeros(self.mpi.size, dtype="i")
+        sdispls[1:] = np.cumsum(sendcounts)[:-1]
+        rdispls = np.zeros(self.mpi.size, dtype="i")
+        rdispls[1:] = np.cumsum(recvcounts)[:-1]
+
+        sendbuf = np.frombuffer(b"".join(payloads), dtype=np.uint8)
+        recvbuf = np.empty(int(np.sum(recvcounts)), dtype=np.uint8)
+        self.mpi.comm.Alltoallv(
+            [sendbuf, (sendcounts, sdispls), MPI.BYTE], [recvbuf, (recvcounts, rdispls), MPI.BYTE]
+        )
+
+        for r in range(self.mpi.size):
+            if recvcounts[r] == 0:
+                continue
+            if numbering is None:
+                numbering = self._place_numbers()
+            places = numbering[0]
+            data = pickle.loads(recvbuf[rdispls[r] : rdispls[r] + recvcounts[r]].tobytes())
+            if isinstance(self.agents, AgentStore):
+                self.agents.import_agents(data, places)
+            else:
+                self._import_persons(data, places)
+            received, counts = np.unique(data["place"][data["place"] >= 0], return_counts=True)
+            for k, number in zip(received, counts):
+                places[k].numAgentsOnRank += int(number)
+
+        return len(sent)
+
+
+    @check_args_type
+    def _export_persons(self, indices: np.ndarray, place_number) -> dict:
+        """
+        Summary:
+            Returns the state of a selection of Person objects in the format of
+            AgentStore.export_agents.
+
+        Args:
+            indices (np.ndarray): indices of the agents in self.agents.
+            place_number: function returning the number of a Location or Link object.
+
+        Returns:
+            dict: agent state (see AgentStore.export_agents).
+        """
+        agents = [self.agents[i] for i in indices]
+
+        def number(p):
+            return -1 if p is None else place_number(p)
+
+        data = {
+            "place": np.array([number(a.location) for a in agents], dtype=np.int64),
+            "home": np.array([number(a.home_location) for a in agents], dtype=np.int64),
+        }
+        for name in AgentStore._array_names:
+            if name not in data:
+                data[name] = np.array([getattr(a, name, 0) for a in agents])
+
+        # Every agent gets its own attribute categories.
+        attributes = {}
+        for j, a in enumerate(agents):
+            for name, value in a.attributes.items():
+                if name not in attributes:
+                    attributes[name] = ([], np.full(len(agents), -1, dtype=np.int32))
+                categories, codes = attributes[name]
+                codes[j] = len(categories)
+                categories.append(value)
+        data["attributes"] = attributes
+
+        data["routes"] = {j: a.route for j, a in enumerate(agents) if a.route}
+        data["locations_visited"] = {
+            j: [number(p) for p in getattr(a, "locations_visited", [])]
+            for j, a in enumerate(agents)
+            if getattr(a, "locations_visited", None)
+        }
+        return data
+
+
+    @check_args_type
+    def _import_persons(self, data: dict, places) -> None:
+        """
+        Summary:
+            Appends Person objects for agents exported by _export_persons.
+            Agent counts in locations are not modified here.
+
+        Args:
+            data (dict): agent state (see AgentStore.export_agents).
+            places: Location and Link objects, indexed by place number.
+
+        Returns:
+            None.
+        """
+        columns = {name: data[name].tolist() for name in AgentStore._array_names}
+        for j, (p, h) in enumerate(zip(columns["place"], columns["home"])):
+            a = Person.__new__(Person)
+            a.e = self
+            a.location = places[p] if p >= 0 else None
+            a.home_location = places[h] if h >= 0 else None
+            a.travelling = columns["travelling"][j]
+            a.distance_travelled_on_link = columns["distance_travelled_on_link"][j]
+            a.distance_moved_this_timestep = columns["distance_moved_this_timestep"][j]
+            a.recent_travel_distance = columns["recent_travel_distance"][j]
+            a.places_travelled = columns["places_travelled"][j]
+            a.timesteps_since_departure = columns["timesteps_since_departure"][j]
+            a.attributes = {
+                name: categories[codes[j]] for name, (categories, codes) in data["attributes"].items() if codes[j] >= 0
+            }
+            a.route = list(data["routes"].get(j, []))
+            if SimulationSettings.log_levels["agent"] > 0:
+                a.distance_travelled = columns["distance_travelled"][j]
+            if SimulationSettings.log_levels["agent"] > 1:
+                a.locations_visited = [places[k] for k in data["locations_visited"].get(j, [])]
+            self.agents.append(a)
+
+
+    """
+    Location-owned mode functions.
+    In loc-owned mode every location is owned by one rank (see partition_locations),
+    which holds all agents in the location and on the links towards it. Agents only
+    move to another rank when they cross a link between locations of different ranks,
+    and ranks only exchange the scores and counts of locations near their own.
+    """
+
+    @check_args_type
+    def _owns(self, location) -> bool:
+        """
+        Summary:
+            Returns whether this rank owns a location in loc-owned mode.
+
+        Args:
+            location (Location): The location.
+
+        Returns:
+            bool: Whether the location is owned by this rank.
+        """
+        self._ensure_partition()
+        return bool(self.location_owner[location.id] == self.mpi.rank)
+
+
+    @check_args_type
+    def _ensure_partition(self) -> None:
+        """
+        Summary:
+            Divides the locations over the ranks if this has not been done yet,
+            or if locations were added since (see partition_locations).
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        if self.location_owner is None or len(self.location_owner) != len(self.locations):
+            self.partition_locations()
+
+
+    @check_args_type
+    def partition_locations(self, weights=None) -> int:
+        """
+        Summary:
+            Divides the locations over the ranks for loc-owned mode, with about the
+            same weight on every rank and few links between locations of different
+            ranks (see partition.partition_locations). Agents in places owned by
+            another rank are sent to that rank. Every rank computes the same division.
+
+        Args:
+            weights (np.ndarray, optional): weight of every location. Defaults to 1 for every location.
+
+        Returns:
+            int: The number of agents sent by this rank.
+        """
+        self.location_owner = partition.partition_locations(self.locations, self.mpi.size, weights)
+        self.halo = None
+
+        moved = self._send_agents_to_owners()
+        self._send_remaining_counts()
+
+        if self.mpi.rank == 0:
+            print(
+                "Partitioned {} locations over {} ranks, with {} of {} links between ranks.".format(
+                    len(self.locations),
+                    self.mpi.size,
+                    partition.count_cut_links(self.locations, self.location_owner),
+                    sum(len(loc.links) for loc in self.locations),
+                ),
+                file=sys.stderr,
+            )
+        return moved
+
+
+    @check_args_type
+    def _place_owner(self, place) -> int:
+        """
+        Summary:
+            Returns the rank that owns a location or link in loc-owned mode. Links
+            are owned by the owner of their endpoint, towards which agents travel.
+
+        Args:
+            place (Location or Link): The place.
+
+        Returns:
+            int: The owning rank.
+        """
+        if isinstance(place, flee.Link):
+            place = place.endpoint
+        return int(self.location_owner[place.id])
+
+
+    @check_args_type
+    def _send_agents_to_owners(self) -> int:
+        """
+        Summary:
+            Sends the agents in locations and on links owned by other ranks to
+            their owners. Agents without a location stay on their rank.
+
+        Args:
+            None.
+
+        Returns:
+            int: The number of agents sent by this rank.
+        """
+        rank = self.mpi.rank
+
+        if isinstance(self.agents, AgentStore):
+            store = self.agents
+            owners = store.place_values(self._place_owner, dtype=np.int32, default=rank)
+            if isinstance(store, CohortStore):
+                # Cohort members only exist as counts, so cohorts in places of
+                # other ranks are made individual first.
+                nc = store.num_cohorts
+                for k in np.flatnonzero((owners[store.cohort_place[:nc]] != rank) & (store.cohort_count[:nc] > 0)):
+                    store.materialise(k, int(store.cohort_count[k]))
+            agent_owners = owners[store.place[:store.size]]
+        else:
+            agent_owners = np.array(
+                [rank if a.location is None else self._place_owner(a.location) for a in self.agents], dtype=np.int32
+            )
+
+        selected = [np.flatnonzero(agent_owners == r) for r in range(self.mpi.size)]
+        return self._exchange_agents(selected)
+
+
+    @check_args_type
+    def _send_remaining_counts(self) -> None:
+        """
+        Summary:
+            Moves the per-rank counts that remain in places owned by other ranks
+            after their agents were sent, to the owners. These are the counts of
+            agents deactivated in camps (see _deactivate_agents_in_camps), which
+            still count towards the camp population.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        places, _ = self._place_numbers()
+
+        numbers = [[] for _ in range(self.mpi.size)]
+        counts = [[] for _ in range(self.mpi.size)]
+        for k, p in enumerate(places):
+            r = self._place_owner(p)
+            if r != self.mpi.rank and p.numAgentsOnRank != 0:
+                numbers[r].append(k)
+                counts[r].append(p.numAgentsOnRank)
+                p.numAgentsOnRank = 0
+
+        sendbuf = np.array(sum([numbers[r] + counts[r] for r in range(self.mpi.size)], []), dtype=np.int64)
+        sendcounts = np.array([2 * len(numbers[r]) for r in range(self.mpi.size)], dtype="i")
+        recvbuf, recvcounts, rdispls = self._exchange_int64(sendbuf, sendcounts)
+
+        for r in range(self.mpi.size):
+            n = recvcounts[r] // 2
+            received = recvbuf[rdispls[r] : rdispls[r] + recvcounts[r]]
+            for k, count in zip(received[:n], received[n:]):
+                places[k].numAgentsOnRank += int(count)
+
+
+    @check_args_type
+    def _exchange_int64(self, sendbuf: np.ndarray, sendcounts: np.ndarray):
+        """
+        Summary:
+            Exchanges int64 values with all other ranks, with one Alltoall for the
+            number of values and one Alltoallv for the values.
+
+        Args:
+            sendbuf (np.ndarray): values for every rank, in rank order.
+            sendcounts (np.ndarray): number of values for every rank.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: the received values, and the
+            number and offset of the values received from every rank.
+        """
+        recvcounts = np.zeros(self.mpi.size, dtype="i")
+        self.mpi.comm.Alltoall(sendcounts, recvcounts)
+
+        sdispls = np.zeros(self.mpi.size, dtype="i")
+        sdispls[1:] = np.cumsum(sendcounts)[:-1]
+        rdispls = np.zeros(self.mpi.size, dtype="i")
+        rdispls[1:] = np.cumsum(recvcounts)[:-1]
+
+        recvbuf = np.zeros(int(np.sum(recvcounts)), dtype=np.int64)
+        self.mpi.comm.Alltoallv(
+            [sendbuf, (sendcounts, sdispls), MPI.INT64_T], [recvbuf, (recvcounts, rdispls), MPI.INT64_T]
+        )
+        return recvbuf, recvcounts, rdispls
+
+
+    @check_args_type
+    def _halo_locations(self, owned: np.ndarray) -> np.ndarray:
+        """
+        Summary:
+            Returns the locations owned by other ranks whose scores or agent counts
+            the agents of this rank can use in a time step: the locations they can
+            reach (including the startpoints of links towards owned locations, to
+            which agents return when a link closes), and the locations within the
+            awareness level of those. Marker locations do not count as a step.
+            With FixedRoutes, routes can lead anywhere, so all locations are returned.
+
+        Args:
+            owned (np.ndarray): whether every location is owned by this rank.
+
+        Returns:
+            np.ndarray: whether every location is in the halo of this rank.
+        """
+        if SimulationSettings.move_rules["FixedRoutes"] is True:
+            return ~owned
+
+        n = len(self.locations)
+
+        # Furthest distance an agent can travel in one time step.
+        reach = max(SimulationSettings.move_rules["MaxMoveSpeed"], SimulationSettings.move_rules["MaxWalkSpeed"])
+        for loc in self.locations:
+            for link in loc.links + loc.closed_links:
+                reach = max(reach, float(link.attributes.get("max_move_speed", 0.0)))
+
+        distance = np.full(n, np.inf)
+        distance[owned] = 0.0
+        heap = [(0.0, int(i)) for i in np.flatnonzero(owned)]
+        while heap:
+            d, i = heapq.heappop(heap)
+            if d > distance[i]:
+                continue
+            for link in self.locations[i].links:
+                j = link.endpoint.id
+                dj = d + float(link.get_distance())
+                if dj <= reach and dj < distance[j]:
+                    distance[j] = dj
+                    heapq.heappush(heap, (dj, j))
+        reached = distance <= reach
+
+        for loc in self.locations:
+            for link in loc.links + loc.closed_links:
+                if owned[link.endpoint.id]:
+                    reached[loc.id] = True
+
+        levels = SimulationSettings.move_rules["AwarenessLevel"] + 1
+        steps = np.full(n, -1, dtype=np.int64)
+        steps[reached] = 0
+        queue = deque(int(i) for i in np.flatnonzero(reached))
+        while queue:
+            i = queue.popleft()
+            for link in self.locations[i].links:
+                j = link.endpoint.id
+                sj = steps[i] + (0 if link.endpoint.marker else 1)
+                if sj <= levels and (steps[j] < 0 or sj < steps[j]):
+                    steps[j] = sj
+                    if link.endpoint.marker:
+                        queue.appendleft(j)
+                    else:
+                        queue.append(j)
+
+        return (steps >= 0) & ~owned
+
+
+    @check_args_type
+    def _build_halo(self) -> None:
+        """
+        Summary:
+            Determines which scores and agent counts this rank receives from and
+            sends to every other rank in loc-owned mode. A rank receives the scores
+            and counts of its halo locations (see _halo_locations), and the counts
+            of links leaving its own and halo locations towards locations of other
+            ranks. The halo is rebuilt when locations, links or the partition change.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        self._ensure_partition()
+        rank = self.mpi.rank
+        size = self.mpi.size
+        owner = self.location_owner
+        owned = owner == rank
+        halo = self._halo_locations(owned)
+        places, numbers = self._place_numbers()
+
+        wanted_locations = [[] for _ in range(size)]
+        wanted_links = [[] for _ in range(size)]
+        for i in np.flatnonzero(halo):
+            wanted_locations[owner[i]].append(int(i))
+        for i in np.flatnonzero(owned | halo):
+            for link in self.locations[i].links:
+                r = owner[link.endpoint.id]
+                if r != rank:
+                    wanted_links[r].append(numbers[id(link)])
+
+        def exchange_lists(locations, links):
+            spl = self.scores_per_location
+            scores = (np.array(locations, dtype=np.int64)[:, None] * spl + np.arange(spl)).ravel()
+            location_slots = np.array([self.locations[i].count_slot for i in locations], dtype=np.int64)
+            link_slots = np.array([places[k].count_slot for k in links], dtype=np.int64)
+            return scores, location_slots, link_slots
+
+        # Every rank tells the owners which locations and links it needs.
+        sendbuf = np.array(
+            sum([[len(wanted_locations[r])] + wanted_locations[r] + wanted_links[r] for r in range(size)], []),
+            dtype=np.int64,
+        )
+        sendcounts = np.array([1 + len(wanted_locations[r]) + len(wanted_links[r]) for r in range(size)], dtype="i")
+        recvbuf, recvcounts, rdispls = self._exchange_int64(sendbuf, sendcounts)
+
+        send = []
+        for r in range(size):
+            request = recvbuf[rdispls[r] : rdispls[r] + recvcounts[r]]
+            n = int(request[0])
+            send.append(exchange_lists(request[1 : 1 + n].tolist(), request[1 + n :].tolist()))
+
+        owned_slots = []
+        for loc in self.locations:
+            if owned[loc.id]:
+                owned_slots.append(loc.count_slot)
+            for link in loc.links + loc.closed_links:
+                if owned[link.endpoint.id]:
+                    owned_slots.append(link.count_slot)
+
+        self.halo = {
+            "recv": [exchange_lists(wanted_locations[r], wanted_links[r]) for r in range(size)],
+            "send": send,
+            "owned_slots": np.array(owned_slots, dtype=np.int64),
+            "location_slots": np.array([loc.count_slot for loc in self.locations], dtype=np.int64),
+        }
+
+        if rank == 0:
+            print("Halo of rank 0: {} locations.".format(int(np.count_nonzero(halo))), file=sys.stderr)
+
+
+    @check_args_type
+    def _exchange_halo(self, scores: bool) -> None:
+        """
+        Summary:
+            Sends the scores (if scores is True) or the agent counts (otherwise) of
+            owned locations and links to the ranks that need them, and receives
+            those of the halo, with a single Alltoallv.
+
+        Args:
+            scores (bool): Whether to exchange scores instead of agent counts.
+
+        Returns:
+            None.
+        """
+        if self.halo is None:
+            self._build_halo()
+
+        total = self.count_store.total
+
+        def values(lists):
+            if scores:
+                return Ecosystem.scores[lists[0]]
+            return np.concatenate((total[lists[1]], total[lists[2]]))
+
+        sendbufs = [values(lists).astype(np.float64) for lists in self.halo["send"]]
+        sendcounts = np.array([len(b) for b in sendbufs], dtype="i")
+        if scores:
+            recvcounts = np.array([len(lists[0]) for lists in self.halo["recv"]], dtype="i")
+        else:
+            recvcounts = np.array([len(lists[1]) + len(lists[2]) for lists in self.halo["recv"]], dtype="i")
+
+        sdispls = np.zeros(self.mpi.size, dtype="i")
+        sdispls[1:] = np.cumsum(sendcounts)[:-1]
+        rdispls = np.zeros(self.mpi.size, dtype="i")
+        rdispls[1:] = np.cumsum(recvcounts)[:-1]
+
+        recvbuf = np.zeros(int(np.sum(recvcounts)), dtype=np.float64)
+        self.mpi.comm.Alltoallv(
+            [np.concatenate(sendbufs), (sendcounts, sdispls), MPI.DOUBLE], [recvbuf, (recvcounts, rdispls), MPI.DOUBLE]
+        )
+
+        for r, lists in enumerate(self.halo["recv"]):
+            received = recvbuf[rdispls[r] : rdispls[r] + recvcounts[r]]
+            if scores:
+                Ecosystem.scores[lists[0]] = received
+            else:
+                total[lists[1]] = received[: len(lists[1])]
+                total[lists[2]] = received[len(lists[1]) :]
+
+
+    @check_args_type
+    def _update_owned_counts(self, CountClosed: bool = False) -> None:
+        """
+        Summary:
+            Updates the agent counts in loc-owned mode. The counts of owned
+            locations and of links towards them are complete on this rank, and the
+            counts of the halo are received from their owners. Counts of other
+            locations are only updated on rank 0, at the end of every time step
+            (see _collect_location_counts).
+
+        Args:
+            CountClosed (bool, optional): Whether to count agents on closed links. Defaults to False.
+
+        Returns:
+            None.
+        """
+        if self.halo is None:
+            self._build_halo()
+
+        store = self.count_store
+        owned_slots = self.halo["owned_slots"]
+        store.total[owned_slots] = store.on_rank[owned_slots]
+        self._exchange_halo(scores=False)
+
+        self.total_agents = self.mpi.CalcCommWorldTotalSingle(
+            int(np.sum(store.on_rank[self._count_layout_slots(CountClosed)]))
+        )
+
+
+    @check_args_type
+    def _collect_location_counts(self) -> None:
+        """
+        Summary:
+            Sums up the agent counts of all locations on rank 0 in loc-owned mode,
+            so that rank 0 can write the output.
+
+        Args:
+            None.
+
+        Returns:
+            None.
+        """
+        if self.halo is None:
+            self._build_halo()
+
+        store = self.count_store
+        location_slots = self.halo["location_slots"]
+        counts = np.zeros(len(location_slots), dtype="i")
+        self.mpi.comm.Reduce([store.on_rank[location_slots], MPI.INT], [counts, MPI.INT], op=MPI.SUM, root=0)
+        if self.mpi.rank == 0:
+            store.total[location_slots] = counts
+
+
+    @check_args_type
+    def _partition_by_cost(self) -> int:
+        """
+        Summary:
+            Divides the locations over the ranks again in loc-owned mode, weighting
+            every location by the estimated cost of the agents in it and on the links
+            towards it (see _agent_cost). Empty locations weigh the cost of one
+            stationary agent, so that they are divided as well.
+
+        Args:
+            None.
+
+        Returns:
+            int: The number of agents sent by this rank.
+        """
+        weights = np.zeros(len(self.locations), dtype=np.float64)
+        for loc in self.locations:
+            weights[loc.id] += loc.numAgentsOnRank * self._agent_cost(loc)
+            for link in loc.links + loc.closed_links:
+                weights[link.endpoint.id] += link.numAgentsOnRank * self._agent_cost(link)
+
+        total = np.zeros_like(weights)
+        self.mpi.comm.Allreduce([weights, MPI.DOUBLE], [total, MPI.DOUBLE], op=MPI.SUM)
+        return self.partition_locations(weights=total + stationary_agent_cost)
+
+
+    """
+    Add & insert agent functions.
+    Agents are assigned to ranks round-robin, or to the owner of their location in
+    loc-owned mode. Imbalances that build up later,
+    e.g. by deactivation in camps or clearLocationsFromAgents, are corrected by balance_agents.
+    """
+
+    @check_args_type
+    def addAgent(self, location, attributes) -> None:
+        """
+        Summary: 
+            Adds an agent to the ecosystem at the specified location.
+
+        Args:
+            location (Location): The location to add the agent to.
+            attributes (dict): A dictionary of attributes for the agent.
+
+        Returns:
+            None.
+        """
+        if SimulationSettings.spawn_rules["TakeFromPopulation"]:
+            if location.pop > 1: 
+                location.pop -= 1
+                location.numAgentsSpawned += 1
+            else:
+                print(
+                    "ERROR: Number of agents in the simulation is larger than the combined "
+                    "population of the conflict zones. Please amend locations.csv." 
+                )
+                location.print()
+                assert location.pop > 1
+        self.total_agents += 1
+        if self._is_local_agent(location):
+            if SimulationSettings.spawn_rules["TakeFromPopulation"]:
+                # Summed over all ranks when the ecosystem evolves.
+                location.numAgentsSpawnedOnRank += 1
+            self._append_agent(location=location, attributes=attributes)
+
+
+    @check_args_type
+    def addAgents(self, location, number: int, attributes=None) -> None:
+        """
+        Summary: 
+            Adds a number of agents to the ecosystem at the specified location,
+            with the same effect as calling addAgent for each of them.
+            Every rank only creates the agents that it owns.
+
+        Args:
+            location (Location): The location to add the agents to.
+            number (int): The number of agents to add (on all ranks).
+            attributes (optional): A list with a dictionary of attributes for every agent,
+                or a function that returns such a list for a given number of agents, which
+                is only called for the agents on this rank. Defaults to no attributes.
+
+        Returns:
+            None.
+        """
+        if number < 1:
+            return
+
+        if SimulationSettings.spawn_rules["TakeFromPopulation"]:
+            if location.pop > number: 
+                location.pop -= number
+                location.numAgentsSpawned += number
+            else:
+                print(
+                    "ERROR: Number of agents in the simulation is larger than the combined "
+                    "population of the conflict zones. Please amend locations.csv." 
+                )
+                location.print()
+                assert location.pop > number
+        local = self._append_agents_on_rank(location=location, number=number, attributes=attributes)
+        if SimulationSettings.spawn_rules["TakeFromPopulation"]:
+            # Summed over all ranks when the ecosystem evolves.
+            location.numAgentsSpawnedOnRank += local
+
+
+    @check_args_type
+    def insertAgent(self, location, attributes={}) -> None:
+        """
+        Summary: 
+            Inserts an agent into the ecosystem at the specified location.
+            Note: insert Agent does NOT take from Population.
+
+        Args:
+            location (Location): The location to insert the agent into.
+
+        Returns:
+            None.
+        """
+        self.total_agents += 1
+        if self._is_local_agent(location):
+            self._append_agent(location=location, attributes=attributes)
+
+
+    @check_args_type
+    def insertAgents(self, location, number: int, attributes=None) -> None:
+        """
+        Summary: 
+            Inserts a number of agents into the ecosystem at the specified
+            location. Every rank only creates the agents that it owns.
+            Note: insert Agent does NOT take from Population.
+
+        Args:
+            location (Location): The location to insert the agents into.
+            number (int): The number of agents to insert (on all ranks).
+            attributes (optional): A list with a dictionary of attributes for every agent,
+                or a function that returns such a list for a given number of agents (see addAgents).
+                Defaults to no attributes.
+
+        Returns:
+            None.
+        """
+        if number < 1:
+            return
+        self._append_agents_on_rank(location=location, number=number, attributes=attributes)
+
+
+    @check_args_type
+    def clearLocationsFromAgents(self, location_names: List[str]) -> None:
+        """
+        Summary: 
+            Remove all agents from a list of locations by name.
+            Useful for couplings to other simulation codes.
+
+            TODO : REWRITE!!
+
+        Args:
+            location_names (List[str]): A list of location names to remove agents from.
+
+        Returns: 
+            None. 
+        """
+
+        if isinstance(self.agents, AgentStore):
+            removed = self.agents.remove_at_places(lambda p: p.name in location_names)
+            for place, number in removed:
+                place.numAgentsOnRank -= number
+            print("clearLocationsFromAgents()", file=sys.stderr)
+            self.updateNumAgents(log=False)
+            return
+
+        new_agents = []
+        for agent in self.agents:
+            if agent.location.name not in location_names:
+                new_agents += [agent]
+            else:
+                # print("Agent removed: ", agent.location.name)
+                # agent is removed from ecosystem and number of agents in
+                # location drops by one.
+                agent.location.numAgentsOnRank -= 1
+
+        self.agents = new_agents
+        print("clearLocationsFromAgents()", file=sys.stderr)
+        # when numAgentsOnRank has changed, we need to updateNumAgents (1x
+        # MPI_Allreduce)
+        self.updateNumAgents(log=False)
+
+
+    @check_args_type
+    def numAgents(self) -> int:
+        """
+        Summary: 
+            Returns the number of agents in the ecosystem.
+
+        Args:
+            None.
+
+        Returns:
+            int: The number of agents in the ecosystem.
+        """
+        return int(self.total_agents)
+
+
+    @check_args_type
+    def numAgentsOnRank(self) -> int:
+        """
+        Summary:
+            Returns the number of agents on the current process.
+
+        Args:
+            None.
+
+        Returns:
+            int: The number of agents on the current process.
+        """
+        return len(self.agents)
+
+
+    @check_args_type
+    def synchronize_locations(self, start_loc_local: int, end_loc_local: int, Debug: bool = False, blocking: bool = True):
+        """
+        Summary: 
+            Gathers the scores from all the updated locations,
+            and propagates them across the processes.
+
+        Args:
+            start_loc_local (int): The index of the first location to synchronize.
+            end_loc_local (int): The index of the last location to synchronize.
+            Debug (bool, optional): Turns on debugging output. Defaults to False.
+            blocking (bool, optional): If False, only starts the exchange and returns the
+                pending request. Scores may then only be read after request.Wait(). Defaults to True.
+
+        Returns:
+            MPI.Request or None: the pending exchange, or None if blocking is True.
+        """
+
+        base = int((len(Ecosystem.scores) / self.scores_per_location) / self.mpi.size)
         leftover = int((len(Ecosystem.scores) / self.scores_per_location) % self.mpi.size)
 
         if Debug:
@@ -771,10 +2071,14 @@ class Ecosystem(flee.Ecosystem):
         if Debug and self.mpi.rank == 0:
             print("start of synchronize_locations MPI call.", file=sys.stderr)
             # print(self.mpi.rank, local_scores, scores, sizes, offsets)
+        if not blocking:
+            return self.mpi.comm.Iallgatherv(local_scores, [Ecosystem.scores, sizes, offsets, MPI.DOUBLE])
+
         self.mpi.comm.Allgatherv(local_scores, [Ecosystem.scores, sizes, offsets, MPI.DOUBLE])
 
         if Debug and self.mpi.rank == 0:
             print("end of synchronize_locations", file=sys.stderr)
+        return None
 
 
     @check_args_type
@@ -790,6 +2094,11 @@ class Ecosystem(flee.Ecosystem):
             None.
 
         """
+        # In overlap mode the MPI exchanges are non-blocking, and only waited for
+        # when their results are needed.
+        overlap = self.latency_mode == "overlap"
+        scores_request = None
+
         if self.time == 0:
             # print("rank, num_agents:", self.mpi.rank, len(self.agents))
 
@@ -824,18 +2133,20 @@ class Ecosystem(flee.Ecosystem):
             for i in range(offset, offset + num_locs_on_this_rank):
                 self.locations[i].updateAllScores(time=self.time)
 
-            self.synchronize_locations(
-                start_loc_local=offset, end_loc_local=offset + num_locs_on_this_rank
+            scores_request = self.synchronize_locations(
+                start_loc_local=offset,
+                end_loc_local=offset + num_locs_on_this_rank,
+                blocking=not overlap,
             )
 
-            # Ensure Location Routes are updated on all cores for now.
-            if SimulationSettings.move_rules["FixedRoutes"] is True:
-                for i in range(len(self.locations)):
-                    loc = self.locations[i]
-                    if len(loc.routes) == 0:
-                        #print("INFO: Generating location routes.", file=sys.stderr)
-                        crawling.generateLocationRoutes(loc, self.time)
+        elif self.parallel_mode == "loc-owned":
+            # Every rank updates the scores of its own locations, and receives
+            # the scores of its halo from their owners.
+            self._ensure_partition()
+            for i in np.flatnonzero(self.location_owner == self.mpi.rank):
+                self.locations[i].updateAllScores(time=self.time)
 
+            self._exchange_halo(scores=True)
 
         # SYNCHRONIZE SPAWN COUNTS IN LOCATIONS (needed for all versions).
         spawn_counts = np.zeros(len(self.locations), dtype="i")
@@ -844,22 +2155,64 @@ class Ecosystem(flee.Ecosystem):
             spawn_counts[i] = le.numAgentsSpawnedOnRank
 
         # allreduce (sum up) spawn counts.
-        spawn_totals = self.mpi.CalcCommWorldTotal(spawn_counts)
+        if overlap:
+            spawn_request, spawn_totals = self.mpi.StartCommWorldTotal(spawn_counts)
+        else:
+            spawn_totals = self.mpi.CalcCommWorldTotal(spawn_counts)
+
+        # Neither of these uses scores or spawn counts, so they run while the
+        # exchanges above are in progress in overlap mode.
+        if self.route_cache is not None:
+            self.route_cache.clear()
+
+        self._update_flood_forecasts()
+
+        if scores_request is not None:
+            scores_request.Wait()
+
+        if self.parallel_mode in ["loc-par", "loc-owned"]:
+            # Ensure Location Routes are updated on all cores for now.
+            # Cached routes are cheap to reweight, so they are refreshed with the synchronized scores.
+            if SimulationSettings.move_rules["FixedRoutes"] is True:
+                for i in range(len(self.locations)):
+                    loc = self.locations[i]
+                    if len(loc.routes) == 0 or SimulationSettings.optimisations["CachedFixedRoutes"]:
+                        #print("INFO: Generating location routes.", file=sys.stderr)
+                        crawling.generateLocationRoutes(loc, self.time)
+
+        if overlap:
+            spawn_request.Wait()
 
         # update location spawn total.
         for i, le in enumerate(self.locations):
             le.numAgentsSpawned = spawn_totals[i]
 
         # update agent locations
-        for a in self.agents:
-            a.evolve(self, time=self.time)
+        start = perf_counter()
+        self._evolve_agents()
+        self.agent_step_time += perf_counter() - start
+
+        owned = self.parallel_mode == "loc-owned"
+        if owned:
+            # Agents that set off towards a location of another rank move there.
+            self._send_agents_to_owners()
 
         # print("NumAgents after evolve:", file=sys.stderr)
         self.updateNumAgents(CountClosed=True, log=False)
 
-        for a in self.agents:
-            a.finish_travel(self, time=self.time)
-            a.timesteps_since_departure += 1
+        start = perf_counter()
+        self._finish_agent_travel()
+        self.agent_step_time += perf_counter() - start
+
+        if owned:
+            self._send_agents_to_owners()
+
+        # The logs and recent travel distances do not use the reduced counts,
+        # so in overlap mode the reduction runs while they are written.
+        # Counts are not reduced globally in loc-owned mode.
+        overlap = overlap and not owned
+        if overlap:
+            count_request = self._start_count_reduction()
 
         if SimulationSettings.log_levels["agent"] > 0:
             write_agents_par(rank=self.mpi.rank, agents=self.agents, time=self.time)
@@ -867,15 +2220,16 @@ class Ecosystem(flee.Ecosystem):
         if SimulationSettings.log_levels["link"] > 0:
             write_links_par(rank=self.mpi.rank, locations=self.locations, time=self.time)
 
-        for a in self.agents:
-            a.recent_travel_distance = (
-                a.recent_travel_distance
-                + (a.distance_moved_this_timestep / SimulationSettings.move_rules["MaxMoveSpeed"])
-            ) / 2.0
-            a.distance_moved_this_timestep = 0
+        self._update_recent_travel()
 
         # print("NumAgents after finish_travel:", file=sys.stderr)
-        self.updateNumAgents(log=False)
+        if overlap:
+            self._finish_count_reduction(count_request)
+        else:
+            self.updateNumAgents(log=False)
+
+        if owned:
+            self._collect_location_counts()
 
         # update link properties
         if SimulationSettings.log_levels["camp"] > 0:
@@ -883,12 +2237,11 @@ class Ecosystem(flee.Ecosystem):
 
         # Deactivate agents in camps with a certain probability.
         if SimulationSettings.spawn_rules["camps_are_sinks"] == True:
-            for a in self.agents:
-                if a.travelling == False:
-                    if a.location.camp == True:
-                        outcome = random.random()
-                        if outcome < a.location.attributes.get("deactivation_probability", 0.0):
-                            a.location = None
+            self._deactivate_agents_in_camps()
+
+        interval = SimulationSettings.optimisations.get("LoadBalanceInterval", 0)
+        if interval > 0 and self.mpi.size > 1 and (self.time + 1) % interval == 0:
+            self.balance_agents()
 
         self.time += 1
 
@@ -937,7 +2290,7 @@ class Ecosystem(flee.Ecosystem):
         # Enlarge the scores array in Ecosystem to reflect the new location.
         # Pflee only.
         if self.cur_loc_id > 0:
-            Ecosystem.scores = np.append(Ecosystem.scores, np.array([1.0, 1.0]))
+            Ecosystem._extend_scores(2)
         # print(len(Ecosystem.scores))
 
         loc = Location(
@@ -965,9 +2318,8 @@ class Ecosystem(flee.Ecosystem):
                 ),
                 file=sys.stderr,
             )
-        self.locations.append(loc)
-        self.spawn_weights = np.append(self.spawn_weights, [0.0])
-        self.locationNames.append(loc.name)
+        self._register_location(loc)
+        self.count_layout = None
 
         spawning.refresh_spawn_weights(self)
 
@@ -1009,5 +2361,103 @@ class Ecosystem(flee.Ecosystem):
             super().printInfo()
 
 
+    @check_args_type
+    def checkpoint_file_name(self, file_name: str) -> str:
+        """
+        Summary:
+            Returns the name of the checkpoint file of this rank. Every rank
+            writes its own agents to a separate file.
+
+        Args:
+            file_name (str): name of the checkpoint, as given to save_checkpoint.
+
+        Returns:
+            str: file name for this rank.
+        """
+        if self.mpi.size == 1:
+            return file_name
+        return "{}.{}".format(file_name, self.mpi.rank)
+
+
+    @check_args_type
+    def save_checkpoint(self, file_name: str, data_table=None) -> None:
+        """
+        Summary:
+            Writes the complete state of the simulation on this rank to a checkpoint
+            file (see flee.Ecosystem.save_checkpoint). All ranks need to call this.
+            Resuming requires the same number of ranks.
+
+        Args:
+            file_name (str): name of the checkpoint; ranks append their rank number if there is more than one.
+            data_table (DataTable, optional): data table to store with the checkpoint.
+
+        Returns:
+            None.
+        """
+        checkpoint.write_checkpoint(
+            self.checkpoint_file_name(file_name),
+            self,
+            node_types=(flee.Location, flee.Link),
+            exclude=self._checkpoint_exclude,
+            rank=self.mpi.rank,
+            size=self.mpi.size,
+            extra={"data_table": data_table, "shared": self._get_shared_state()},
+        )
+        self.mpi.comm.Barrier()
+
+
+    @check_args_type
+    def load_checkpoint(self, file_name: str):
+        """
+        Summary:
+            Restores the state of the simulation on this rank from a checkpoint
+            written by save_checkpoint (see flee.Ecosystem.load_checkpoint).
+
+        Args:
+            file_name (str): name of the checkpoint, as given to save_checkpoint.
+
+        Returns:
+            DataTable or None: the data table stored with the checkpoint, if any.
+        """
+        extra = checkpoint.read_checkpoint(
+            self.checkpoint_file_name(file_name), self, rank=self.mpi.rank, size=self.mpi.size
+        )
+        self._set_shared_state(extra["shared"])
+        return extra["data_table"]
+
+
+    @check_args_type
+    def _get_shared_state(self) -> dict:
+        """
+        Summary:
+            Returns the location scores, which are shared by all pflee ecosystems
+            instead of kept in the ecosystem itself (see flee.Ecosystem._get_shared_state).
+
+        Args:
+            None.
+
+        Returns:
+            dict: shared state.
+        """
+        return {"scores": Ecosystem.scores.copy()}
+
+
+    @check_args_type
+    def _set_shared_state(self, state: dict) -> None:
+        """
+        Summary:
+            Restores the shared state returned by _get_shared_state.
+
+        Args:
+            state (dict): shared state.
+
+        Returns:
+            None.
+        """
+        Ecosystem.scores = Ecosystem._scores_buffer[:0]
+        Ecosystem._extend_scores(len(state["scores"]))
+        Ecosystem.scores[:] = state["scores"]
+
+
 if __name__ == "__main__":
     print("No testing functionality here yet.")
@@ -145,13 +145,8 @@ class Ecosystem(pflee.Ecosystem):
         Returns:
             None.
         """
-        endpoint1_index = -1
-        endpoint2_index = -1
-        for i, location_name in enumerate(self.locationNames):
-            if location_name == endpoint1:
-                endpoint1_index = i
-            if location_name == endpoint2:
-                endpoint2_index = i
+        endpoint1_index = self.locationIndex.get(endpoint1, -1)
+        endpoint2_index = self.locationIndex.get(endpoint2, -1)
 
         if endpoint1_index < 0:
             print("Diagnostic: Ecosystem.locationNames: ", self.locationNames)
@@ -170,7 +165,7 @@ class Ecosystem(pflee.Ecosystem):
             )
             sys.exit()
 
-        self.locations[endpoint1_index].links.append(
+        self.locations[endpoint1_index].addLink(
             Link(
                 startpoint=self.locations[endpoint1_index],
                 endpoint=self.locations[endpoint2_index],
@@ -179,7 +174,7 @@ class Ecosystem(pflee.Ecosystem):
                 link_type=link_type,
             )
         )
-        self.locations[endpoint2_index].links.append(
+        self.locations[endpoint2_index].addLink(
             Link(
                 startpoint=self.locations[endpoint2_index],
                 endpoint=self.locations[endpoint1_index],
@@ -249,6 +244,10 @@ class Link_weather_coupling(pflee.Link):
         Returns:
             None.
         """
+        # numAgents and numAgentsOnRank are kept in the CountStore of the ecosystem (see pflee.Link).
+        self.count_store = startpoint.e.count_store
+        self.count_slot = self.count_store.add()
+
         self.name = "L:{}:{}".format(startpoint.name, endpoint.name)
         self.closed = False
 
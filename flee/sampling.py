@@ -0,0 +1,94 @@
+from __future__ import annotations, print_function
+
+import os
+import random
+
+import numpy as np
+
+if os.getenv("FLEE_TYPE_CHECK") is not None and os.environ["FLEE_TYPE_CHECK"].lower() == "true":
+    from beartype import beartype as check_args_type
+else:
+    def check_args_type(func):
+        return func
+
+
+# File for sampling repeatedly from a fixed discrete distribution, e.g. the
+# route distribution of a location during one time step, or the spawn weights.
+
+
+class AliasTable:
+    """
+    Walker/Vose alias table. Construction is O(n), after which every draw is O(1).
+    If all weights are zero, all outcomes are equally likely (as in moving.normalizeWeights).
+    """
+
+    __slots__ = ["weights", "n", "prob", "alias", "_prob", "_alias"]
+
+    def __init__(self, weights):
+        self.weights = np.array(weights, dtype=float)
+        self.n = len(self.weights)
+
+        total = self.weights.sum()
+        if total > 0.0:
+            scaled = self.weights * (self.n / total)
+        else:
+            scaled = np.ones(self.n)
+
+        self.prob = np.ones(self.n)
+        self.alias = np.arange(self.n)
+
+        small = [i for i in range(self.n) if scaled[i] < 1.0]
+        large = [i for i in range(self.n) if scaled[i] >= 1.0]
+
+        while len(small) > 0 and len(large) > 0:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+        # Entries left over (by rounding) keep probability 1.0.
+
+        # Python lists are faster than numpy arrays for single draws.
+        self._prob = self.prob.tolist()
+        self._alias = self.alias.tolist()
+
+    def __len__(self):
+        return self.n
+
+    def draw(self) -> int:
+        """
+        Summary:
+            Draws one index from the distribution.
+
+        Args:
+            None.
+
+        Returns:
+            int: index of the drawn outcome.
+        """
+        u = random.random() * self.n
+        i = min(int(u), self.n - 1)
+        if u - i < self._prob[i]:
+            return i
+        return self._alias[i]
+
+    @check_args_type
+    def draw_many(self, number: int) -> np.ndarray:
+        """
+        Summary:
+            Draws a number of indices from the distribution at once.
+
+        Args:
+            number (int): number of draws.
+
+        Returns:
+            np.ndarray: indices of the drawn outcomes.
+        """
+        u = np.random.random(number) * self.n
+        i = np.minimum(u.astype(np.int64), self.n - 1)
+        return np.where(u - i < self.prob[i], i, self.alias[i])
@@ -18,6 +18,8 @@ __refugees_raw = 0
 __refugee_debt = 0
 
 __demographics = {}
+# Demographics compiled for sampling: attribute -> (values, {column: cumulative weights}).
+__demographic_tables = {}
 
 
 def getAttributeRatio(location, attr_name):
@@ -43,6 +45,8 @@ def refresh_spawn_weights(e):
         SimulationSettings.spawn_rules["TakeFromPopulation"] is set to True.
         Also needed to model the ConflictSpawnDecay.
         It will update the weights to reflect the new population numbers.
+        The weights are only recalculated when a location value, the time
+        (with conflict spawn decay) or the spawn rules changed since the last call.
     
     Args:
         e (Ecosystem): Ecosystem object
@@ -50,34 +54,74 @@ def refresh_spawn_weights(e):
     Returns:
         None.
     """
+    store = e.location_store
+
+    # The time only matters when the weights decay after a conflict starts.
+    decay = SimulationSettings.spawn_rules["conflict_spawn_decay"]
+    if decay:
+        decay = (tuple(decay), SimulationSettings.spawn_rules["conflict_spawn_decay_interval"], e.time)
+    key = (SimulationSettings.spawn_rules["conflict_driven_spawning"], decay)
+
+    if store.changed or store.spawn_key != key:
+        calculate_spawn_weights(e, 0)
+    elif store.spawn_size < store.size:
+        # Only locations were added, so only their weights are missing.
+        calculate_spawn_weights(e, store.spawn_size)
+    else:
+        return
 
-    conflict_pop_weight = 1.0
-    attribute_weights = {} #TODO: Implement (food security stretch goal)
+    store.changed = False
+    store.spawn_key = key
+    store.spawn_size = store.size
+    e.spawn_weight_total = float(np.sum(e.spawn_weights))
 
 
-    for i in range(0, len(e.locations)):
+def calculate_spawn_weights(e, start):
+    """
+    Summary:
+        Calculates the spawn weights of the locations from index start onwards,
+        from the arrays in the location store.
 
-        # First reset weight to 0.0.
-        e.spawn_weights[i] = 0.0
+    Args:
+        e (Ecosystem): Ecosystem object
+        start (int): Index of the first location to calculate the weight for.
 
-        # Conflict-driven spawning
-        if not SimulationSettings.spawn_rules["conflict_driven_spawning"]: # This branch should be skipped if conflicts spawn fixed numbers of agents.
+    Returns:
+        None.
+    """
+    conflict_pop_weight = 1.0
+    attribute_weights = {} #TODO: Implement (food security stretch goal)
 
-            if SimulationSettings.spawn_rules["conflict_zone_spawning_only"]: # This option reduces spawning to 0 in non-conflict zones.
-                if e.locations[i].conflict <= 0.0:
-                    continue
+    store = e.location_store
+    weights = store.spawn_weight[start:store.size]
 
-            if e.locations[i].conflict > 0.0: # Adding conflict-based weighting for spawning.
-                # Conflict decay multiplier
-                multiplier = e.locations[i].conflict
-                if SimulationSettings.spawn_rules["conflict_spawn_decay"]:
-                    multiplier = e.locations[i].conflict * SimulationSettings.get_location_conflict_decay(e.time, e.locations[i])
+    # First reset weights to 0.0.
+    weights[:] = 0.0
 
-                # Pop+conflict weight
-                e.spawn_weights[i] = e.locations[i].pop * conflict_pop_weight * multiplier
+    # Conflict-driven spawning
+    if SimulationSettings.spawn_rules["conflict_driven_spawning"]: # This branch should be skipped if conflicts spawn fixed numbers of agents.
+        return
 
+    # Only conflict zones get a weight, which also covers conflict_zone_spawning_only.
+    conflict = store.conflict[start:store.size]
+    in_conflict = np.flatnonzero(conflict > 0.0)
+    if len(in_conflict) == 0:
+        return
 
-    e.spawn_weight_total = sum(e.spawn_weights)
+    # Conflict decay multiplier
+    multiplier = conflict[in_conflict]
+    if SimulationSettings.spawn_rules["conflict_spawn_decay"]:
+        if SimulationSettings.log_levels["conflict"] > 0:
+            decay = np.array([SimulationSettings.get_location_conflict_decay(e.time, e.locations[start + i]) for i in in_conflict])
+        else:
+            decay = np.array(SimulationSettings.spawn_rules["conflict_spawn_decay"], dtype=float)
+            interval = SimulationSettings.spawn_rules["conflict_spawn_decay_interval"]
+            time_since_conflict = e.time - store.time_of_conflict[start:store.size][in_conflict]
+            decay = decay[np.minimum((time_since_conflict / interval).astype(np.int64), len(decay) - 1)]
+        multiplier = multiplier * decay
+
+    # Pop+conflict weight
+    weights[in_conflict] = store.pop[start:store.size][in_conflict] * conflict_pop_weight * multiplier
 
 
 def read_demographic_csv(e, csvname):
@@ -109,6 +153,35 @@ def read_demographic_csv(e, csvname):
     print("INFO: ", attribute, " attributes loaded, with columns:", df.columns, file=sys.stderr)
   
   __demographics[attribute] = df
+  __demographic_tables[attribute] = compile_demographic_table(df, attribute)
+
+
+def compile_demographic_table(df, attribute):
+  """
+  Summary:
+      Converts a demographics table into arrays of cumulative weights,
+      so that samples can be drawn without pandas.
+
+  Args:
+      df (DataFrame): demographics table, as read by read_demographic_csv.
+      attribute (str): Attribute name (the column with the attribute values).
+
+  Returns:
+      Tuple[np.ndarray, Dict[str, np.ndarray]]: the attribute values, and the cumulative
+      weights of the values for every location column (and Default).
+  """
+  if attribute not in df.columns:
+      print("ERROR: demographics table for {} should have a column named {}.".format(attribute, attribute), file=sys.stderr)
+      sys.exit()
+
+  values = df[attribute].to_numpy()
+  cum_weights = {}
+  for column in df.columns:
+      if column == attribute:
+          continue
+      weights = pd.to_numeric(df[column], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+      cum_weights[column] = np.cumsum(weights)
+  return values, cum_weights
 
 
 def read_demographics(e):
@@ -151,17 +224,73 @@ def draw_sample(e, loc, attribute):
   Returns:
       float: Sample from the attribute distribution.
   """
-  #print(__demographics[attribute], file=sys.stderr)
-  #print(__demographics[attribute].iloc[0]['Default'], file=sys.stderr)
-  if attribute in __demographics:
-    if loc.name in __demographics[attribute].columns:
-      a = __demographics[attribute].sample(n=1,weights=loc.name)
-    else:
-      a = __demographics[attribute].sample(n=1,weights='Default')
-  else:
+  if attribute not in __demographic_tables:
     return -1
 
-  return a.iloc[0][attribute]
+  return draw_attribute_samples(loc, attribute, 1)[0]
+
+
+def draw_attribute_samples(loc, attribute, n):
+  """
+  Summary:
+      Draw n samples from the attribute distribution for a location at once.
+      Locations without their own column use the Default column.
+
+  Args:
+      loc (Location): Location object
+      attribute (str): Attribute name
+      n (int): Number of samples
+
+  Returns:
+      np.ndarray: Samples from the attribute distribution.
+  """
+  values, cum_weights = __demographic_tables[attribute]
+  cw = cum_weights.get(loc.name, None)
+  if cw is None:
+    cw = cum_weights["Default"]
+
+  indices = np.searchsorted(cw, np.random.random(n) * cw[-1], side="right")
+  return values[np.minimum(indices, len(values) - 1)]
+
+
+def draw_samples_batch(e, loc, n):
+  """
+  Summary:
+      Draw samples from all optional attributes for n agents at once.
+
+  Args:
+      e (Ecosystem): Ecosystem object
+      loc (Location): Location object
+      n (int): Number of agents
+
+  Returns:
+      List[Dict]: Dictionary of attribute names and values for every agent.
+  """
+  samples = [{} for _ in range(0, n)]
+  if n < 1:
+    return samples
+
+  for a in __demographic_tables.keys():
+    for s, value in zip(samples, draw_attribute_samples(loc, a, n)):
+      s[a] = value
+  return samples
+
+
+def attribute_sampler(e, loc):
+  """
+  Summary:
+      Returns a function that draws the optional attributes for a given number
+      of agents. In parallel runs addAgents and insertAgents only call it for
+      the agents that are created on the local rank.
+
+  Args:
+      e (Ecosystem): Ecosystem object
+      loc (Location): Location object
+
+  Returns:
+      Callable: Function that takes a number of agents and returns draw_samples_batch(e, loc, n).
+  """
+  return lambda n: draw_samples_batch(e, loc, n)
 
 
 def draw_samples(e,loc):
@@ -176,10 +305,28 @@ def draw_samples(e,loc):
     Returns:
         Dict: Dictionary of attribute names and values.
     """
-    samples = {}
-    for a in __demographics.keys():
-        samples[a] = draw_sample(e, loc, a)
-    return samples
+    return draw_samples_batch(e, loc, 1)[0]
+
+
+def count_locations(locs):
+  """
+  Summary:
+      Counts how often every location occurs in a list of locations.
+
+  Args:
+      locs (List[Location]): Location of every agent
+
+  Returns:
+      List[Tuple[Location, int]]: Unique locations, in order of first occurrence, and their counts.
+  """
+  counts = {}
+  for loc in locs:
+    entry = counts.get(id(loc), None)
+    if entry is None:
+      counts[id(loc)] = [loc, 1]
+    else:
+      entry[1] += 1
+  return [(loc, number) for loc, number in counts.values()]
 
 
 def add_initial_refugees(e, d, loc):
@@ -209,9 +356,7 @@ def add_initial_refugees(e, d, loc):
       num_refugees += int(d.get_field(loc.name, 0, FullInterpolation=True))
 
   num_refugees += int(loc.attributes.get("initial_idps",0))
-  for i in range(0, num_refugees):
-      attributes = draw_samples(e, loc)
-      e.insertAgent(location=loc, attributes=attributes) # Parallelization is incorporated *inside* the addAgent function.
+  e.insertAgents(location=loc, number=num_refugees, attributes=attribute_sampler(e, loc)) # Parallelization is incorporated *inside* the insertAgents function.
 
 
 @check_args_type
@@ -257,9 +402,7 @@ def spawn_daily_displaced(e, t, d):
                 num_spawned = np.random.poisson(SimulationSettings.spawn_rules["displaced_per_conflict_day"] * e.locations[i].conflict)
 
         ## Doing the actual spawning here.
-        for j in range(0, num_spawned):
-            attributes = draw_samples(e, e.locations[i])
-            e.addAgent(location=e.locations[i], attributes=attributes) # Parallelization is incorporated *inside* the addAgent function.
+        e.addAgents(location=e.locations[i], number=num_spawned, attributes=attribute_sampler(e, e.locations[i])) # Parallelization is incorporated *inside* the addAgents function.
 
         new_refs += num_spawned
 
@@ -284,9 +427,7 @@ def spawn_daily_displaced(e, t, d):
                 num_spawned = np.random.poisson(int(SimulationSettings.spawn_rules["displaced_per_flood_day"][flood_level]))
 
         ## Doing the actual spawning here.
-        for j in range(0, num_spawned):
-            attributes = draw_samples(e, e.locations[i])
-            e.addAgent(location=e.locations[i], attributes=attributes) # Parallelization is incorporated *inside* the addAgent function.
+        e.addAgents(location=e.locations[i], number=num_spawned, attributes=attribute_sampler(e, e.locations[i])) # Parallelization is incorporated *inside* the addAgents function.
 
         new_refs += num_spawned
 
@@ -317,14 +458,44 @@ def spawn_daily_displaced(e, t, d):
         __refugee_debt = 0
 
       #Insert refugee agents
-      locs = e.pick_spawn_locations(new_refs)
-      for i in range(0, new_refs):
-        attributes = draw_samples(e, locs[i])
-        e.addAgent(location=locs[i], attributes=attributes) # Parallelization is incorporated *inside* the addAgent function.
+      for loc, number in count_locations(e.pick_spawn_locations(new_refs)):
+        e.addAgents(location=loc, number=number, attributes=attribute_sampler(e, loc)) # Parallelization is incorporated *inside* the addAgents function.
 
     return new_refs, __refugees_raw, __refugee_debt
 
 
+def get_checkpoint_state() -> dict:
+  """
+  Summary:
+      Returns the spawning state that is carried between time steps,
+      so that it can be stored in a checkpoint.
+
+  Args:
+      None.
+
+  Returns:
+      dict: raw refugee count and refugee debt.
+  """
+  return {"refugees_raw": __refugees_raw, "refugee_debt": __refugee_debt}
+
+
+def set_checkpoint_state(state: dict) -> None:
+  """
+  Summary:
+      Restores the spawning state returned by get_checkpoint_state.
+
+  Args:
+      state (dict): raw refugee count and refugee debt.
+
+  Returns:
+      None.
+  """
+  global __refugees_raw, __refugee_debt
+
+  __refugees_raw = state["refugees_raw"]
+  __refugee_debt = state["refugee_debt"]
+
+
 def spawn_agents(e, number):
     """
     Summary:
@@ -338,8 +509,6 @@ def spawn_agents(e, number):
         None.
     """
     #Insert refugee agents
-    for i in range(0, number):
-        loc = e.pick_spawn_location()
-        attributes = draw_samples(e, loc)
-        e.addAgent(location=loc, attributes=attributes) # Parallelization is incorporated *inside* the addAgent function.
+    for loc, n in count_locations(e.pick_spawn_locations(number)):
+        e.addAgents(location=loc, number=n, attributes=attribute_sampler(e, loc)) # Parallelization is incorporated *inside* the addAgents function.
 
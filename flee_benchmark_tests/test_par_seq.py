@@ -125,7 +125,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Run a parallel Flee benchmark.")
     parser.add_argument("-p", "--parallelmode", type=str, default="advanced",
-                        help="Parallelization mode (advanced, classic, cl-hilat OR adv-lowlat)")
+                        help="Parallelization mode (advanced, classic, cl-hilat, adv-lowlat, adv-overlap, cl-overlap OR owned)")
     parser.add_argument("-N", "--initialagents", type=int, default=100000,
                         help="Number of agents at the start of the simulation.")
     parser.add_argument("-d", "--newagentsperstep", type=int, default=1000,
@@ -145,13 +145,17 @@ if __name__ == "__main__":
     initialagents = args.initialagents
     newagentsperstep = args.newagentsperstep
 
-    if args.parallelmode in ["advanced", "adv-lowlat"]:
+    if args.parallelmode in ["advanced", "adv-lowlat", "adv-overlap"]:
         parallel_mode = "loc-par"
+    elif args.parallelmode == "owned":
+        parallel_mode = "loc-owned"
     else:
         parallel_mode = "classic"
 
-    if args.parallelmode in ["advanced", "cl-hilat"]:
+    if args.parallelmode in ["advanced", "cl-hilat", "owned"]:
         latency_mode = "high_latency"
+    elif args.parallelmode in ["adv-overlap", "cl-overlap"]:
+        latency_mode = "overlap"
     else:
         latency_mode = "low_latency"
 
@@ -4,6 +4,7 @@ from flee.datamanager import DataTable #DataTable.subtract_dates()
 from flee import InputGeography
 import numpy as np
 import flee.postprocessing.analysis as a
+import os
 import sys
 from flee.SimulationSettings import SimulationSettings
 
@@ -35,11 +36,14 @@ if __name__ == "__main__":
 
   ig = InputGeography.InputGeography()
 
-  ig.ReadLocationsFromCSV("%s/locations.csv" % input_csv_directory)
+  if not ig.LoadCompiledGeography(SimulationSettings.optimisations["GeographyCache"]):
+    ig.ReadLocationsFromCSV("%s/locations.csv" % input_csv_directory)
 
-  ig.ReadLinksFromCSV("%s/routes.csv" % input_csv_directory)
+    ig.ReadLinksFromCSV("%s/routes.csv" % input_csv_directory)
 
-  ig.ReadClosuresFromCSV("%s/closures.csv" % input_csv_directory)
+    ig.ReadClosuresFromCSV("%s/closures.csv" % input_csv_directory)
+
+    ig.SaveCompiledGeography(SimulationSettings.optimisations["GeographyCache"])
 
   e,lm = ig.StoreInputGeographyInEcosystem(e)
 
@@ -50,12 +54,22 @@ if __name__ == "__main__":
 
   d.ReadL1Corrections("%s/registration_corrections.csv" % input_csv_directory)
 
+  # Resume from the checkpoint file if it exists, instead of starting at day 0.
+  checkpoint_file = SimulationSettings.optimisations["CheckpointFile"]
+  start_time = 0
+  resume = len(checkpoint_file) > 0 and os.path.isfile(e.checkpoint_file_name(checkpoint_file))
+  if resume:
+    d = e.load_checkpoint(checkpoint_file)
+    start_time = e.time
+    lm = {l.name: l for l in e.locations}
+
   output_header_string = "Day,Date,"
 
   camp_locations      = e.get_camp_names()
 
   for l in camp_locations:
-      spawning.add_initial_refugees(e,d,lm[l])
+      if not resume:
+        spawning.add_initial_refugees(e,d,lm[l])
       output_header_string += "%s sim,%s data,%s error," % (lm[l].name, lm[l].name, lm[l].name)
 
   output_header_string += "Total error,refugees in camps (UNHCR),total refugees (simulation),raw UNHCR refugee count,refugees in camps (simulation),refugee_debt"
@@ -67,7 +81,7 @@ if __name__ == "__main__":
   refugee_debt = 0
   refugees_raw = 0 #raw (interpolated) data from TOTAL UNHCR refugee count only.
 
-  for t in range(0,end_time):
+  for t in range(start_time,end_time):
 
     #if t>0:
     ig.AddNewConflictZones(e,t)
@@ -118,3 +132,7 @@ if __name__ == "__main__":
       output += ",{}".format(e.numIDPs())
 
     print(output)
+
+    if SimulationSettings.optimisations["CheckpointInterval"] > 0 and len(checkpoint_file) > 0:
+      if (t + 1) % SimulationSettings.optimisations["CheckpointInterval"] == 0:
+        e.save_checkpoint(checkpoint_file, data_table=d)
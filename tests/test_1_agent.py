@@ -1,3 +1,4 @@
+import pytest
 from flee import flee
 
 """
@@ -54,5 +55,16 @@ def test_1_agent():
     print("Test successful!")
 
 
+def test_duplicate_location_name():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+
+    e = flee.Ecosystem()
+
+    e.addLocation(name="A", movechance=0.3)
+    with pytest.raises(SystemExit):
+        e.addLocation(name="A", movechance=0.0)
+
+
 if __name__ == "__main__":
     test_1_agent()
+    test_duplicate_location_name()
@@ -0,0 +1,213 @@
+import random
+
+import numpy as np
+import pytest
+from flee import flee
+
+"""
+Checks that the struct-of-arrays and cohort agent engines reproduce the object-based engine.
+"""
+
+
+def run_engine(engine, end_time=10):
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.optimisations["AgentEngine"] = engine
+
+    flee.SimulationSettings.move_rules["MaxMoveSpeed"] = 200.0
+    flee.SimulationSettings.move_rules["MaxWalkSpeed"] = 35.0
+
+    random.seed(42)
+    np.random.seed(42)
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    _ = e.addLocation(name="B", movechance=0.3)
+    _ = e.addLocation(name="C", movechance=0.3)
+    _ = e.addLocation(name="D", movechance=0.0)
+    _ = e.addLocation(name="E", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+    e.linkUp(endpoint1="A", endpoint2="C", distance=250.0)
+    e.linkUp(endpoint1="B", endpoint2="D", distance=150.0)
+    e.linkUp(endpoint1="C", endpoint2="E", distance=50.0)
+
+    for i in range(0, 1500):
+        e.addAgent(location=l1, attributes={"gender": ["male", "female"][i % 2], "age": i % 60})
+
+    for t in range(0, end_time):
+        e.evolve()
+
+    return e
+
+
+def count_agents(e):
+    counts = {}
+    for a in e.agents:
+        counts[a.location.name] = counts.get(a.location.name, 0) + 1
+    return counts
+
+
+def test_agentstore_matches_objects():
+    e_obj = run_engine("objects")
+    e_arr = run_engine("arrays")
+
+    assert isinstance(e_arr.agents, flee.AgentStore)
+    assert len(e_obj.agents) == len(e_arr.agents) == 1500
+
+    # Location and link counters must match the agents stored in the arrays.
+    counts = count_agents(e_arr)
+    for loc in e_arr.locations:
+        assert loc.numAgents == counts.get(loc.name, 0)
+        for link in loc.links:
+            assert link.numAgents == counts.get(link.name, 0)
+
+    # Move outcomes are drawn differently, so the engines agree statistically.
+    for loc_obj, loc_arr in zip(e_obj.locations, e_arr.locations):
+        assert abs(loc_obj.numAgents - loc_arr.numAgents) < 0.06 * 1500
+
+    a = e_arr.agents[0]
+    assert a.home_location.name == "A"
+    assert dict(a.attributes) == {"gender": "male", "age": 0}
+    assert e_arr.agents[-1].attributes["age"] == 1499 % 60
+
+
+def test_agentstore_clear_locations():
+    e = run_engine("arrays", end_time=3)
+
+    names = ["D", "E"]
+    removed = sum(loc.numAgents for loc in e.locations if loc.name in names)
+    e.clearLocationsFromAgents(names)
+
+    assert len(e.agents) == 1500 - removed
+    for loc in e.locations:
+        if loc.name in names:
+            assert loc.numAgents == 0
+    for a in e.agents:
+        assert a.location.name not in names
+
+
+def test_cohorts_match_objects():
+    e_obj = run_engine("objects")
+    e_coh = run_engine("cohorts")
+
+    assert isinstance(e_coh.agents, flee.CohortStore)
+    assert len(e_coh.agents) == 1500
+
+    # Stationary agents are kept in cohorts, not as individual agents.
+    assert e_coh.agents.size < 1500
+
+    for loc_obj, loc_coh in zip(e_obj.locations, e_coh.locations):
+        assert abs(loc_obj.numAgents - loc_coh.numAgents) < 0.06 * 1500
+
+    # Indexing materialises all cohorts.
+    counts = count_agents(e_coh)
+    assert e_coh.agents.size == 1500
+    for loc in e_coh.locations:
+        assert loc.numAgents == counts.get(loc.name, 0)
+        for link in loc.links:
+            assert link.numAgents == counts.get(link.name, 0)
+
+    ages = sorted(a.attributes["age"] for a in e_coh.agents)
+    assert ages == sorted(i % 60 for i in range(0, 1500))
+
+
+def test_cohorts_clear_locations():
+    e = run_engine("cohorts", end_time=3)
+
+    names = ["A", "D"]
+    removed = sum(loc.numAgents for loc in e.locations if loc.name in names)
+    e.clearLocationsFromAgents(names)
+
+    assert len(e.agents) == 1500 - removed
+    for a in e.agents:
+        assert a.location.name not in names
+
+
+def test_cohorts_reject_agent_history_settings():
+    for setting in ["avoid_short_stints", "agent", "camp"]:
+        flee.SimulationSettings.ReadFromYML("empty.yml")
+        flee.SimulationSettings.optimisations["AgentEngine"] = "cohorts"
+        if setting == "avoid_short_stints":
+            flee.SimulationSettings.move_rules["AvoidShortStints"] = True
+        else:
+            flee.SimulationSettings.log_levels[setting] = 1
+
+        with pytest.raises(SystemExit):
+            flee.Ecosystem()
+
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.optimisations["AgentEngine"] = "cohorts"
+    assert isinstance(flee.Ecosystem().agents, flee.CohortStore)
+
+
+def test_add_agents():
+    for engine in ["objects", "arrays", "cohorts"]:
+        flee.SimulationSettings.ReadFromYML("empty.yml")
+        flee.SimulationSettings.optimisations["AgentEngine"] = engine
+        flee.SimulationSettings.spawn_rules["TakeFromPopulation"] = True
+
+        e = flee.Ecosystem()
+        l1 = e.addLocation(name="A", movechance=1.0, pop=1000)
+        l2 = e.addLocation(name="B", movechance=1.0, pop=1000)
+        e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+
+        attributes = [{"gender": ["male", "female"][i % 2], "age": i % 60} for i in range(0, 300)]
+        e.addAgents(l1, 300, attributes)
+        e.addAgents(l1, 0, [])
+        e.insertAgents(l2, 50)
+
+        assert len(e.agents) == 350
+        assert l1.numAgents == 300 and l2.numAgents == 50
+        assert l1.pop == 700 and l1.numAgentsSpawned == 300
+        assert l2.pop == 1000
+
+        ages = sorted(a.attributes["age"] for a in e.agents if a.location is l1)
+        assert ages == sorted(i % 60 for i in range(0, 300))
+        assert all(len(a.attributes) == 0 for a in e.agents if a.location is l2)
+
+        # Attributes can also be drawn by a function, for the number of agents created.
+        requested = []
+        def sampler(n):
+            requested.append(n)
+            return [{"age": 99} for _ in range(0, n)]
+        e.insertAgents(l2, 20, sampler)
+
+        assert requested == [20]
+        assert l2.numAgents == 70
+        assert sum(1 for a in e.agents if a.attributes.get("age", 0) == 99) == 20
+
+
+def agent_state(a):
+    return (
+        a.location.name, a.home_location.name, a.travelling, a.distance_travelled_on_link,
+        a.recent_travel_distance, a.places_travelled, a.timesteps_since_departure, dict(a.attributes), list(a.route),
+    )
+
+
+def test_export_import_agents():
+    e = run_engine("arrays", end_time=5)
+    e2 = run_engine("arrays", end_time=0)
+    e2.agents = flee.AgentStore(view_class=flee.PersonView)
+
+    # Places are numbered by their order in the ecosystem, so that they can be found in e2.
+    places = list(e.locations) + [link for loc in e.locations for link in loc.links]
+    places2 = list(e2.locations) + [link for loc in e2.locations for link in loc.links]
+    numbers = {id(p): k for k, p in enumerate(places)}
+
+    indices = np.arange(0, len(e.agents), 3)
+    e2.agents.import_agents(e.agents.export_agents(indices, lambda p: numbers[id(p)]), places2)
+
+    assert len(e2.agents) == len(indices)
+    assert [agent_state(e2.agents[j]) for j in range(len(indices))] == [agent_state(e.agents[i]) for i in indices]
+    assert any(a.travelling for a in e2.agents)
+
+
+if __name__ == "__main__":
+    test_agentstore_matches_objects()
+    test_agentstore_clear_locations()
+    test_cohorts_match_objects()
+    test_cohorts_clear_locations()
+    test_cohorts_reject_agent_history_settings()
+    test_add_agents()
+    test_export_import_agents()
@@ -91,7 +91,48 @@ def test_marker_location():
     print("Test successful!")
 
 
+def test_route_candidates():
+    """
+    Precomputed route candidates should give the same weights and routes as
+    the recursive calculateLinkWeight, also after links are closed.
+    """
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.move_rules["AwarenessLevel"] = 3
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=0.3)
+    _ = e.addLocation(name="B", movechance=0.3)
+    _ = e.addLocation(name="C", location_type="marker")
+    _ = e.addLocation(name="D", movechance=0.3, location_type="camp")
+    _ = e.addLocation(name="E", movechance=0.3)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=834.0)
+    e.linkUp(endpoint1="A", endpoint2="C", distance=200.0)
+    e.linkUp(endpoint1="B", endpoint2="D", distance=434.0)
+    e.linkUp(endpoint1="C", endpoint2="D", distance=834.0)
+    e.linkUp(endpoint1="D", endpoint2="E", distance=100.0)
+
+    e.addAgent(location=l1, attributes={})
+
+    def recursive_routes():
+        w, r = moving.selectRoute(e.agents[0], time=0, return_all_routes=True)
+        return w, [route[1:] for route in r]
+
+    w, r = moving.getRouteDistribution(e.agents[0], time=0)
+    assert (w, r) == recursive_routes()
+    assert l1.route_candidates is not None
+
+    # Closing a link two hops away invalidates the candidates of A.
+    e.close_link(startpoint="D", endpoint="E", twoway=False)
+    assert l1.route_candidates is None
+
+    w, r = moving.getRouteDistribution(e.agents[0], time=0)
+    assert (w, r) == recursive_routes()
+    assert ["B", "D", "E"] not in r
+
 
 if __name__ == "__main__":
     test_awareness()
     test_marker_location()
+    test_route_candidates()
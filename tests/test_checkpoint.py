@@ -0,0 +1,107 @@
+import os
+
+from flee import InputGeography, flee, spawning
+from flee.datamanager import handle_refugee_data
+
+
+def setup_run(engine):
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.optimisations["AgentEngine"] = engine
+    flee.SimulationSettings.ConflictInputFile = os.path.join(
+        "test_data", "test_input_csv", "flare-out.csv"
+    )
+
+    e = flee.Ecosystem()
+
+    ig = InputGeography.InputGeography()
+    ig.ReadLocationsFromCSV(csv_name=os.path.join("test_data", "test_input_csv/locations.csv"))
+    ig.ReadLinksFromCSV(csv_name=os.path.join("test_data", "test_input_csv/routes.csv"))
+    ig.ReadClosuresFromCSV(csv_name=os.path.join("test_data", "test_input_csv/closures.csv"))
+    e, lm = ig.StoreInputGeographyInEcosystem(e=e)
+
+    d = handle_refugee_data.RefugeeTable(
+        csvformat="generic",
+        data_directory=os.path.join("test_data", "test_input_csv", "refugee_data"),
+        start_date="2010-01-01",
+        data_layout="data_layout.csv",
+    )
+    return e, ig, d
+
+
+def run_days(e, ig, d, start, end):
+    output = []
+    for t in range(start, end):
+        ig.AddNewConflictZones(e=e, time=t)
+        spawning.spawn_daily_displaced(e, t, d)
+        spawning.refresh_spawn_weights(e)
+        e.enact_border_closures(time=t)
+        e.evolve()
+
+        output.append(
+            (
+                [loc.numAgents for loc in e.locations],
+                [link.numAgents for loc in e.locations for link in loc.links],
+                sorted((a.location.name, a.distance_travelled_on_link, a.travelling) for a in e.agents),
+                spawning.get_checkpoint_state(),
+            )
+        )
+    return output
+
+
+def test_checkpoint(tmp_path):
+    for engine in ["objects", "arrays", "cohorts"]:
+        checkpoint_file = str(tmp_path / "{}.chk".format(engine))
+
+        e, ig, d = setup_run(engine)
+        first = run_days(e, ig, d, 0, 10)
+        e.save_checkpoint(checkpoint_file, data_table=d)
+        second = run_days(e, ig, d, 10, 20)
+
+        # Resume in a new ecosystem, after other random numbers were drawn.
+        e2, ig2, _ = setup_run(engine)
+        run_days(e2, ig2, d, 0, 3)
+        d2 = e2.load_checkpoint(checkpoint_file)
+        assert e2.time == e.time - 10
+        assert d2 is not None
+        assert run_days(e2, ig2, d2, 10, 20) == second
+        assert len(first) == 10
+
+
+
+def run_branch(e, scenario, directory, context):
+    ig, d = context
+    if scenario is not None:
+        e.closures = scenario
+    for day in run_days(e, ig, d, e.time, 20):
+        print(day[0], day[1])
+
+
+def test_fork_scenarios(tmp_path):
+    e, ig, d = setup_run("arrays")
+    run_days(e, ig, d, 0, 10)
+
+    scenarios = {"base": None, "late_closure": [["country", "ABC", "DEF", 12, 15]]}
+    outputs = {}
+    for use_fork in [True, False]:
+        directory = str(tmp_path / str(use_fork))
+        completed = e.fork_scenarios(scenarios, run_branch, directory, context=(ig, d), use_fork=use_fork)
+        assert completed == {"base": True, "late_closure": True}
+        for name in scenarios:
+            with open(os.path.join(directory, name, "out.csv")) as f:
+                outputs[(use_fork, name)] = f.read()
+
+    # Forked processes and snapshots give the same branches, which start from the current state.
+    for name in scenarios:
+        assert outputs[(True, name)] == outputs[(False, name)]
+    assert outputs[(True, "base")] != outputs[(True, "late_closure")]
+    assert e.time == 10
+    continued = run_days(e, ig, d, 10, 20)
+    assert outputs[(True, "base")] == "".join("{} {}\n".format(day[0], day[1]) for day in continued)
+
+if __name__ == "__main__":
+    import tempfile
+    import pathlib
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        test_checkpoint(pathlib.Path(tmp_dir))
+        test_fork_scenarios(pathlib.Path(tmp_dir))
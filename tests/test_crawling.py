@@ -71,3 +71,59 @@ def test_location_crawling_4loc():
     assert l1.routes["E"][1][0] == "D"
     assert l1.routes["E"][2].name == "E"
     
+
+
+def test_cached_location_routes():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.move_rules["AwarenessLevel"] = 1
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    l2 = e.addLocation(name="B", movechance=0.3)
+    _ = e.addLocation(name="C", location_type="marker")
+    _ = e.addLocation(name="D", movechance=0.3)
+    _ = e.addLocation(name="E", location_type="camp")
+    _ = e.addLocation(name="F", location_type="camp")
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+    e.linkUp(endpoint1="A", endpoint2="C", distance=50.0)
+    e.linkUp(endpoint1="C", endpoint2="D", distance=60.0)
+    e.linkUp(endpoint1="B", endpoint2="D", distance=100.0)
+    e.linkUp(endpoint1="D", endpoint2="E", distance=100.0)
+    e.linkUp(endpoint1="B", endpoint2="F", distance=300.0)
+
+    # A major route from the location itself, and one from hub B.
+    l1.major_routes = [["B", "D", "E"]]
+    l2.major_routes = [["D", "E"], ["F"]]
+
+    def compare_routes():
+        for loc in e.locations:
+            flee.SimulationSettings.optimisations["CachedFixedRoutes"] = False
+            routes = dict(crawling.generateLocationRoutes(loc, 0))
+            flee.SimulationSettings.optimisations["CachedFixedRoutes"] = True
+            cached = crawling.generateLocationRoutes(loc, 0)
+
+            assert list(cached.keys()) == list(routes.keys())
+            for name in routes:
+                assert cached[name][0] == routes[name][0]
+                assert cached[name][1] == routes[name][1]
+                assert cached[name][2] is routes[name][2]
+
+    for level in [1, 2]:
+        flee.SimulationSettings.move_rules["AwarenessLevel"] = level
+        compare_routes()
+        assert "E" in l1.routes
+
+    # Routes are only reweighted when scores change.
+    cached = l1.location_routes
+    e.add_conflict_zone("D")
+    for loc in e.locations:
+        flee.scoring.updateLocationScore(0, loc)
+    compare_routes()
+    assert l1.location_routes is cached
+
+    # Closing a link makes the affected locations generate their routes again.
+    e.remove_link("C", "D")
+    assert l1.location_routes is None
+    compare_routes()
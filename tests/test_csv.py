@@ -1,4 +1,5 @@
 import os
+import shutil
 import sys
 
 import flee.postprocessing.analysis as a
@@ -173,6 +174,80 @@ def test_csv(end_time=30, last_physical_day=30):
     print("Test successfully completed.")
 
 
+def test_event_schedule():
+
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+
+    e = flee.Ecosystem()
+
+    ig = InputGeography.InputGeography()
+
+    flee.SimulationSettings.ConflictInputFile = os.path.join(
+        "test_data", "test_input_csv", "flare-out.csv"
+    )
+    ig.ReadLocationsFromCSV(csv_name=os.path.join("test_data", "test_input_csv/locations.csv"))
+    ig.ReadLinksFromCSV(csv_name=os.path.join("test_data", "test_input_csv/routes.csv"))
+    ig.ReadClosuresFromCSV(csv_name=os.path.join("test_data", "test_input_csv/closures.csv"))
+    e, lm = ig.StoreInputGeographyInEcosystem(e=e)
+    ig.ReadLocationChangesFromCSV(os.path.join("test_data", "test_input_csv/location_changes.csv"))
+
+    for t in range(0, 101):
+        ig.AddNewConflictZones(e=e, time=t)
+        e.enact_border_closures(time=t)
+
+        # Conflict zones follow the conflicts table, even though only transitions are processed.
+        for name, values in ig.conflicts.items():
+            if t < len(values):
+                assert (lm[name].conflict > 0.0) == (values[t] > 0.000001)
+
+        # The border between ABC and DEF is closed from day 5 to day 8.
+        assert ("D" in lm["C"].links_by_endpoint) == (t < 5 or t >= 8)
+        assert lm["C"].idpcamp == (t >= 100)
+        e.time += 1
+
+    assert sorted(ig.location_change_schedule) == [100, 500]
+
+
+
+def test_compiled_geography(tmp_path):
+
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+
+    flee.SimulationSettings.ConflictInputFile = os.path.join(
+        "test_data", "test_input_csv", "flare-out.csv"
+    )
+    input_dir = tmp_path / "input"
+    input_dir.mkdir()
+    for name in ["locations.csv", "routes.csv", "major_routes.csv", "closures.csv"]:
+        shutil.copy(os.path.join("test_data", "test_input_csv", name), str(input_dir / name))
+    cache_file = str(tmp_path / "geography.npz")
+
+    ig = InputGeography.InputGeography()
+    assert not ig.LoadCompiledGeography(cache_file)
+    ig.ReadLocationsFromCSV(csv_name=str(input_dir / "locations.csv"))
+    ig.ReadLinksFromCSV(csv_name=str(input_dir / "routes.csv"))
+    ig.ReadClosuresFromCSV(csv_name=str(input_dir / "closures.csv"))
+    ig.SaveCompiledGeography(cache_file)
+    assert os.path.isfile(cache_file)
+
+    ig2 = InputGeography.InputGeography()
+    assert ig2.LoadCompiledGeography(cache_file)
+    for table in ["locations", "links", "major_routes", "closures", "conflicts"]:
+        assert getattr(ig2, table) == getattr(ig, table)
+
+    e, lm = ig.StoreInputGeographyInEcosystem(e=flee.Ecosystem())
+    e2, lm2 = ig2.StoreInputGeographyInEcosystem(e=flee.Ecosystem())
+    assert [l.name for l in e2.locations] == [l.name for l in e.locations]
+    for name in lm:
+        assert lm2[name].major_routes == lm[name].major_routes
+    assert lm["B"].major_routes == [["C2", "D", "E", "F"], ["C2", "C"]]
+    assert lm["F"].major_routes == [["E", "D", "C2", "B"], ["E", "D", "C2", "C"]]
+
+    # A changed input file makes the compiled geography out of date.
+    with open(str(input_dir / "closures.csv"), "a") as f:
+        f.write("\n")
+    assert not InputGeography.InputGeography().LoadCompiledGeography(cache_file)
+
 if __name__ == "__main__":
     end_time = 50
     last_physical_day = 50
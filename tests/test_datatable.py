@@ -46,5 +46,51 @@ def test_datatable():
     print("SUCCESS")
 
 
+def test_dense_datatable():
+    d = handle_refugee_data.RefugeeTable(
+        csvformat="generic",
+        data_directory="test_data",
+        start_date="2010-06-01",
+        data_layout="data_layout.csv",
+    )
+    d.correctLevel1Registrations(name="Total", date="2014-01-01")
+    # An unsorted table is handled as by the scans.
+    d.data_table[1] = d.data_table[1][[2, 0, 4, 1, 3]]
+    d._materialize()
+
+    def lookups():
+        days = range(d.first_day - 10, d.first_day + d.num_days + 10)
+        return (
+            [d.get_field(name=name, day=day) for name in d.header for day in days],
+            [d.get_field(name=name, day=day, FullInterpolation=False) for name in d.header for day in days],
+            [d.get_daily_difference(day=day, FullInterpolation=f) for f in [True, False] for day in days],
+        )
+
+    dense = lookups()
+    # Values from the precomputed tables are identical to those from scanning the tables.
+    d.dense_columns = None
+    assert dense == lookups()
+
+
+def test_datatable_cache(tmp_path):
+    tables = []
+    for cache_directory in ["", str(tmp_path), str(tmp_path)]:
+        d = handle_refugee_data.RefugeeTable(
+            csvformat="generic",
+            data_directory="test_data",
+            start_date="2010-06-01",
+            data_layout="data_layout.csv",
+            cache_directory=cache_directory,
+        )
+        tables.append(d.data_table)
+
+    # One cache file per CSV file, which gives the same tables as the CSV files.
+    assert len(list(tmp_path.glob("*.npz"))) == 2
+    for cached in tables[1:]:
+        for a, b in zip(tables[0], cached):
+            assert a.shape == b.shape and (a == b).all()
+
+
 if __name__ == "__main__":
     test_datatable()
+    test_dense_datatable()
@@ -1,4 +1,4 @@
-from flee import flee
+from flee import flee, moving
 from flee.datamanager import handle_refugee_data
 
 
@@ -158,6 +158,47 @@ def test_prune_routes2():
     assert routes[0] == "D"
 
 
+def test_route_cache():
+    """
+    Check that cached route distributions match uncached ones.
+    """
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.move_rules["ChildrenAvoidHazards"] = True
+
+    e = flee.Ecosystem()
+
+    # The cache is opt-in.
+    assert e.route_cache is None
+
+    l1 = e.addLocation(name="A", movechance=1.0)
+    _ = e.addLocation(name="B", movechance=0.3)
+    _ = e.addLocation(name="C", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=100.0)
+    e.linkUp(endpoint1="A", endpoint2="C", distance=200.0)
+
+    for i in range(0, 10):
+        e.addAgent(location=l1, attributes={"age": 10 + 5 * i})
+
+    cache = moving.RouteCache()
+
+    for a in e.agents:
+        route = moving.selectRoute(a, time=0, cache=cache)
+        routes, weights, _ = cache.entries[(a.location, moving.getRouteSignature(a))]
+        uncached_weights, uncached_routes = moving.getRouteDistribution(a, time=0)
+        assert route in routes
+        assert routes == uncached_routes
+        assert weights == moving.normalizeWeights(uncached_weights)
+
+    # One miss per age class (children and adults), hits for the rest.
+    assert cache.misses == 2
+    assert cache.hits == 8
+
+    cache.clear()
+    moving.selectRoute(e.agents[0], time=1, cache=cache)
+    assert cache.misses == 3
+
+
 
 
 if __name__ == "__main__":
@@ -165,5 +206,6 @@ if __name__ == "__main__":
     test_scoring_foreign_weight()
     test_prune_routes()
     test_prune_routes2()
+    test_route_cache()
     pass
     
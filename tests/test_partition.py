@@ -0,0 +1,61 @@
+import numpy as np
+from flee import flee, partition
+
+"""
+Checks the location partitioner used by the loc-owned parallel mode of pflee.
+"""
+
+
+def grid_ecosystem(width, height):
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+
+    e = flee.Ecosystem()
+
+    for y in range(height):
+        for x in range(width):
+            e.addLocation(name="L{}_{}".format(x, y), movechance=0.3)
+
+    for y in range(height):
+        for x in range(width):
+            if x > 0:
+                e.linkUp(endpoint1="L{}_{}".format(x - 1, y), endpoint2="L{}_{}".format(x, y), distance=10.0)
+            if y > 0:
+                e.linkUp(endpoint1="L{}_{}".format(x, y - 1), endpoint2="L{}_{}".format(x, y), distance=10.0)
+
+    return e
+
+
+def test_partition_grid():
+    e = grid_ecosystem(20, 20)
+
+    for parts in [2, 3, 4]:
+        owner = partition.partition_locations(e.locations, parts)
+
+        sizes = np.bincount(owner, minlength=parts)
+        assert len(sizes) == parts
+        assert np.max(sizes) <= partition.max_part_imbalance * len(e.locations) / parts + 1
+
+        # A straight cut through the grid cuts 20 links in both directions.
+        cut = partition.count_cut_links(e.locations, owner)
+        assert cut <= 2 * 40 * (parts - 1)
+
+        # The division only depends on the graph.
+        assert np.array_equal(owner, partition.partition_locations(e.locations, parts))
+
+
+def test_partition_weights():
+    e = grid_ecosystem(10, 10)
+
+    weights = np.ones(len(e.locations))
+    weights[:10] = 50.0
+
+    owner = partition.partition_locations(e.locations, 2, weights)
+    part_weights = np.bincount(owner, weights=weights, minlength=2)
+    assert np.max(part_weights) <= partition.max_part_imbalance * np.sum(weights) / 2 + 50.0
+
+    assert np.all(partition.partition_locations(e.locations, 1) == 0)
+
+
+if __name__ == "__main__":
+    test_partition_grid()
+    test_partition_weights()
@@ -30,5 +30,35 @@ def test_removelink():
     print("Test successful!")
 
 
+def test_link_index_after_closures():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", movechance=0.3)
+    l2 = e.addLocation(name="B", movechance=0.0)
+    _ = e.addLocation(name="C", movechance=0.0)
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=834.0)
+    e.linkUp(endpoint1="A", endpoint2="C", distance=1368.0)
+
+    assert e.locationIndex == {"A": 0, "B": 1, "C": 2}
+    assert l1.getLink("B") is l1.links[0]
+    assert l2.getLink("A").endpoint is l1
+
+    assert e.close_link(startpoint="A", endpoint="B", twoway=False)
+    assert l1.getLink("B") is None
+    assert l1.getLink("C") is not None
+    assert l2.getLink("A") is not None
+
+    assert e.reopen_link(startpoint="A", endpoint="B", twoway=False)
+    assert l1.getLink("B") in l1.links
+
+    assert e.remove_link(startpoint="A", endpoint="C", twoway=False)
+    assert l1.getLink("C") is None
+    assert set(l1.links_by_endpoint.keys()) == {"B"}
+
+
 if __name__ == "__main__":
     test_removelink()
+    test_link_index_after_closures()
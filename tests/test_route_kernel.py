@@ -0,0 +1,157 @@
+import random
+
+import numpy as np
+from flee import crawling, flee, moving
+
+"""
+Checks that the vectorized route kernel and the bounded k-best route search
+give the same route distributions as the recursive calculateLinkWeight implementation.
+"""
+
+
+def build_ecosystem(level):
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.move_rules["AwarenessLevel"] = level
+
+    e = flee.Ecosystem()
+
+    l1 = e.addLocation(name="A", x=0.0, y=0.0, movechance=1.0, pop=5000)
+    _ = e.addLocation(name="B", x=1.0, y=0.5, movechance=0.3, pop=0)
+    _ = e.addLocation(name="C", x=0.5, y=1.0, location_type="marker")
+    _ = e.addLocation(name="D", x=2.0, y=1.0, location_type="conflict_zone", pop=100)
+    l5 = e.addLocation(name="E", x=3.0, y=2.0, location_type="camp", capacity=100)
+    _ = e.addLocation(name="F", x=2.5, y=3.0, location_type="camp")
+
+    e.linkUp(endpoint1="A", endpoint2="B", distance=120.0)
+    e.linkUp(endpoint1="A", endpoint2="C", distance=80.0)
+    e.linkUp(endpoint1="B", endpoint2="D", distance=150.0)
+    e.linkUp(endpoint1="C", endpoint2="D", distance=90.0)
+    e.linkUp(endpoint1="D", endpoint2="E", distance=200.0)
+    e.linkUp(endpoint1="B", endpoint2="F", distance=310.0)
+    e.linkUp(endpoint1="E", endpoint2="F", distance=60.0)
+
+    # Camp E is nearly full, so its capacity multiplier is between 0 and 1.
+    for _ in range(0, 95):
+        e.addAgent(location=l5, attributes={"age": 30, "gender": "female"})
+    e.addAgent(location=l1, attributes={"age": 16, "gender": "male"})
+    e.addAgent(location=l1, attributes={"age": 8, "gender": "female"})
+
+    return e
+
+
+def route_distribution(a, kernel):
+    flee.SimulationSettings.optimisations["RouteKernel"] = kernel
+    return moving.getRouteDistribution(a, time=0)
+
+
+def test_route_kernel_equivalence():
+    rules = [
+        {},
+        {"ChildrenAvoidHazards": True},
+        {"ChildrenAvoidHazards": True, "BoysTakeRisk": True},
+        {"StayCloseToHome": True},
+        {"UsePopForLocWeight": True},
+        {"PruningThreshold": 4.0},
+    ]
+
+    for level in range(1, 4):
+        for rule in rules:
+            e = build_ecosystem(level)
+            flee.SimulationSettings.move_rules.update(rule)
+
+            for a in e.agents[-2:]:
+                w_vec, r_vec = route_distribution(a, "vectorized")
+                w_rec, r_rec = route_distribution(a, "recursive")
+
+                assert r_vec == r_rec
+                assert np.allclose(w_vec, w_rec, rtol=1e-12, atol=0.0)
+
+                # Sampled route frequencies agree as well.
+                for kernel in ["vectorized", "recursive"]:
+                    flee.SimulationSettings.optimisations["RouteKernel"] = kernel
+                    random.seed(7)
+                    counts = {}
+                    for _ in range(0, 1000):
+                        route = tuple(moving.selectRoute(a, time=0))
+                        counts[route] = counts.get(route, 0) + 1
+                    if kernel == "vectorized":
+                        counts_vec = counts
+
+                expected = moving.normalizeWeights(w_rec)
+                for route, p in zip(r_rec, expected):
+                    assert abs(counts_vec.get(tuple(route), 0) / 1000.0 - p) < 0.06
+                    assert abs(counts.get(tuple(route), 0) / 1000.0 - p) < 0.06
+
+
+def test_max_routes_per_origin():
+    for level in range(1, 4):
+        for k in [1, 2, 3, 5, 100]:
+            e = build_ecosystem(level)
+
+            for a in e.agents[-2:]:
+                w_all, r_all = route_distribution(a, "recursive")
+
+                flee.SimulationSettings.move_rules["MaxRoutesPerOrigin"] = k
+                w_best, r_best = moving.getRouteDistribution(a, time=0)
+                flee.SimulationSettings.move_rules["MaxRoutesPerOrigin"] = 0
+
+                # The k highest-weighted routes, in their original order.
+                kept = sorted(sorted(range(len(w_all)), key=lambda i: -w_all[i])[:k])
+                assert r_best == [r_all[i] for i in kept]
+                assert np.allclose(w_best, [w_all[i] for i in kept], rtol=1e-12, atol=0.0)
+
+            # Location-generated routes keep the best route to the k best destinations.
+            routes = crawling.generateLocationRoutes(e.locations[0], time=0)
+            flee.SimulationSettings.move_rules["MaxRoutesPerOrigin"] = k
+            best_routes = crawling.generateLocationRoutes(e.locations[0], time=0)
+            flee.SimulationSettings.move_rules["MaxRoutesPerOrigin"] = 0
+
+            names = sorted(routes, key=lambda name: -routes[name][0])[:k]
+            assert sorted(best_routes) == sorted(names)
+            for name in names:
+                assert best_routes[name][1] == routes[name][1]
+                assert np.isclose(best_routes[name][0], routes[name][0], rtol=1e-12, atol=0.0)
+
+
+def test_flood_forecast_kernel():
+    for level in range(1, 4):
+        e = build_ecosystem(level)
+        rules = flee.SimulationSettings.move_rules
+        rules["FloodRulesEnabled"] = True
+        rules["FloodForecaster"] = True
+        rules["FloodLocWeights"] = [1.0, 0.5, 0.2]
+        rules["FloodMovechances"] = [0.3, 0.6, 0.9]
+        rules["FloodForecasterTimescale"] = 3
+        rules["FloodForecasterEndTime"] = 4
+        rules["FloodForecasterWeights"] = [1.0, 0.9, 0.8, 0.7, 0.6]
+        rules["FloodAwarenessWeights"] = [0.0, 0.5, 1.0]
+
+        for i, loc in enumerate(e.locations):
+            loc.attributes["flood_level"] = i % 3
+            loc.attributes["forecast_flood_levels"] = [(i + t) % 3 for t in range(0, 5)]
+        for i, a in enumerate(e.agents):
+            a.attributes["floodawareness"] = i % 3
+
+        for time in [0, 2, 5]:
+            e.time = time
+            for loc in e.locations:
+                loc.flood_forecast = None
+            expected = [moving.calculateMoveChance(a, False, time) for a in e.agents[-2:]]
+
+            # Forecasts calculated once per time step give the same move chances.
+            e._update_flood_forecasts()
+            assert e.locations[0].flood_forecast[0] == time
+            assert expected == [moving.calculateMoveChance(a, False, time) for a in e.agents[-2:]]
+
+            for a in e.agents[-2:]:
+                w_vec, r_vec = route_distribution(a, "vectorized")
+                w_rec, r_rec = route_distribution(a, "recursive")
+
+                assert r_vec == r_rec
+                assert np.allclose(w_vec, w_rec, rtol=1e-12, atol=0.0)
+
+
+if __name__ == "__main__":
+    test_route_kernel_equivalence()
+    test_max_routes_per_origin()
+    test_flood_forecast_kernel()
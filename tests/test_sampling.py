@@ -0,0 +1,38 @@
+import random
+
+import numpy as np
+from flee.sampling import AliasTable
+
+"""
+Checks that alias tables draw outcomes with the frequencies of their weights.
+"""
+
+
+def test_alias_table():
+    random.seed(3)
+    np.random.seed(3)
+
+    weights = [1.0, 0.0, 3.0, 6.0]
+    table = AliasTable(weights)
+
+    counts = np.bincount([table.draw() for _ in range(20000)], minlength=4)
+    assert counts[1] == 0
+    assert np.allclose(counts / 20000.0, [0.1, 0.0, 0.3, 0.6], atol=0.02)
+
+    counts = np.bincount(table.draw_many(20000), minlength=4)
+    assert counts[1] == 0
+    assert np.allclose(counts / 20000.0, [0.1, 0.0, 0.3, 0.6], atol=0.02)
+
+
+def test_alias_table_zero_weights():
+    np.random.seed(3)
+
+    # All-zero weights give equal weighting, as in moving.normalizeWeights.
+    table = AliasTable([0.0, 0.0, 0.0])
+    counts = np.bincount(table.draw_many(30000), minlength=3)
+    assert np.allclose(counts / 30000.0, [1.0 / 3.0] * 3, atol=0.02)
+
+
+if __name__ == "__main__":
+    test_alias_table()
+    test_alias_table_zero_weights()
@@ -23,3 +23,74 @@ def test_get_attribute_ratio():
 
     assert spawning.getAttributeRatio(l1, "british") == 0.02
 
+
+
+def test_draw_samples_batch(tmp_path, monkeypatch):
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+
+    e = flee.Ecosystem()
+    l1 = e.addLocation(name="A", movechance=1.0)
+    l2 = e.addLocation(name="B", movechance=1.0)
+
+    (tmp_path / "input_csv").mkdir()
+    (tmp_path / "input_csv" / "demographics_age.csv").write_text(
+        "age,Default,A\n10,0.5,0.0\n20,0.5,0.2\n30,0.0,0.8\n"
+    )
+    monkeypatch.chdir(tmp_path)
+
+    try:
+        spawning.read_demographics(e)
+
+        samples = spawning.draw_samples_batch(e, l1, 10000)
+        assert len(samples) == 10000
+        ages = [s["age"] for s in samples]
+        assert ages.count(10) == 0
+        assert abs(ages.count(30) / 10000.0 - 0.8) < 0.02
+
+        # Locations without a column of their own use the Default weights.
+        ages = [s["age"] for s in spawning.draw_samples_batch(e, l2, 10000)]
+        assert ages.count(30) == 0
+        assert abs(ages.count(10) / 10000.0 - 0.5) < 0.02
+
+        assert spawning.draw_samples(e, l1)["age"] in [20, 30]
+    finally:
+        spawning.__demographics.clear()
+        spawning.__demographic_tables.clear()
+
+
+def test_refresh_spawn_weights():
+    flee.SimulationSettings.ReadFromYML("empty.yml")
+    flee.SimulationSettings.spawn_rules["conflict_spawn_decay"] = [1.0, 0.5, 0.25]
+    flee.SimulationSettings.spawn_rules["conflict_spawn_decay_interval"] = 2
+
+    def expected_weights(e):
+        weights = []
+        for loc in e.locations:
+            w = 0.0
+            if loc.conflict > 0.0:
+                w = loc.pop * loc.conflict * flee.SimulationSettings.get_location_conflict_decay(e.time, loc)
+            weights.append(w)
+        return weights
+
+    e = flee.Ecosystem()
+    # More locations than the initial capacity of the location store.
+    for i in range(0, 150):
+        e.addLocation(name="L{}".format(i), movechance=0.3, pop=100 * i)
+    for i in range(0, 150, 3):
+        e.add_conflict_zone(name="L{}".format(i), conflict_intensity=0.5 + (i % 4) / 4.0)
+    assert list(e.spawn_weights) == expected_weights(e)
+
+    # Weights follow changes of the time, the population and the conflicts.
+    e.time = 5
+    e.locations[3].pop = 50
+    e.remove_conflict_zone(name="L6")
+    e.add_conflict_zone(name="L7")
+    spawning.refresh_spawn_weights(e)
+    assert list(e.spawn_weights) == expected_weights(e)
+    assert e.spawn_weights[3] == 50 * e.locations[3].conflict * 0.25
+
+    # Locations added later get their weight, while the others are left unchanged.
+    loc = e.addLocation(name="new", location_type="conflict_zone", pop=1000)
+    assert len(e.spawn_weights) == 151
+    assert e.spawn_weights[-1] == 1000 * loc.conflict * 0.25
+    assert list(e.spawn_weights) == expected_weights(e)
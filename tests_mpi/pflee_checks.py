@@ -0,0 +1,145 @@
+import random
+import sys
+import traceback
+
+import numpy as np
+from flee import pflee
+from flee.SimulationSettings import SimulationSettings
+from mpi4py import MPI
+
+"""
+Checks of the pflee agent migration between ranks, run with mpirun by test_pflee.py:
+
+    mpirun -np 2 python3 pflee_checks.py <check> <agent engine>
+"""
+
+
+def chain_ecosystem(engine, parallel_mode="loc-par", number=40):
+    SimulationSettings.ReadFromYML("empty.yml")
+    SimulationSettings.optimisations["AgentEngine"] = engine
+
+    e = pflee.Ecosystem()
+    e.parallel_mode = parallel_mode
+
+    for i in range(number):
+        location_type = "camp" if i % 10 == 9 else "town"
+        e.addLocation(name="L{}".format(i), location_type=location_type, movechance=1.0 if i % 10 == 0 else 0.3, pop=100)
+    for i in range(1, number):
+        e.linkUp(endpoint1="L{}".format(i - 1), endpoint2="L{}".format(i), distance=float(50 + 37 * i % 200))
+
+    random.seed(3 + e.mpi.rank)
+    np.random.seed(3 + e.mpi.rank)
+
+    for i in range(0, number, 10):
+        e.addAgents(e.locations[i], 500)
+    e.updateNumAgents(log=False)
+
+    return e
+
+
+def all_places(e):
+    places = list(e.locations)
+    for loc in e.locations:
+        places += loc.links + loc.closed_links
+    return places
+
+
+def check_counts(e, expected_total):
+    """
+    Checks that the per-rank counts of locations and links match the agents on the
+    rank, and that the counts of all ranks add up to the expected total. Agents
+    deactivated in camps no longer have a location, but still count towards the camp.
+    """
+    places = all_places(e)
+
+    tally = {}
+    for a in e.agents:
+        if a.location is not None:
+            tally[id(a.location)] = tally.get(id(a.location), 0) + 1
+    for p in places:
+        if getattr(p, "camp", False):
+            assert tally.get(id(p), 0) <= p.numAgentsOnRank
+        else:
+            assert tally.get(id(p), 0) == p.numAgentsOnRank
+
+    on_rank = np.array([p.numAgentsOnRank for p in places], dtype="i")
+    total = np.zeros_like(on_rank)
+    MPI.COMM_WORLD.Allreduce([on_rank, MPI.INT], [total, MPI.INT], op=MPI.SUM)
+    assert int(np.sum(total)) == expected_total
+    assert e.total_agents == expected_total
+
+    return total
+
+
+def check_migration(engine):
+    """
+    Migrates agents while agents are still on links that were just closed.
+    """
+    e = chain_ecosystem(engine)
+
+    for t in range(6):
+        if t == 2:
+            for i in range(1, len(e.locations), 3):
+                e.close_link(e.locations[i - 1].name, e.locations[i].name)
+        if t == 3:
+            e.balance_agents(force=True)
+        e.evolve()
+
+    e.balance_agents(force=True)
+    e.evolve()
+
+    check_counts(e, 2000)
+
+
+def check_owned(engine):
+    """
+    Runs the loc-owned mode with link closures, deactivation in camps and
+    repartitioning, and checks that agents and counts stay with the owners of
+    their places, and that the counts of the halo match a global reduction.
+    """
+    e = chain_ecosystem(engine, parallel_mode="loc-owned")
+    SimulationSettings.spawn_rules["camps_are_sinks"] = True
+    for loc in e.locations:
+        if loc.camp:
+            loc.attributes["deactivation_probability"] = 0.2
+
+    for t in range(8):
+        if t == 2:
+            for i in range(1, len(e.locations), 3):
+                e.close_link(e.locations[i - 1].name, e.locations[i].name)
+        if t == 4:
+            e.balance_agents(force=True)
+        e.evolve()
+
+    total = check_counts(e, 2000)
+
+    rank = e.mpi.rank
+    places = all_places(e)
+    for a in e.agents:
+        assert a.location is None or e._place_owner(a.location) == rank
+    for p in places:
+        if e._place_owner(p) != rank:
+            assert p.numAgentsOnRank == 0
+
+    owned = e.location_owner == rank
+    visible = owned | e._halo_locations(owned)
+    for k, p in enumerate(places):
+        if isinstance(p, pflee.Location):
+            if visible[p.id] or rank == 0:
+                assert p.numAgents == total[k]
+        elif p in p.startpoint.links and visible[p.startpoint.id]:
+            assert p.numAgents == total[k]
+
+
+if __name__ == "__main__":
+    checks = {"migration": check_migration, "owned": check_owned}
+    try:
+        checks[sys.argv[1]](sys.argv[2])
+    except BaseException:
+        # Stop all ranks, instead of leaving the others waiting in a collective.
+        traceback.print_exc()
+        sys.stdout.flush()
+        MPI.COMM_WORLD.Abort(1)
+    MPI.COMM_WORLD.Barrier()
+    if MPI.COMM_WORLD.Get_rank() == 0:
+        print("OK")
@@ -0,0 +1,33 @@
+import os
+import subprocess
+
+import pytest
+
+"""
+Runs the checks of pflee_checks.py on 2 MPI ranks.
+"""
+
+checks_dir = os.path.dirname(os.path.abspath(__file__))
+engines = ["objects", "arrays", "cohorts"]
+
+
+def run_check(check, engine, cores=2):
+    cmd = ["mpirun", "-np", str(cores), "python3", os.path.join(checks_dir, "pflee_checks.py"), check, engine]
+    proc = subprocess.run(cmd, cwd=checks_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=300)
+    stdout = proc.stdout.decode("utf-8")
+    if proc.returncode != 0:
+        raise RuntimeError(
+            "\njob execution encountered an error (return code {}) "
+            "while executing \ncmd = {}\nstdout = {}".format(proc.returncode, " ".join(cmd), stdout)
+        )
+    return stdout
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_migration_after_link_closure(engine):
+    assert "OK" in run_check("migration", engine)
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_location_owned_mode(engine):
+    assert "OK" in run_check("owned", engine)